@@ -0,0 +1,295 @@
+'''Bayesian optimisation of the capacity over feedback-loop parameters. A Gaussian process with a Matern 5/2 kernel
+on the log-parameter box is the surrogate, and each round proposes a batch of points by expected improvement with the
+constant-liar heuristic, so that a worker pool evaluates them together through GridExecutor. Every evaluated point is
+stored in a directory cache keyed by a hash of its parameter values, under a directory per model variant and set of
+ligand samples; a new session loads that cache first and never solves a cached point again.'''
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+from scipy.linalg import cho_factor, cho_solve
+from scipy.optimize import minimize
+from scipy.stats import norm, qmc
+
+from grid_executor import GridExecutor, parameter_bounds, parse_bounds
+from ligand_sampler import SAMPLING_METHODS
+from network_cache import network_key, write_atomically
+from step_sweep import VARIANTS
+
+# Searched by default where the network has them; the k_8_* and k_9_* loops only exist in some variants
+SEARCH_PARAMETERS = ('k_neg_fb', 'k_lcki', 'k_8_1', 'k_8_2', 'k_9_1', 'k_9_2', 'k_9_3')
+
+
+def matern52(x1, x2, length_scales):
+    d = np.sqrt(np.sum(((x1[:, None, :] - x2[None, :, :]) / length_scales) ** 2, axis=-1))
+    return (1 + np.sqrt(5) * d + 5.0 / 3.0 * d ** 2) * np.exp(-np.sqrt(5) * d)
+
+
+class GaussianProcess(object):
+    def __init__(self, x, y, theta=None, num_restarts=5, seed=None):
+        '''x in the unit box with shape (n, d); y is standardised internally. theta holds the log length scales, log
+        signal variance and log noise variance; it is fitted by maximising the marginal likelihood when not given.'''
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.mean = np.mean(self.y)
+        self.scale = np.std(self.y) if np.std(self.y) > 0 else 1.0
+        self.z = (self.y - self.mean) / self.scale
+
+        self.theta = self.fit(num_restarts, seed) if theta is None else np.asarray(theta)
+        self.factor = cho_factor(self.covariance(self.theta))
+        self.alpha = cho_solve(self.factor, self.z)
+
+    def covariance(self, theta):
+        d = self.x.shape[1]
+        length_scales, variance, noise = np.exp(theta[:d]), np.exp(theta[d]), np.exp(theta[d + 1])
+        return variance * matern52(self.x, self.x, length_scales) + (noise + 1e-10) * np.eye(len(self.x))
+
+    def negative_log_likelihood(self, theta):
+        try:
+            factor = cho_factor(self.covariance(theta))
+        except np.linalg.LinAlgError:
+            return np.inf
+        return 0.5 * np.dot(self.z, cho_solve(factor, self.z)) + np.sum(np.log(np.diag(factor[0])))
+
+    def fit(self, num_restarts, seed):
+        d = self.x.shape[1]
+        bounds = [(np.log(1e-2), np.log(10.0))] * d + [(np.log(1e-2), np.log(1e2)), (np.log(1e-8), np.log(1.0))]
+        random_state = np.random.RandomState(seed)
+        best = None
+        for restart in range(num_restarts):
+            theta0 = np.array([random_state.uniform(low, high) for low, high in bounds])
+            if restart == 0:
+                theta0[:d], theta0[d], theta0[d + 1] = np.log(0.3), 0.0, np.log(1e-2)
+            result = minimize(self.negative_log_likelihood, theta0, method='L-BFGS-B', bounds=bounds)
+            if best is None or result.fun < best.fun:
+                best = result
+        return best.x
+
+    def predict(self, x):
+        '''Posterior mean and standard deviation at the rows of x.'''
+        d = self.x.shape[1]
+        length_scales, variance = np.exp(self.theta[:d]), np.exp(self.theta[d])
+        k = variance * matern52(np.atleast_2d(x), self.x, length_scales)
+        mean = np.dot(k, self.alpha)
+        var = variance - np.sum(k * cho_solve(self.factor, k.T).T, axis=1)
+        return self.mean + self.scale * mean, self.scale * np.sqrt(np.maximum(var, 1e-12))
+
+    def condition(self, x, y):
+        '''The process with the observations (x, y) added and the same hyperparameters.'''
+        return GaussianProcess(np.vstack([self.x, x]), np.append(self.y, y), theta=self.theta)
+
+
+def expected_improvement(gp, x, best, xi=0.01):
+    mean, std = gp.predict(x)
+    z = (mean - best - xi) / std
+    return (mean - best - xi) * norm.cdf(z) + std * norm.pdf(z)
+
+
+def propose(gp, best, num_points, num_candidates=2048, num_polish=5, seed=None):
+    '''num_points rows of the unit box that maximise the expected improvement in turn, each added to the process
+    at its predicted mean (constant liar) before the next is chosen.'''
+    d = gp.x.shape[1]
+    candidates = qmc.Sobol(d=d, seed=seed).random(num_candidates)
+    proposals = []
+    for k in range(num_points):
+        ei = expected_improvement(gp, candidates, best)
+        x_best, ei_best = candidates[np.argmax(ei)], np.max(ei)
+        for start in candidates[np.argsort(-ei)[:num_polish]]:
+            result = minimize(lambda x: -expected_improvement(gp, x[None, :], best)[0], start, method='L-BFGS-B',
+                              bounds=[(0.0, 1.0)] * d)
+            if -result.fun > ei_best:
+                x_best, ei_best = result.x, -result.fun
+        proposals.append(x_best)
+        gp = gp.condition(x_best[None, :], gp.predict(x_best[None, :])[0])
+    return np.array(proposals)
+
+
+class ResultCache(object):
+    def __init__(self, directory, context):
+        '''Entries live in directory/<hash of context>/<hash of parameter values>.json; context is everything
+        besides the parameter values that determines a result (model, network, ligand samples, solve options) and
+        must be JSON serialisable.'''
+        self.directory = os.path.join(directory, hashlib.sha256(repr(sorted(context.items())).encode()).hexdigest())
+        self.context = context
+
+    def path(self, point):
+        key = repr(sorted((name, float("{0:.12e}".format(value))) for name, value in point.items()))
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest() + ".json")
+
+    def get(self, point):
+        path = self.path(point)
+        if os.path.exists(path):
+            with open(path) as f:
+                return json.load(f)
+        return None
+
+    def put(self, point, result):
+        write_atomically(self.path(point), json.dumps(dict(result, parameters=point, context=self.context)),
+                         mode="w")
+
+    def entries(self):
+        for path in sorted(glob.glob(os.path.join(self.directory, "*.json"))):
+            with open(path) as f:
+                yield json.load(f)
+
+
+class BayesianSearch(object):
+    def __init__(self, executor, parameters=None, bounds=None, decades=1.0, cache_directory="bo_cache", seed=None,
+                 options=None):
+        '''parameters are network parameter names or their aliases (PARAMETER_ALIASES), by default those of
+        SEARCH_PARAMETERS the network has; bounds maps them to (low, high), by default decades either side of the
+        network's value. options are passed to solve_samples and are part of the cache context.'''
+        self.executor = executor
+        if parameters is None:
+            parameters = [name for name in SEARCH_PARAMETERS if executor.targets(name, required=False)]
+        self.parameters = list(parameters)
+        self.targets = [executor.targets(name) for name in self.parameters]
+        self.seed = executor.seed if seed is None else seed
+        self.log_bounds = np.log(np.array(parameter_bounds(self.parameters, self.targets, executor.defaults, bounds,
+                                                           decades), dtype=float))
+
+        self.options = options or {}
+        context = dict(model=executor.model_class.__name__, steps=executor.steps, lf=executor.lf,
+                       network=network_key(executor.tcr), seed=executor.seed, sampling=executor.sampling,
+                       num_samples=len(executor.p_ligand), mu=executor.mu, sigma=executor.sigma,
+                       options=dict((name, np.asarray(value).tolist() if isinstance(value, np.ndarray) else value)
+                                    for name, value in sorted(self.options.items())))
+        self.cache = ResultCache(cache_directory, context)
+
+        self.x = np.zeros((0, len(self.parameters)))
+        self.results = []
+        self.load()
+
+    def to_unit(self, log_values):
+        return (log_values - self.log_bounds[:, 0]) / (self.log_bounds[:, 1] - self.log_bounds[:, 0])
+
+    def from_unit(self, u):
+        return self.log_bounds[:, 0] + u * (self.log_bounds[:, 1] - self.log_bounds[:, 0])
+
+    def point(self, log_values):
+        point = {}
+        for targets, value in zip(self.targets, np.exp(log_values)):
+            point.update((target, float(value)) for target in targets)
+        return point
+
+    def load(self):
+        '''Observations from every cached point of this search's parameters inside its bounds.'''
+        names = sorted(target for targets in self.targets for target in targets)
+        for entry in self.cache.entries():
+            if sorted(entry['parameters']) != names:
+                continue
+            log_values = np.log([entry['parameters'][targets[0]] for targets in self.targets])
+            u = self.to_unit(log_values)
+            if np.all((u >= -1e-9) & (u <= 1 + 1e-9)):
+                self.add(u, entry)
+        if self.results:
+            print("Loaded {0} cached points".format(len(self.results)))
+
+    def add(self, u, result):
+        self.x = np.vstack([self.x, u])
+        self.results.append(result)
+
+    def evaluate(self, u):
+        '''Capacities of the rows of u, from the cache where possible and from one GridExecutor batch otherwise.'''
+        points = [self.point(self.from_unit(row)) for row in u]
+        cached = [self.cache.get(point) for point in points]
+        missing = [k for k, result in enumerate(cached) if result is None]
+        if missing:
+            capacity, self_output, foreign_output = self.executor.evaluate([points[k] for k in missing],
+                                                                           **self.options)
+            weights = self.executor.weights
+            for j, k in enumerate(missing):
+                cached[k] = dict(capacity=float(capacity[j]),
+                                 mean_self_output=float(np.average(self_output[j], weights=weights)),
+                                 mean_foreign_output=float(np.average(foreign_output[j], weights=weights)))
+                self.cache.put(points[k], cached[k])
+
+        for row, point, result in zip(u, points, cached):
+            self.add(row, result)
+            print("{0}: {1:f}".format(", ".join("{0} = {1:.3e}".format(name, point[targets[0]])
+                                                for name, targets in zip(self.parameters, self.targets)),
+                                      result['capacity']))
+
+    def capacity(self):
+        return np.array([result['capacity'] for result in self.results])
+
+    def run(self, num_iterations=20, batch_size=4, num_initial=None):
+        '''Fills a Latin hypercube of num_initial points (default 2 * (d + 1)) short of the cached ones, then runs
+        num_iterations rounds of batch_size proposals.'''
+        d = len(self.parameters)
+        num_initial = 2 * (d + 1) if num_initial is None else num_initial
+        if len(self.results) < num_initial:
+            self.evaluate(qmc.LatinHypercube(d=d, seed=self.seed).random(num_initial - len(self.results)))
+
+        for iteration in range(num_iterations):
+            y = self.capacity()
+            gp = GaussianProcess(self.x, y, seed=self.seed + iteration)
+            self.evaluate(propose(gp, np.max(y), batch_size, seed=self.seed + iteration))
+            print("Round {0}: best capacity {1:f}".format(iteration + 1, np.max(self.capacity())))
+
+        return self.best()
+
+    def best(self):
+        k = int(np.argmax(self.capacity()))
+        return self.point(self.from_unit(self.x[k])), self.results[k]
+
+    def write_results(self, file_name="bayesian_search"):
+        with open(file_name, "w") as f:
+            f.write("{0} capacity mean_self_output mean_foreign_output\n".format(" ".join(self.parameters)))
+            for u, result in zip(self.x, self.results):
+                f.write("{0} {1:f} {2:f} {3:f}\n".format(
+                    " ".join("{0:e}".format(value) for value in np.exp(self.from_unit(u))), result['capacity'],
+                    result['mean_self_output'], result['mean_foreign_output']))
+
+        point, result = self.best()
+        with open("best_parameters", "w") as f:
+            for name, targets in zip(self.parameters, self.targets):
+                f.write("{0} {1:e}\n".format(name, point[targets[0]]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bayesian optimisation of the capacity over feedback parameters",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--model', dest='model', action='store', default='tcr', choices=sorted(VARIANTS),
+                        help='Model variant to optimise.')
+    parser.add_argument('--steps', dest='steps', action='store', type=int, default=8, help='Number of KP steps.')
+    parser.add_argument('--lf', dest='lf', action='store', type=int, default=30, help='Number of foreign ligands.')
+    parser.add_argument('--seed', dest='seed', action='store', type=int, default=0,
+                        help='Seed for the ligand samples and the search; cached points are shared per seed.')
+    parser.add_argument('--num_samples', dest='num_samples', action='store', type=int, default=1000,
+                        help='Number of ligand samples shared by every point.')
+    parser.add_argument('--sampling', dest='sampling', action='store', default='random', choices=SAMPLING_METHODS,
+                        help='Design of the lognormal ligand samples.')
+    parser.add_argument('--parameters', dest='parameters', action='store', nargs='+',
+                        help='Parameters to search, by network name or alias (default: those of {0} the network '
+                             'has).'.format(", ".join(SEARCH_PARAMETERS)))
+    parser.add_argument('--bounds', dest='bounds', action='store', nargs='+', default=[],
+                        help='Bounds as name low high triples (default: a decade either side of each value).')
+    parser.add_argument('--num_initial', dest='num_initial', action='store', type=int,
+                        help='Size of the initial Latin hypercube (default: 2 * (parameters + 1)).')
+    parser.add_argument('--num_iterations', dest='num_iterations', action='store', type=int, default=20,
+                        help='Number of proposal rounds.')
+    parser.add_argument('--batch_size', dest='batch_size', action='store', type=int, default=4,
+                        help='Points proposed and evaluated together in each round.')
+    parser.add_argument('--workers', dest='workers', action='store', type=int, default=4,
+                        help='Number of processes each batch is spread across.')
+    parser.add_argument('--cache', dest='cache', action='store', default='bo_cache',
+                        help='Directory of evaluated points, shared across sessions.')
+    parser.add_argument('--steady_state', dest='steady_state', action='store_true', default=False,
+                        help='Solve for the steady state directly instead of integrating to run_time.')
+
+    args = parser.parse_args()
+
+    executor = GridExecutor(VARIANTS[args.model], steps=args.steps, lf=args.lf, num_samples=args.num_samples,
+                            sampling=args.sampling, seed=args.seed, workers=args.workers)
+    search = BayesianSearch(executor, parameters=args.parameters, bounds=parse_bounds(args.bounds),
+                            cache_directory=args.cache, options=dict(steady_state=args.steady_state))
+    try:
+        search.run(num_iterations=args.num_iterations, batch_size=args.batch_size, num_initial=args.num_initial)
+    finally:
+        executor.close()
+    search.write_results()
@@ -0,0 +1,225 @@
+'''Pseudo-arclength continuation of steady states in one model parameter. The branch is followed in
+(scaled species, log parameter) space with a tangent predictor and a Newton corrector on the steady-state equations
+bordered by the arclength condition, so it passes around saddle-node folds where continuation in the parameter
+alone fails. Folds are located where the parameter component of the tangent changes sign, and the stability of
+every point is given by the leading eigenvalue of the Jacobian restricted to the stoichiometric subspace.'''
+
+import argparse
+
+import numpy as np
+from scipy.linalg import null_space, orth
+
+from ode_simulator import BatchResult, OdeSimulator
+from reduced_simulator import elimination_basis
+from steady_state import SteadyStateSolver
+
+
+class Branch(object):
+    def __init__(self, simulator, name, parameter, species, eigenvalue, folds):
+        '''species has shape (n_species, n_points); folds lists the interpolated parameter value and the index of the
+        point before each fold.'''
+        self.name = name
+        self.parameter = parameter
+        self.species = species
+        self.eigenvalue = eigenvalue
+        self.stable = eigenvalue < 0
+        self.folds = folds
+        self.result = BatchResult(simulator, np.array([np.inf]), species.T[:, None, :])
+
+    def observable(self, name):
+        return self.result.observable(name)[:, 0]
+
+    def bistable_ranges(self):
+        '''Parameter intervals between consecutive folds, where stable branches coexist.'''
+        values = sorted(parameter for parameter, index in self.folds)
+        return [(values[k], values[k + 1]) for k in range(0, len(values) - 1, 2)]
+
+    def write(self, observables, file_name="bifurcation"):
+        with open(file_name, "w") as f:
+            f.write("{0} {1} eigenvalue stable\n".format(self.name, " ".join(observables)))
+            for k in range(len(self.parameter)):
+                f.write("{0:e} {1} {2:e} {3:d}\n".format(
+                    self.parameter[k], " ".join("{0:f}".format(self.observable(name)[k]) for name in observables),
+                    self.eigenvalue[k], int(self.stable[k])))
+
+        np.savetxt(file_name + "_folds", [parameter for parameter, index in self.folds], fmt='%e',
+                   header=self.name)
+
+
+class ArclengthContinuation(object):
+    def __init__(self, simulator, name, initials=None, param_values=None, step=0.05, min_step=1e-6, max_step=0.25,
+                 max_angle=0.2, tolerance=1e-10, max_iterations=10, max_points=5000):
+        '''name is the continued parameter; initials and param_values fix the others. Steps are arclengths in
+        (species / scale, log parameter) space, where each species is scaled by the largest conserved total it takes
+        part in; a step whose tangent turns by more than max_angle radians is retried at half the length. The
+        corrector stops once its update is below tolerance in these units.'''
+        self.simulator = simulator
+        self.solver = SteadyStateSolver(simulator)
+        self.name = name
+        self.overrides = dict(param_values or {})
+        self.overrides.update(initials or {})
+
+        self.step = step
+        self.min_step = min_step
+        self.max_step = max_step
+        self.max_angle = max_angle
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.max_points = max_points
+
+        # Perturbations of the species along the stoichiometric subspace, where the dynamics and stability live
+        self.subspace = orth(np.asarray(simulator.stoichiometry, dtype=float))
+        self.scale = None
+
+    def values(self, log_p):
+        overrides = dict(self.overrides)
+        overrides[self.name] = np.exp(log_p)
+        return self.simulator.parameter_values(1, overrides)
+
+    def residual(self, y, log_p):
+        values = self.values(log_p)
+        totals = np.dot(self.solver.conservation, self.simulator.initial_state(values))
+        return self.solver.residual(y[:, None], values, totals)[:, 0]
+
+    def extended_jacobian(self, u):
+        '''Derivatives of the steady-state equations with respect to the scaled species and log(parameter).'''
+        y, log_p = u[:-1] * self.scale, u[-1]
+        g_y = self.solver.newton_matrix(y[:, None], self.values(log_p))[0]
+        h = 1e-6
+        g_p = (self.residual(y, log_p + h) - self.residual(y, log_p - h)) / (2 * h)
+        return np.column_stack([g_y * self.scale, g_p])
+
+    def tangent(self, u, previous):
+        '''Unit tangent of the branch at u, oriented along the previous tangent.'''
+        jacobian = self.extended_jacobian(u)
+        if previous is None:
+            t = null_space(jacobian)[:, 0]
+        else:
+            t = np.linalg.solve(np.vstack([jacobian, previous]), np.eye(len(u))[-1])
+        t /= np.linalg.norm(t)
+        if previous is not None and np.dot(t, previous) < 0:
+            t = -t
+        return t
+
+    def correct(self, u_predicted, t):
+        '''Newton on the steady-state equations plus t . (u - u_predicted) = 0; returns the corrected point, or None
+        when Newton does not converge.'''
+        u = u_predicted.copy()
+        for iteration in range(self.max_iterations):
+            g = np.append(self.residual(u[:-1] * self.scale, u[-1]), np.dot(t, u - u_predicted))
+            du = -np.linalg.solve(np.vstack([self.extended_jacobian(u), t]), g)
+            u += du
+            if np.max(np.abs(du)) <= self.tolerance:
+                return u
+        return None
+
+    def leading_eigenvalue(self, u):
+        y = u[:-1] * self.scale
+        jacobian = self.solver.jacobian(y[:, None], self.values(u[-1]))[0]
+        reduced = np.dot(self.subspace.T, np.dot(jacobian, self.subspace))
+        return np.max(np.linalg.eigvals(reduced).real)
+
+    def species_scale(self, y, log_low, log_high):
+        '''Largest amount each species can reach under the conservation laws (in echelon form, so that each law is
+        one conserved pool) at either end of the parameter range, or its starting amount when it is in none.'''
+        laws = elimination_basis(np.asarray(self.simulator.stoichiometry, dtype=float))[0]
+        totals = np.maximum(np.abs(np.dot(laws, self.simulator.initial_state(self.values(log_low))))[:, 0],
+                            np.abs(np.dot(laws, self.simulator.initial_state(self.values(log_high))))[:, 0])
+        scale = np.abs(y).copy()
+        for law, total in zip(laws, totals):
+            involved = law > 0
+            scale[involved] = np.maximum(scale[involved], total / law[involved])
+        return np.maximum(scale, 1.0)
+
+    def start(self, value):
+        '''Steady state at the first parameter value. When the direct solver fails, the ODEs are integrated to a long
+        time first and the result is polished by Newton.'''
+        overrides = dict(self.overrides)
+        overrides[self.name] = value
+        try:
+            return self.solver.steady_states(initials=overrides)[0][:, 0]
+        except RuntimeError:
+            settled = self.simulator.run(np.array([0.0, 1e7]), initials=overrides).species[0, -1]
+            return self.solver.steady_states(initials=overrides, y_guess=settled[:, None])[0][:, 0]
+
+    def trace(self, low, high):
+        '''Follows the branch through the steady state at parameter value low until it leaves [low, high].'''
+        y = self.start(low)
+        log_low, log_high = np.log(low), np.log(high)
+        self.scale = self.species_scale(y, log_low, log_high)
+
+        u = np.append(y / self.scale, log_low)
+        t = self.tangent(u, None)
+        if t[-1] < 0:
+            t = -t
+
+        points, tangents = [u], [t]
+        step = self.step
+        while len(points) < self.max_points and log_low <= u[-1] <= log_high:
+            corrected = self.correct(u + step * t, t)
+            if corrected is not None:
+                t_new = self.tangent(corrected, t)
+                if np.arccos(np.clip(np.dot(t, t_new), -1.0, 1.0)) <= self.max_angle or step <= self.min_step:
+                    u, t = corrected, t_new
+                    points.append(u)
+                    tangents.append(t)
+                    step = min(step * 1.5, self.max_step)
+                    continue
+            step /= 2.0
+            if step < self.min_step:
+                print("Continuation stopped at {0} = {1:e}: step below {2}".format(self.name, np.exp(u[-1]),
+                                                                                  self.min_step))
+                break
+
+        points, tangents = np.array(points), np.array(tangents)
+        folds = []
+        for k in np.flatnonzero(np.sign(tangents[:-1, -1]) * np.sign(tangents[1:, -1]) < 0):
+            fraction = tangents[k, -1] / (tangents[k, -1] - tangents[k + 1, -1])
+            folds.append((np.exp(points[k, -1] + fraction * (points[k + 1, -1] - points[k, -1])), k))
+
+        eigenvalue = np.array([self.leading_eigenvalue(point) for point in points])
+        return Branch(self.simulator, self.name, np.exp(points[:, -1]), (points[:, :-1] * self.scale).T, eigenvalue,
+                      folds)
+
+
+def trace_branch(owner, name, low, high, **kwargs):
+    '''Continues the steady states of a model instance (SoSFeedback or a PysbTcrSelfWithForeign variant) in the
+    parameter name from low to high.'''
+    if owner.network is None:
+        owner.build_network()
+    simulator = OdeSimulator(owner.model, network=owner.network)
+    return ArclengthContinuation(simulator, name, **kwargs).trace(low, high)
+
+
+if __name__ == "__main__":
+    from pysb_sos_fb import SoSFeedback
+    from pysb_t_cell_network import PysbTcrSelfWithForeign, EarlyPositiveFeedback
+
+    parser = argparse.ArgumentParser(description="Steady-state branches, folds and stability by arclength continuation",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--model', dest='model', action='store', default='sos',
+                        choices=['sos', 'tcr', 'early_pos_fb'], help='Model variant to continue.')
+    parser.add_argument('--parameter', dest='parameter', action='store',
+                        help='Continued parameter (default: Sos_0 for sos, Ls_0 otherwise).')
+    parser.add_argument('--low', dest='low', action='store', type=float, default=1.0,
+                        help='Lowest parameter value.')
+    parser.add_argument('--high', dest='high', action='store', type=float, default=1e4,
+                        help='Highest parameter value.')
+    parser.add_argument('--steps', dest='steps', action='store', type=int, default=8,
+                        help='Number of KP steps of the TCR variants.')
+    parser.add_argument('--lf', dest='lf', action='store', type=int, default=0,
+                        help='Number of foreign ligands; 0 continues the self-only variant.')
+
+    args = parser.parse_args()
+
+    if args.model == 'sos':
+        model = SoSFeedback()
+    else:
+        kwargs = dict(steps=args.steps, self_foreign=args.lf > 0, lf=args.lf or 30)
+        model = {'tcr': PysbTcrSelfWithForeign, 'early_pos_fb': EarlyPositiveFeedback}[args.model](**kwargs)
+    parameter = args.parameter or ('Sos_0' if args.model == 'sos' else 'Ls_0')
+
+    observables = model.build_network()
+    branch = trace_branch(model, parameter, args.low, args.high)
+    branch.write(observables)
+    print("Folds at {0} = {1}".format(parameter, ", ".join("{0:g}".format(fold) for fold, index in branch.folds)))
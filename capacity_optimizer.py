@@ -0,0 +1,162 @@
+'''Maximisation of the channel capacity over rate constants. Every candidate is evaluated in-process: the self and
+self-with-foreign outputs of one shared set of ligand samples are solved in one batched pass with the rates
+overridden through param_values, so the network is built once. With gradients, the capacity is the kernel density
+estimate of channel_capacity.kde_capacity, differentiated through the forward sensitivities of the outputs, and
+L-BFGS-B searches log(k) within bounds; without them, Powell searches the histogram capacity directly.'''
+
+import argparse
+
+import numpy as np
+from scipy.optimize import minimize
+
+from channel_capacity import histogram_capacity, kde_bandwidth, kde_capacity
+from grid_executor import parameter_bounds, parse_bounds
+from pysb_t_cell_network import PysbTcrSelfWithForeign, EarlyPositiveFeedback, LatPhosphorylationExtension, \
+    PysbTcrLckFeedbackLoop
+
+OPTIMIZED_PARAMETERS = ('k_lck_on_RL', 'k_p_on_R_pmhc', 'k_neg_fb', 'k_lcki')
+OBJECTIVES = ('capacity', 'hopfield')
+
+
+class CapacityOptimizer(object):
+    def __init__(self, tcr, parameters=OPTIMIZED_PARAMETERS, bounds=None, objective='capacity', gradient=True):
+        '''tcr is a self_foreign model carrying the ligand samples. bounds maps parameter names to (low, high) in
+        linear units; the default range is a factor of 10 either side of the network's value. objective
+        'hopfield' minimises the Hopfield error, the mean self output relative to the mean self-with-foreign
+        output, instead of maximising the capacity.'''
+        if objective not in OBJECTIVES:
+            raise ValueError("Unknown objective {0}; expected one of {1}".format(objective, OBJECTIVES))
+
+        self.tcr = tcr
+        self.observables = tcr.build_network()
+        self.parameters = list(parameters)
+        self.objective = objective
+        self.gradient = gradient
+
+        defaults = dict(tcr.network['parameters'])
+        missing = [name for name in self.parameters if name not in defaults]
+        if missing:
+            raise ValueError("Parameters {0} are not in the {1}-step network".format(missing, tcr.steps))
+        self.bounds = parameter_bounds(self.parameters, [[name] for name in self.parameters], defaults, bounds)
+        self.log_bounds = [(np.log(low), np.log(high)) for low, high in self.bounds]
+        self.x0 = np.array([np.clip(np.log(max(defaults[name], low)), np.log(low), np.log(high))
+                            for name, (low, high) in zip(self.parameters, self.bounds)])
+
+        self.ligands = np.array(tcr.p_ligand, dtype=float)
+        self.weights = tcr.weights
+        self.bandwidth = None
+        self.history = []
+        self.optimum_value = None
+        self.optimum_histogram_capacity = None
+
+    def param_values(self, log_k):
+        return dict(zip(self.parameters, np.exp(log_k)))
+
+    def outputs(self, log_k, gradient=None):
+        '''Final self and self-with-foreign outputs, and with gradients (by default when the optimiser uses them)
+        their derivatives with respect to log(k), shape (n_samples, n_parameters).'''
+        n = len(self.ligands)
+        foreign = np.concatenate([np.zeros(n), np.full(n, float(self.tcr.lf))])
+        ligands = np.concatenate([self.ligands, self.ligands])
+        if self.gradient if gradient is None else gradient:
+            output, sensitivity, names = self.tcr.output_sensitivity(ligands, self.observables, self.parameters,
+                                                                     foreign=foreign,
+                                                                     param_values=self.param_values(log_k))
+            return output[:n], output[n:], sensitivity[:n], sensitivity[n:]
+
+        output, settling_time = self.tcr.solve_samples(ligands, self.observables, foreign=foreign,
+                                                       param_values=self.param_values(log_k))
+        return output[:n, -1], output[n:, -1], None, None
+
+    def evaluate(self, log_k):
+        '''Value to minimise (negative capacity, or Hopfield error) and, with gradients, its gradient in log(k).'''
+        self_output, foreign_output, d_self, d_foreign = self.outputs(log_k)
+
+        if self.objective == 'hopfield':
+            mean_self = np.average(self_output, weights=self.weights)
+            mean_foreign = np.average(foreign_output, weights=self.weights)
+            value = mean_self / mean_foreign
+            gradient = None
+            if self.gradient:
+                gradient = np.average(d_self, axis=0, weights=self.weights) / mean_foreign - \
+                    value * np.average(d_foreign, axis=0, weights=self.weights) / mean_foreign
+        elif self.gradient:
+            if self.bandwidth is None:
+                # Fixed from the first candidate on, so the objective is one smooth function of log(k)
+                self.bandwidth = kde_bandwidth(foreign_output, self_output)
+            capacity, gradient = kde_capacity(foreign_output, self_output, self.bandwidth,
+                                              foreign_weights=self.weights, self_weights=self.weights,
+                                              foreign_derivative=d_foreign, self_derivative=d_self)
+            value, gradient = -capacity, -gradient
+        else:
+            value = -histogram_capacity(foreign_output, self_output, foreign_weights=self.weights,
+                                        self_weights=self.weights, verbose=False)
+            gradient = None
+
+        self.history.append((np.exp(log_k), value))
+        print("{0}: {1:f}".format(", ".join("{0} = {1:.3e}".format(name, k)
+                                            for name, k in zip(self.parameters, np.exp(log_k))), value))
+        return (value, gradient) if self.gradient else value
+
+    def optimize(self, max_iterations=50):
+        if self.gradient:
+            result = minimize(self.evaluate, self.x0, jac=True, method='L-BFGS-B', bounds=self.log_bounds,
+                              options={'maxiter': max_iterations})
+        else:
+            result = minimize(self.evaluate, self.x0, method='Powell', bounds=self.log_bounds,
+                              options={'maxiter': max_iterations, 'xtol': 1e-2})
+        self.optimum_value = result.fun
+        self.optimum_histogram_capacity = self.histogram_capacity(result.x)
+        return self.param_values(result.x), result
+
+    def histogram_capacity(self, log_k):
+        '''Histogram capacity at log(k), for comparison with the smoothed objective.'''
+        self_output, foreign_output, d_self, d_foreign = self.outputs(log_k, gradient=False)
+        return histogram_capacity(foreign_output, self_output, foreign_weights=self.weights,
+                                  self_weights=self.weights, verbose=False)
+
+    def write_results(self, optimum, file_name="capacity_optimization"):
+        with open(file_name, "w") as f:
+            f.write("{0} objective\n".format(" ".join(self.parameters)))
+            for k, value in self.history:
+                f.write("{0} {1:f}\n".format(" ".join("{0:e}".format(v) for v in k), value))
+
+        with open("optimal_parameters", "w") as f:
+            for name in self.parameters:
+                f.write("{0} {1:e}\n".format(name, optimum[name]))
+            f.write("objective {0:f}\n".format(self.optimum_value))
+            f.write("histogram_capacity {0:f}\n".format(self.optimum_histogram_capacity))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maximise the channel capacity over rate constants",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--model', dest='model', action='store', default='tcr',
+                        choices=['tcr', 'early_pos_fb', 'latpp_ext', 'lck_fb'], help='Model variant to optimise.')
+    parser.add_argument('--steps', dest='steps', action='store', type=int, default=8, help='Number of KP steps.')
+    parser.add_argument('--lf', dest='lf', action='store', type=int, default=30, help='Number of foreign ligands.')
+    parser.add_argument('--seed', dest='seed', action='store', type=int, help='Seed for the ligand samples.')
+    parser.add_argument('--num_samples', dest='num_samples', action='store', type=int, default=500,
+                        help='Number of ligand samples shared by every candidate.')
+    parser.add_argument('--parameters', dest='parameters', action='store', nargs='+',
+                        default=list(OPTIMIZED_PARAMETERS), help='Rate constants to optimise.')
+    parser.add_argument('--bounds', dest='bounds', action='store', nargs='+', default=[],
+                        help='Bounds as name low high triples (default: a factor of 10 around each value).')
+    parser.add_argument('--objective', dest='objective', action='store', default='capacity', choices=OBJECTIVES,
+                        help='Maximise the capacity or minimise the Hopfield error.')
+    parser.add_argument('--derivative_free', dest='derivative_free', action='store_true', default=False,
+                        help='Search the histogram capacity with Powell instead of using sensitivity gradients.')
+    parser.add_argument('--max_iterations', dest='max_iterations', action='store', type=int, default=50,
+                        help='Largest number of optimiser iterations.')
+
+    args = parser.parse_args()
+
+    model_class = {'tcr': PysbTcrSelfWithForeign, 'early_pos_fb': EarlyPositiveFeedback,
+                   'latpp_ext': LatPhosphorylationExtension, 'lck_fb': PysbTcrLckFeedbackLoop}[args.model]
+    tcr = model_class(steps=args.steps, self_foreign=True, lf=args.lf, seed=args.seed, num_samples=args.num_samples)
+
+    optimizer = CapacityOptimizer(tcr, parameters=args.parameters, bounds=parse_bounds(args.bounds),
+                                  objective=args.objective, gradient=not args.derivative_free)
+    optimum, result = optimizer.optimize(max_iterations=args.max_iterations)
+    print(result.message)
+    optimizer.write_results(optimum)
@@ -0,0 +1,144 @@
+'''Channel capacity estimators of the binary self / self-with-foreign channel, from sampled outputs or from output
+densities. They only need numpy and scipy, so solver processes and pool workers can import them without the plotting
+and post-processing modules compute_ic loads.'''
+
+import numpy as np
+from scipy.integrate import trapezoid
+from scipy.stats import norm
+
+
+def exact_capacity(foreign_grid, foreign_density, self_grid, self_density):
+    '''Capacity of the binary channel from output densities known on (possibly different) output grids, e.g. from
+    DoseResponse.output_density. Both densities are evaluated on the union of the grids, so no binning is involved.'''
+    grid = np.union1d(foreign_grid, self_grid)
+    count_cn = np.interp(grid, foreign_grid, foreign_density, left=0, right=0)
+    count_dn = np.interp(grid, self_grid, self_density, left=0, right=0)
+
+    p_O = 0.5 * (count_cn + count_dn)
+    p_0_integral = trapezoid(p_O, x=grid)
+    print("p(O) integral = " + str(p_0_integral))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        term_1_c0 = 0.5 * count_cn * np.nan_to_num(np.log2(count_cn / p_O))
+        term_2_d0 = 0.5 * count_dn * np.nan_to_num(np.log2(count_dn / p_O))
+    C = trapezoid(term_1_c0 + term_2_d0, x=grid)
+    print("C = " + str(C))
+
+    return C
+
+
+def kde_bandwidth(foreign_output, self_output):
+    '''Bandwidth for kde_capacity: Silverman's rule on the log(1 + output) values of each population, taking the
+    smaller one. Pooling the populations counts their separation as spread and smooths away the difference the
+    capacity measures; separate bandwidths let a narrow, saturated density spill past its edge where the other has
+    no mass, which overstates it.'''
+    return min(1.06 * max(np.std(z), 1e-3) * len(z) ** -0.2
+               for z in (np.log1p(np.maximum(np.asarray(output, dtype=float), 0.0))
+                         for output in (foreign_output, self_output)))
+
+
+def kde_capacity(foreign_output, self_output, bandwidth, foreign_weights=None, self_weights=None,
+                 foreign_derivative=None, self_derivative=None, num_points=512):
+    '''Capacity of the binary channel from Gaussian kernel densities of log(1 + output). The transformation is
+    monotone, so the capacity is that of the outputs, and with a fixed bandwidth the estimate is smooth in every
+    output. Given the derivatives of the outputs with respect to some parameters, shape (n_samples, n_parameters),
+    the gradient of the capacity with respect to those parameters is returned as well.'''
+    def density(z, weights):
+        weights = np.full(len(z), 1.0 / len(z)) if weights is None else np.asarray(weights) / np.sum(weights)
+        kernels = norm.pdf((grid[:, None] - z[None, :]) / bandwidth) / bandwidth
+        return np.dot(kernels, weights), kernels, weights
+
+    outputs = [np.maximum(np.asarray(foreign_output, dtype=float), 0.0),
+               np.maximum(np.asarray(self_output, dtype=float), 0.0)]
+    z_f, z_s = np.log1p(outputs[0]), np.log1p(outputs[1])
+    grid = np.linspace(min(z_f.min(), z_s.min()) - 5 * bandwidth, max(z_f.max(), z_s.max()) + 5 * bandwidth,
+                       num_points)
+    count_cn, kernels_f, weights_f = density(z_f, foreign_weights)
+    count_dn, kernels_s, weights_s = density(z_s, self_weights)
+
+    p_O = 0.5 * (count_cn + count_dn)
+    tiny = np.finfo(float).tiny
+    log_ratio_cn = np.log2(np.maximum(count_cn, tiny) / np.maximum(p_O, tiny))
+    log_ratio_dn = np.log2(np.maximum(count_dn, tiny) / np.maximum(p_O, tiny))
+    C = trapezoid(0.5 * count_cn * log_ratio_cn + 0.5 * count_dn * log_ratio_dn, x=grid)
+    if foreign_derivative is None:
+        return C
+
+    # dC/dp_c(x) = log2(p_c(x) / p_O(x)) / 2, and each sample moves its kernel: dK/dz_i = K (x - z_i) / h^2
+    gradient = 0
+    for z, kernels, weights, log_ratio, output, derivative in [
+            (z_f, kernels_f, weights_f, log_ratio_cn, outputs[0], foreign_derivative),
+            (z_s, kernels_s, weights_s, log_ratio_dn, outputs[1], self_derivative)]:
+        d_kernels = kernels * (grid[:, None] - z[None, :]) / bandwidth ** 2
+        d_z = weights * trapezoid(0.5 * log_ratio[:, None] * d_kernels, x=grid, axis=0)
+        gradient = gradient + np.dot(d_z / (1.0 + output), derivative)
+
+    return C, gradient
+
+
+def histogram_capacity(foreign_output, self_output, foreign_weights=None, self_weights=None, estimator='fd',
+                       verbose=True):
+    '''Capacity of the binary channel from histograms of the sampled outputs. The number of bins grows in steps of 50
+    until the binned p(O) integrates to at least 0.99.'''
+    number_of_bins = 50
+    C = 0
+    p_0_integral = 0
+    while p_0_integral < 0.99:
+        count, self_bins = np.histogram(self_output, bins=estimator, density=True)
+        count, foreign_bins = np.histogram(foreign_output, bins=estimator, density=True)
+        bins = np.linspace(min(self_bins), max(foreign_bins), num=number_of_bins)
+
+        count_cn, bins = np.histogram(foreign_output, bins=bins, density=True, weights=foreign_weights)
+        count_dn, bins = np.histogram(self_output, bins=bins, density=True, weights=self_weights)
+        bin_width = bins[1] - bins[0]
+
+        p_O = 0.5 * (count_cn + count_dn)
+
+        p_0_integral = trapezoid(p_O, dx=bin_width)
+        if verbose:
+            print("p(O) integral = " + str(p_0_integral))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            term_1_c0 = 0.5 * count_cn * np.nan_to_num(np.log2(count_cn / p_O))
+            term_2_d0 = 0.5 * count_dn * np.nan_to_num(np.log2(count_dn / p_O))
+        C = trapezoid(term_1_c0 + term_2_d0, dx=bin_width)
+        if verbose:
+            print("C = " + str(C))
+
+        if p_0_integral == C:
+            if verbose:
+                print("C == P(O) integral: " + str(p_0_integral == C))
+            C = 1.00
+            if verbose:
+                print("New C " + str(C))
+            break
+
+        number_of_bins += 50
+
+    return C  # , number_of_bins, p_0_integral
+
+
+def paired_bootstrap_capacity(foreign_output, self_output, weights=None, num_bootstrap=200, seed=None,
+                              estimator='fd'):
+    '''Capacity of outputs solved from the same ligand samples (foreign_output[i] and self_output[i] share sample i),
+    with its bootstrap standard error and 95% interval. Each replicate resamples the shared samples, so both
+    conditions keep the same inputs and the error reflects the paired design. Resampled histograms overstate the
+    capacity, so the interval is the basic bootstrap one, reflected about the estimate.'''
+    foreign_output = np.asarray(foreign_output, dtype=float)
+    self_output = np.asarray(self_output, dtype=float)
+    if foreign_output.shape != self_output.shape:
+        raise ValueError("Paired outputs need one value per shared sample in both conditions")
+    weights = np.full(len(self_output), 1.0 / len(self_output)) if weights is None else np.asarray(weights)
+
+    capacity = histogram_capacity(foreign_output, self_output, foreign_weights=weights, self_weights=weights,
+                                  estimator=estimator, verbose=False)
+
+    random_state = np.random.RandomState(seed)
+    replicates = np.empty(num_bootstrap)
+    for b in range(num_bootstrap):
+        index = random_state.randint(len(self_output), size=len(self_output))
+        replicates[b] = histogram_capacity(foreign_output[index], self_output[index], foreign_weights=weights[index],
+                                           self_weights=weights[index], estimator=estimator, verbose=False)
+
+    high, low = 2 * capacity - np.percentile(replicates, [2.5, 97.5])
+    return capacity, np.std(replicates, ddof=1), (low, high)
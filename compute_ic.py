@@ -4,15 +4,25 @@ import os
 import matplotlib.pyplot as plt
 import numpy as np
 
+from channel_capacity import exact_capacity, histogram_capacity, paired_bootstrap_capacity
 from post_process import load
 
 
 # from scipy.stats import iqr
 
 
+def load_weights(directory):
+    '''Sample weights written with the ligand samples, or None (equal weights) for runs without them.'''
+    if os.path.exists(directory + "ligand_weights"):
+        return np.loadtxt(directory + "ligand_weights")
+    return None
+
+
 class InformationCapacity(object):
 
     def __init__(self, foreign_directory="./", self_directory="./", estimator='fd', limiting='foreign'):
+        '''estimator is a numpy histogram bin estimator, or 'exact' to use the output_density files written with
+        --exact_density instead of histograms of the sampled outputs.'''
         self.num_steps = 1
         self.foreign_directory = foreign_directory
         self.self_directory = self_directory
@@ -21,6 +31,8 @@ class InformationCapacity(object):
         self.foreign_ligand = np.loadtxt(foreign_directory + "Ligand_concentrations")
         self.self_output = np.loadtxt(self_directory + "output")
         self.self_ligand = np.loadtxt(self_directory + "Ligand_concentrations")
+        self.foreign_weights = load_weights(foreign_directory)
+        self.self_weights = load_weights(self_directory)
 
         if os.path.exists(foreign_directory + "sample_0/column_names"):
             print("Loaded foreign column names")
@@ -63,12 +75,13 @@ class InformationCapacity(object):
     #              kde_kws={'linewidth': 4})
 
     def count_cn(self, bin_locations):
-        count_cn, bins = np.histogram(self.foreign_output, bins=bin_locations, density=True)
+        count_cn, bins = np.histogram(self.foreign_output, bins=bin_locations, density=True,
+                                      weights=self.foreign_weights)
 
         return count_cn
 
     def cn_mean_iqr(self):
-        mean = np.mean(self.foreign_output)
+        mean = np.average(self.foreign_output, weights=self.foreign_weights)
         # cn_iqr = iqr(self.foreign_output)
 
         return mean  # , cn_iqr
@@ -98,11 +111,11 @@ class InformationCapacity(object):
                                      label='P(Lf)')
 
     def count_dn(self, bin_locations):
-        count_dn, bins = np.histogram(self.self_output, bins=bin_locations, density=True)
+        count_dn, bins = np.histogram(self.self_output, bins=bin_locations, density=True, weights=self.self_weights)
         return count_dn
 
     def dn_mean_iqr(self):
-        mean = np.mean(self.self_output)
+        mean = np.average(self.self_output, weights=self.self_weights)
         # dn_iqr = iqr(self.self_output)
         return mean  # , dn_iqr
 
@@ -151,35 +164,24 @@ class InformationCapacity(object):
 
         return bins
 
-    def calculate_ic(self):
-        number_of_bins = 50
-        C = 0
-        p_0_integral = 0
-        while p_0_integral < 0.99:
-            bins = self.calculate_bins(num_bins=number_of_bins)
-            count_cn = self.count_cn(bins)
-            count_dn = self.count_dn(bins)
-            bin_width = bins[1] - bins[0]
-
-            p_O = 0.5 * (count_cn + count_dn)
-
-            p_0_integral = np.trapz(p_O, dx=bin_width)
-            print("p(O) integral = " + str(p_0_integral))
-
-            term_1_c0 = 0.5 * count_cn * np.nan_to_num(np.log2(count_cn / p_O))
-            term_2_d0 = 0.5 * count_dn * np.nan_to_num(np.log2(count_dn / p_O))
-            C = np.trapz(term_1_c0 + term_2_d0, dx=bin_width)
-            print("C = " + str(C))
+    def paired_bootstrap(self, num_bootstrap=200, seed=None):
+        '''Capacity, standard error and 95% interval for runs that share their ligand samples (--paired).'''
+        if not np.array_equal(self.foreign_ligand, self.self_ligand):
+            raise ValueError("The self and foreign runs do not share their ligand samples")
+        return paired_bootstrap_capacity(self.foreign_output, self.self_output, weights=self.self_weights,
+                                         num_bootstrap=num_bootstrap, seed=seed, estimator=self.estimator)
 
-            if p_0_integral == C:
-                print("C == P(O) integral: " + str(p_0_integral == C))
-                C = 1.00
-                print("New C " + str(C))
-                break
+    def calculate_exact_ic(self):
+        foreign_grid, foreign_density = np.loadtxt(self.foreign_directory + "output_density", unpack=True)
+        self_grid, self_density = np.loadtxt(self.self_directory + "output_density", unpack=True)
+        return exact_capacity(foreign_grid, foreign_density, self_grid, self_density)
 
-            number_of_bins += 50
+    def calculate_ic(self):
+        if self.estimator == 'exact':
+            return self.calculate_exact_ic()
 
-        return C  # , number_of_bins, p_0_integral
+        return histogram_capacity(self.foreign_output, self.self_output, foreign_weights=self.foreign_weights,
+                                  self_weights=self.self_weights, estimator=self.estimator)
 
     def alternate_calculate_ic(self):
         bins = self.calculate_bins(num_bins=500)
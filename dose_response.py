@@ -0,0 +1,111 @@
+'''Dose-response curves solved on an adaptive log-spaced grid of doses and evaluated for any number of samples by
+monotone (PCHIP) interpolation in log(dose).'''
+
+import numpy as np
+from scipy.interpolate import PchipInterpolator
+from scipy.stats import norm
+
+
+def leave_one_out_error(x, y):
+    '''Error of interpolating each interior grid point from all the others. The grid without one point is coarser
+    than the full grid, so the largest of these is a conservative estimate of the full grid's interpolation error.'''
+    error = np.zeros(len(x))
+    for i in range(1, len(x) - 1):
+        keep = np.arange(len(x)) != i
+        error[i] = np.abs(PchipInterpolator(x[keep], y[keep])(x[i]) - y[i])
+    return error
+
+
+class DoseResponse(object):
+    def __init__(self, solve, min_points=30, max_points=60, rtol=1e-3, atol=1e-6):
+        '''solve maps an array of doses to an array of responses, one per dose.'''
+        self.solve = solve
+        self.min_points = min_points
+        self.max_points = max_points
+        self.rtol = rtol
+        self.atol = atol
+
+        self.doses = None
+        self.responses = None
+        self.error = None
+        self.interpolator = None
+
+    def fit(self, low, high):
+        '''Solves on min_points log-spaced doses in [low, high], then adds midpoints on both sides of the points with
+        the largest leave-one-out error until the error is within tolerance or max_points doses have been solved.'''
+        x = np.linspace(np.log(low), np.log(high), self.min_points)
+        y = np.asarray(self.solve(np.exp(x)), dtype=float)
+
+        while True:
+            error = leave_one_out_error(x, y)
+            tolerance = self.atol + self.rtol * (y.max() - y.min())
+            budget = self.max_points - len(x)
+            if budget <= 0 or error.max() <= tolerance:
+                break
+
+            new = []
+            for i in np.argsort(error)[::-1]:
+                if error[i] <= tolerance or len(new) >= budget:
+                    break
+                for midpoint in (0.5 * (x[i - 1] + x[i]), 0.5 * (x[i] + x[i + 1])):
+                    if midpoint not in new and len(new) < budget:
+                        new.append(midpoint)
+
+            new = np.array(new)
+            x = np.concatenate([x, new])
+            y = np.concatenate([y, np.asarray(self.solve(np.exp(new)), dtype=float)])
+            order = np.argsort(x)
+            x, y = x[order], y[order]
+
+        self.doses = np.exp(x)
+        self.responses = y
+        self.error = error.max()
+        self.interpolator = PchipInterpolator(x, y)
+        return self
+
+    def __call__(self, doses):
+        '''Interpolated responses; doses must lie within the fitted range.'''
+        return self.interpolator(np.log(doses))
+
+    def derivative(self, doses):
+        '''d(response)/d(log dose) of the interpolant.'''
+        return self.interpolator.derivative()(np.log(doses))
+
+    def output_density(self, mu, sigma, num_points=2000):
+        '''Exact density of the response when log(dose) ~ N(mu, sigma), by change of variables:
+        p(o) = sum over doses L with L(o) = o of p_logL(log L) / |do/dlog L|. Returns an output grid and the density on
+        it; the density integrates to the probability mass of the fitted dose range.'''
+        x = np.linspace(self.interpolator.x[0], self.interpolator.x[-1], num_points)
+        o = self.interpolator(x)
+        slope = np.abs(self.interpolator.derivative()(x))
+        with np.errstate(divide='ignore'):
+            p = norm.pdf(x, mu, sigma) / slope
+
+        grid = np.unique(o)
+        density = np.zeros(len(grid))
+        # Each monotone piece of the curve is one branch of the inverse.
+        bounds = np.concatenate([[0], np.flatnonzero(np.diff(np.sign(np.diff(o))) != 0) + 1, [len(x) - 1]])
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            piece = np.arange(start, end + 1)
+            piece = piece[np.isfinite(p[piece])]
+            if len(piece) < 2:
+                continue
+            order = np.argsort(o[piece])
+            density += np.interp(grid, o[piece][order], p[piece][order], left=0, right=0)
+
+        return grid, density
+
+    def fit_samples(self, doses, low=None, high=None):
+        '''Fits over the range of the positive doses, widened to [low, high] if given, and returns the response of
+        every dose; doses of zero are solved directly.'''
+        doses = np.asarray(doses, dtype=float)
+        positive = doses > 0
+        low = doses[positive].min() if low is None else min(low, doses[positive].min())
+        high = doses[positive].max() if high is None else max(high, doses[positive].max())
+        self.fit(low, high)
+
+        responses = np.empty(len(doses))
+        responses[positive] = self(doses[positive])
+        if not np.all(positive):
+            responses[~positive] = self.solve(np.zeros(1))[0]
+        return responses
@@ -0,0 +1,213 @@
+'''Variance-based global sensitivity of the capacity and mean outputs to the rate constants. Parameters are drawn
+log-uniformly over their ranges in Saltelli's scheme: two independent base designs A and B (scrambled Sobol or Latin
+hypercube) and, for every parameter i, A with column i taken from B. First-order indices use the estimator of
+Saltelli et al. (2010) and total indices Jansen's, with basic bootstrap intervals over the base rows. The design is
+evaluated in chunks through GridExecutor and saved after every chunk, so an interrupted run resumes where it
+stopped.'''
+
+import argparse
+import os
+
+import numpy as np
+from scipy.stats import qmc
+
+from grid_executor import GridExecutor, parameter_bounds
+from ligand_sampler import SAMPLING_METHODS
+from step_sweep import VARIANTS
+
+# On-rates of the KP cascade and the negative feedback, whose interactions one-at-a-time sweeps cannot show; varied
+# by default where the network has them (the LAT rates are added from 6 to 8 steps)
+SOBOL_PARAMETERS = ('k_lck_on_RL', 'k_p_on_R_pmhc', 'k_zap_on_R_pmhc', 'k_p_on_zap_species', 'k_lat_on_species',
+                    'kp_on_lat1', 'k_p_lat_on_species', 'k_neg_fb', 'k_lcki')
+DESIGNS = ('sobol', 'lhs')
+OUTPUTS = ('capacity', 'mean_self_output', 'mean_foreign_output')
+
+
+def saltelli_design(log_low, log_high, num_base, design='sobol', seed=None):
+    '''Rows of log(parameters), stacked as A, B and A_B^(i) for every parameter i, each num_base rows.'''
+    d = len(log_low)
+    if design == 'sobol':
+        u = qmc.Sobol(d=2 * d, seed=seed).random(num_base)
+    elif design == 'lhs':
+        u = qmc.LatinHypercube(d=2 * d, seed=seed).random(num_base)
+    else:
+        raise ValueError("Unknown design {0}; expected one of {1}".format(design, DESIGNS))
+
+    a = qmc.scale(u[:, :d], log_low, log_high)
+    b = qmc.scale(u[:, d:], log_low, log_high)
+    blocks = [a, b]
+    for i in range(d):
+        ab = a.copy()
+        ab[:, i] = b[:, i]
+        blocks.append(ab)
+    return np.vstack(blocks)
+
+
+def sobol_indices(f, num_parameters):
+    '''First-order and total indices from the outputs of a Saltelli design, f with shape (num_parameters + 2,
+    num_base).'''
+    f_a, f_b, f_ab = f[0], f[1], f[2:2 + num_parameters]
+    variance = np.var(np.concatenate([f_a, f_b]))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        first = np.mean(f_b * (f_ab - f_a), axis=1) / variance
+        total = 0.5 * np.mean((f_a - f_ab) ** 2, axis=1) / variance
+    return first, total
+
+
+def bootstrap_indices(f, num_parameters, num_bootstrap=200, seed=None):
+    '''Indices with the basic bootstrap 95% intervals, each (num_parameters, 2), from resampling the base rows.'''
+    first, total = sobol_indices(f, num_parameters)
+    random_state = np.random.RandomState(seed)
+    replicates = [sobol_indices(f[:, random_state.randint(f.shape[1], size=f.shape[1])], num_parameters)
+                  for b in range(num_bootstrap)]
+    intervals = []
+    for estimate, samples in [(first, np.array([r[0] for r in replicates])),
+                              (total, np.array([r[1] for r in replicates]))]:
+        # Resamples without output variance give no index and are left out
+        samples[~np.isfinite(samples)] = np.nan
+        low, high = np.nanpercentile(samples, [2.5, 97.5], axis=0)
+        intervals.append(np.column_stack([2 * estimate - high, 2 * estimate - low]))
+    return first, total, intervals[0], intervals[1]
+
+
+def stored_seed(file_name, seed=None):
+    '''Seed of a design saved under file_name, so that a resumed run reuses its ligand samples and design.'''
+    if os.path.exists(file_name + ".npz"):
+        return int(np.load(file_name + ".npz")['seed'])
+    return seed
+
+
+class SobolAnalysis(object):
+    def __init__(self, executor, parameters=None, ranges=None, decades=1.0, num_base=64, design='sobol',
+                 file_name="sobol_design"):
+        '''parameters are network parameter names or their aliases (PARAMETER_ALIASES), by default those of
+        SOBOL_PARAMETERS the network has; ranges maps them to (low, high), by default decades either side of the
+        network's value. The design and its evaluated rows are kept in <file_name>.npz, which is resumed when it
+        exists.'''
+        self.executor = executor
+        if parameters is None:
+            parameters = [name for name in SOBOL_PARAMETERS if executor.targets(name, required=False)]
+        self.parameters = list(parameters)
+        self.num_base = num_base
+        self.design = design
+        self.file_name = file_name
+
+        self.targets = [executor.targets(name) for name in self.parameters]
+        self.log_bounds = np.log(np.array(parameter_bounds(self.parameters, self.targets, executor.defaults, ranges,
+                                                           decades), dtype=float))
+
+        self.log_values = saltelli_design(self.log_bounds[:, 0], self.log_bounds[:, 1], num_base, design,
+                                          seed=executor.seed)
+        self.outputs = dict((name, np.full(len(self.log_values), np.nan)) for name in OUTPUTS)
+        self.done = np.zeros(len(self.log_values), dtype=bool)
+        self.load()
+
+    def settings(self):
+        return dict(parameters=self.parameters, log_bounds=self.log_bounds, num_base=self.num_base,
+                    design=self.design, seed=self.executor.seed, model=self.executor.model_class.__name__,
+                    steps=self.executor.steps, lf=self.executor.lf, sampling=self.executor.sampling,
+                    num_samples=len(self.executor.p_ligand))
+
+    def load(self):
+        if not os.path.exists(self.file_name + ".npz"):
+            return
+        state = np.load(self.file_name + ".npz")
+        for key, value in self.settings().items():
+            if not np.array_equal(state[key], value):
+                raise ValueError("{0}.npz was written with a different {1}; remove it or choose another file "
+                                 "name".format(self.file_name, key))
+        self.done = state['done']
+        for name in OUTPUTS:
+            self.outputs[name] = state[name]
+        print("Resuming {0}: {1} of {2} rows evaluated".format(self.file_name, self.done.sum(), len(self.done)))
+
+    def save(self):
+        # Written to a temporary file first, so an interruption never leaves a truncated design behind
+        arrays = dict(self.settings(), log_values=self.log_values, done=self.done, **self.outputs)
+        np.savez(self.file_name + ".tmp.npz", **arrays)
+        os.replace(self.file_name + ".tmp.npz", self.file_name + ".npz")
+
+    def point(self, row):
+        point = {}
+        for targets, value in zip(self.targets, np.exp(self.log_values[row])):
+            point.update((target, value) for target in targets)
+        return point
+
+    def run(self, chunk_size=50, **options):
+        '''Evaluates the rows not yet done, chunk_size at a time, saving after every chunk. options are passed to
+        solve_samples.'''
+        pending = np.flatnonzero(~self.done)
+        weights = self.executor.weights
+        for start in range(0, len(pending), chunk_size):
+            rows = pending[start:start + chunk_size]
+            capacity, self_output, foreign_output = self.executor.evaluate([self.point(row) for row in rows],
+                                                                           **options)
+            self.outputs['capacity'][rows] = capacity
+            self.outputs['mean_self_output'][rows] = np.average(self_output, axis=1, weights=weights)
+            self.outputs['mean_foreign_output'][rows] = np.average(foreign_output, axis=1, weights=weights)
+            self.done[rows] = True
+            self.save()
+            print("{0} of {1} rows evaluated".format(self.done.sum(), len(self.done)))
+
+    def indices(self, name, num_bootstrap=200):
+        if not self.done.all():
+            raise RuntimeError("{0} of {1} rows are not evaluated yet".format((~self.done).sum(), len(self.done)))
+        f = self.outputs[name].reshape(len(self.parameters) + 2, self.num_base)
+        return bootstrap_indices(f, len(self.parameters), num_bootstrap, seed=self.executor.seed)
+
+    def write_results(self, num_bootstrap=200, file_name="sobol_indices"):
+        with open(file_name, "w") as f:
+            f.write("output parameter first_order first_low first_high total total_low total_high\n")
+            for name in OUTPUTS:
+                first, total, first_interval, total_interval = self.indices(name, num_bootstrap)
+                for i, parameter in enumerate(self.parameters):
+                    f.write("{0} {1} {2:f} {3:f} {4:f} {5:f} {6:f} {7:f}\n".format(
+                        name, parameter, first[i], first_interval[i, 0], first_interval[i, 1], total[i],
+                        total_interval[i, 0], total_interval[i, 1]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sobol indices of the capacity and mean outputs over rate constants",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--model', dest='model', action='store', default='tcr', choices=sorted(VARIANTS),
+                        help='Model variant.')
+    parser.add_argument('--steps', dest='steps', action='store', type=int, default=8, help='Number of KP steps.')
+    parser.add_argument('--lf', dest='lf', action='store', type=int, default=30, help='Number of foreign ligands.')
+    parser.add_argument('--seed', dest='seed', action='store', type=int,
+                        help='Seed for the ligand samples and the design (a resumed design keeps its own).')
+    parser.add_argument('--num_samples', dest='num_samples', action='store', type=int, default=1000,
+                        help='Number of ligand samples shared by every design row.')
+    parser.add_argument('--sampling', dest='sampling', action='store', default='random', choices=SAMPLING_METHODS,
+                        help='Design of the lognormal ligand samples.')
+    parser.add_argument('--parameters', dest='parameters', action='store', nargs='+',
+                        help='Network parameters or their aliases to vary (default: those of {0} the network '
+                             'has).'.format(", ".join(SOBOL_PARAMETERS)))
+    parser.add_argument('--decades', dest='decades', action='store', type=float, default=1.0,
+                        help='Half-width of the default log10 range around each value.')
+    parser.add_argument('--num_base', dest='num_base', action='store', type=int, default=64,
+                        help='Rows of each base design; the design has num_base * (parameters + 2) rows.')
+    parser.add_argument('--design', dest='design', action='store', default='sobol', choices=DESIGNS,
+                        help='Base designs from a scrambled Sobol sequence or Latin hypercubes.')
+    parser.add_argument('--chunk_size', dest='chunk_size', action='store', type=int, default=50,
+                        help='Design rows evaluated between saves.')
+    parser.add_argument('--workers', dest='workers', action='store', type=int, default=1,
+                        help='Number of processes the design rows are spread across.')
+    parser.add_argument('--points_per_batch', dest='points_per_batch', action='store', type=int, default=1,
+                        help='Number of design rows solved together in one batched pass.')
+    parser.add_argument('--num_bootstrap', dest='num_bootstrap', action='store', type=int, default=200,
+                        help='Bootstrap resamples of the base rows for the intervals.')
+    parser.add_argument('--file_name', dest='file_name', action='store', default='sobol_design',
+                        help='Saved design and evaluations, resumed when present.')
+
+    args = parser.parse_args()
+
+    executor = GridExecutor(VARIANTS[args.model], steps=args.steps, lf=args.lf, num_samples=args.num_samples,
+                            sampling=args.sampling, seed=stored_seed(args.file_name, args.seed),
+                            workers=args.workers, points_per_batch=args.points_per_batch)
+    analysis = SobolAnalysis(executor, parameters=args.parameters, decades=args.decades, num_base=args.num_base,
+                             design=args.design, file_name=args.file_name)
+    try:
+        analysis.run(chunk_size=args.chunk_size)
+    finally:
+        executor.close()
+    analysis.write_results(num_bootstrap=args.num_bootstrap)
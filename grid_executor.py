@@ -0,0 +1,218 @@
+'''Capacity over a grid of rate constants, computed in one process tree. The network is built once (per worker) and
+each grid point only overrides parameter values through param_values; the self and self-with-foreign outputs of
+several points are solved together in one batched pass over shared ligand samples. Capacities, mean outputs and the
+outputs of every point are written to one .npz instead of a job, directory and parameters.pickle per point and input.'''
+
+import argparse
+import warnings
+from multiprocessing import Pool
+
+import numpy as np
+
+from channel_capacity import histogram_capacity
+from ligand_sampler import LigandSampler, SAMPLING_METHODS
+from step_sweep import VARIANTS
+from pysb_t_cell_network import PysbTcrSelfWithForeign
+from simulation_parameters import DEFAULT_BOUNDS, PARAMETER_ALIASES
+
+
+def solve_points(tcr, observables, ligands, points, **options):
+    '''Final self and self-with-foreign outputs, each with shape (n_points, n_samples), of a self_foreign model
+    instance for every grid point (a dict of parameter values; the network's value is used for names it leaves
+    out). options are passed to solve_samples.'''
+    n = len(ligands)
+    defaults = dict(tcr.network['parameters'])
+    names = sorted(set().union(*points))
+    # solve_paired stacks all self runs before all self-with-foreign runs, each as n samples per point
+    param_values = dict((name, np.tile(np.repeat([point.get(name, defaults[name]) for point in points], n), 2))
+                        for name in names)
+    self_output, foreign_output, settling_time = tcr.solve_paired(np.tile(ligands, len(points)), observables,
+                                                                  param_values=param_values, **options)
+    return self_output[:, -1].reshape(len(points), n), foreign_output[:, -1].reshape(len(points), n)
+
+
+# Per-process state of the grid workers: the model is built once when the worker starts and reused for every chunk.
+worker_model = None
+worker_observables = None
+
+
+def initialise_worker(model_class, kwargs, ligands):
+    global worker_model, worker_observables
+    worker_model = model_class(**kwargs)
+    worker_model.p_ligand = ligands
+    worker_observables = worker_model.build_network()
+    worker_model.build_simulator(batched=True)
+
+
+def solve_chunk(arguments):
+    points, options = arguments
+    return solve_points(worker_model, worker_observables, worker_model.p_ligand, points, **options)
+
+
+class GridExecutor(object):
+    def __init__(self, model_class=PysbTcrSelfWithForeign, steps=8, lf=30, num_samples=1000, sampling='random',
+                 seed=None, mu=6, sigma=1.0, workers=1, points_per_batch=1):
+        '''Grid points are split into chunks of points_per_batch, each solved as one batched pass; with workers > 1
+        the chunks are spread over a process pool that lives until close().'''
+        self.model_class = model_class
+        self.steps = steps
+        self.lf = lf
+        self.workers = workers
+        self.points_per_batch = points_per_batch
+
+        self.mu = mu
+        self.sigma = sigma
+        self.sampling = sampling
+        self.seed = np.random.randint(2 ** 31 - 1) if seed is None else seed
+        self.p_ligand, self.weights = LigandSampler(mu, sigma, method=sampling, seed=self.seed).sample(num_samples)
+        self.p_ligand = np.asarray(self.p_ligand, dtype=float)
+
+        self.tcr = model_class(steps=steps, self_foreign=True, lf=lf, seed=self.seed, num_samples=num_samples,
+                               sampling=sampling)
+        self.observables = self.tcr.build_network()
+        self.defaults = dict(self.tcr.network['parameters'])
+        self.pool = None
+
+        self.names = []
+        self.values = None
+        self.capacity = None
+        self.self_output = None
+        self.foreign_output = None
+
+    def targets(self, name, aliases=PARAMETER_ALIASES, required=True):
+        '''Parameters of this network that name sets: the ones aliases maps it to, or name itself. Without required,
+        a name that sets none gives an empty list instead of a ValueError.'''
+        targets = [target for target in aliases.get(name, [name]) if target in self.defaults]
+        if not targets and required:
+            raise ValueError("{0} sets no parameter of the {1}-step {2} network".format(
+                name, self.steps, self.model_class.__name__))
+        return targets
+
+    def restrict(self, points):
+        '''points without the parameters this network lacks, with a warning naming them, as the parameters.pickle
+        hook of job submission ignores them; for the built-in grids, which are written for the full network.'''
+        points = list(points)
+        unknown = sorted(set().union(*points) - set(self.defaults))
+        if unknown:
+            warnings.warn("Parameters {0} are not in the {1}-step {2} network and are left out".format(
+                unknown, self.steps, self.model_class.__name__))
+        return [dict((name, value) for name, value in point.items() if name in self.defaults) for point in points]
+
+    def check(self, points):
+        unknown = sorted(set().union(*points) - set(self.defaults))
+        if unknown:
+            raise ValueError("Parameters {0} are not in the {1}-step {2} network".format(
+                unknown, self.steps, self.model_class.__name__))
+
+    def evaluate(self, points, **options):
+        '''Capacity and self and self-with-foreign outputs, with shapes (n_points,) and (n_points, n_samples), of
+        every grid point. options are passed to solve_samples.'''
+        points = list(points)
+        self.check(points)
+        chunks = [points[k:k + self.points_per_batch] for k in range(0, len(points), self.points_per_batch)]
+
+        if self.workers > 1:
+            if self.pool is None:
+                self.pool = Pool(self.workers, initializer=initialise_worker,
+                                 initargs=(self.model_class, self.tcr.init_kwargs, self.p_ligand))
+            results = self.pool.map(solve_chunk, [(chunk, options) for chunk in chunks])
+        else:
+            results = [solve_points(self.tcr, self.observables, self.p_ligand, chunk, **options) for chunk in chunks]
+
+        self_output = np.concatenate([result[0] for result in results])
+        foreign_output = np.concatenate([result[1] for result in results])
+        capacity = np.array([histogram_capacity(foreign_output[k], self_output[k], foreign_weights=self.weights,
+                                                self_weights=self.weights, verbose=False)
+                             for k in range(len(points))])
+        return capacity, self_output, foreign_output
+
+    def run(self, points, **options):
+        points = list(points)
+        self.check(points)
+        self.names = sorted(set().union(*points))
+        self.values = np.array([[point.get(name, self.defaults[name]) for name in self.names] for point in points])
+        self.capacity, self.self_output, self.foreign_output = self.evaluate(points, **options)
+        for point, capacity in zip(points, self.capacity):
+            print("{0}: {1:f}".format(point, capacity))
+        return self.capacity
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def write_results(self, file_name="parameter_grid"):
+        '''Parameter names and values of every point with its capacity, mean outputs and outputs, and the shared
+        samples, in <file_name>.npz.'''
+        np.savez(file_name + ".npz", parameter_names=self.names, parameter_values=self.values,
+                 capacity=self.capacity, mean_self_output=np.average(self.self_output, axis=1, weights=self.weights),
+                 mean_foreign_output=np.average(self.foreign_output, axis=1, weights=self.weights),
+                 self_output=self.self_output, foreign_output=self.foreign_output, steps=self.steps, lf=self.lf,
+                 seed=self.seed, ligands=self.p_ligand, ligand_weights=self.weights)
+
+
+def parameter_bounds(names, targets, defaults, bounds=None, decades=1.0):
+    '''(low, high) of every name, whose network parameters are targets: from bounds (by name or by its first
+    target), then DEFAULT_BOUNDS, else decades either side of the network value in defaults.'''
+    bounds = dict(DEFAULT_BOUNDS, **(bounds or {}))
+    box = []
+    for name, parameters in zip(names, targets):
+        default = defaults[parameters[0]]
+        if name in bounds or parameters[0] in bounds:
+            box.append(bounds.get(name, bounds.get(parameters[0])))
+        elif default > 0:
+            box.append((default * 10 ** -decades, default * 10 ** decades))
+        else:
+            raise ValueError("{0} is 0 by default; give its bounds explicitly".format(name))
+    return box
+
+
+def parse_bounds(items):
+    '''--bounds name low high [name low high ...]'''
+    if len(items) % 3:
+        raise ValueError("Bounds are given as name low high triples")
+    return dict((items[i], (float(items[i + 1]), float(items[i + 2]))) for i in range(0, len(items), 3))
+
+
+def product_grid(axes):
+    '''Every combination of the values in axes, a dict of parameter name to list of values.'''
+    if not axes:
+        return [{}]
+    names = sorted(axes)
+    mesh = np.meshgrid(*[axes[name] for name in names], indexing='ij')
+    return [dict(zip(names, values)) for values in zip(*[axis.ravel().tolist() for axis in mesh])]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Capacity over a product grid of rate constants in one process",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--model', dest='model', action='store', default='tcr', choices=sorted(VARIANTS),
+                        help='Model variant.')
+    parser.add_argument('--steps', dest='steps', action='store', type=int, default=8, help='Number of KP steps.')
+    parser.add_argument('--lf', dest='lf', action='store', type=int, default=30, help='Number of foreign ligands.')
+    parser.add_argument('--seed', dest='seed', action='store', type=int, help='Seed for the ligand samples.')
+    parser.add_argument('--num_samples', dest='num_samples', action='store', type=int, default=1000,
+                        help='Number of ligand samples shared by every grid point.')
+    parser.add_argument('--sampling', dest='sampling', action='store', default='random', choices=SAMPLING_METHODS,
+                        help='Design of the lognormal ligand samples.')
+    parser.add_argument('--parameter', dest='axes', action='append', nargs='+', default=[],
+                        metavar=('NAME', 'VALUE'), help='A grid axis: parameter name followed by its values.')
+    parser.add_argument('--workers', dest='workers', action='store', type=int, default=1,
+                        help='Number of processes the grid points are spread across.')
+    parser.add_argument('--points_per_batch', dest='points_per_batch', action='store', type=int, default=1,
+                        help='Number of grid points solved together in one batched pass.')
+    parser.add_argument('--steady_state', dest='steady_state', action='store_true', default=False,
+                        help='Solve for the steady state directly instead of integrating to run_time.')
+
+    args = parser.parse_args()
+
+    executor = GridExecutor(VARIANTS[args.model], steps=args.steps, lf=args.lf, num_samples=args.num_samples,
+                            sampling=args.sampling, seed=args.seed, workers=args.workers,
+                            points_per_batch=args.points_per_batch)
+    try:
+        executor.run(product_grid(dict((axis[0], [float(value) for value in axis[1:]]) for axis in args.axes)),
+                     steady_state=args.steady_state)
+    finally:
+        executor.close()
+    executor.write_results()
@@ -1,5 +1,6 @@
 import argparse
 
+from ligand_sampler import SAMPLING_METHODS
 from realistic_network import TcrCycleSelfWithForeign, KPRealistic, make_and_cd
 from simulation_parameters import MembraneBindingParameters
 from ssc_tcr_membrane import MembraneSharedCommands
@@ -108,6 +109,8 @@ if __name__ == "__main__":
                         help="flag for submitting Ls calculations.")
     parser.add_argument('--ls_lf', dest='ls_lf', action='store', type=int, default=3,
                         help="number of foreign ligands.")
+    parser.add_argument('--sampling', dest='sampling', action='store', default='random', choices=SAMPLING_METHODS,
+                        help='Design of the lognormal ligand samples; weights are written to ligand_weights.')
     args = parser.parse_args()
 
     directory_name = "{0}_step".format(args.steps)
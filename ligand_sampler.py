@@ -0,0 +1,51 @@
+'''Samples of the lognormal ligand input. Besides plain random draws the sampler supports designs that estimate the
+output distribution with fewer simulations: low-discrepancy sequences (Sobol, Halton), one draw per equal-probability
+stratum, antithetic pairs, and an importance design spread evenly in log(dose) whose samples carry the lognormal
+density as weights.'''
+
+import numpy as np
+from scipy.stats import norm, qmc
+
+SAMPLING_METHODS = ('random', 'sobol', 'halton', 'stratified', 'antithetic', 'importance')
+
+
+class LigandSampler(object):
+    def __init__(self, mu=6.0, sigma=1.0, method='random', seed=None, width=4.0):
+        '''width is the half-width, in units of sigma, of the log(dose) range covered by the importance design.'''
+        if method not in SAMPLING_METHODS:
+            raise ValueError("Unknown sampling method {0}; expected one of {1}".format(method, SAMPLING_METHODS))
+
+        self.mu = mu
+        self.sigma = sigma
+        self.method = method
+        self.seed = seed
+        self.width = width
+
+    def uniforms(self, num_samples):
+        random_state = np.random.RandomState(self.seed)
+
+        if self.method == 'sobol':
+            return qmc.Sobol(d=1, seed=self.seed).random(num_samples)[:, 0]
+        elif self.method == 'halton':
+            return qmc.Halton(d=1, seed=self.seed).random(num_samples)[:, 0]
+        elif self.method == 'antithetic':
+            half = random_state.uniform(size=(num_samples + 1) // 2)
+            return np.concatenate([half, 1.0 - half])[:num_samples]
+        else:
+            return (np.arange(num_samples) + random_state.uniform(size=num_samples)) / num_samples
+
+    def sample(self, num_samples):
+        '''Returns the ligand numbers, rounded to integers, and their weights, which sum to one.'''
+        if self.method == 'random':
+            ligands = np.random.RandomState(self.seed).lognormal(self.mu, self.sigma, num_samples)
+            weights = np.full(num_samples, 1.0 / num_samples)
+        elif self.method == 'importance':
+            log_ligands = self.mu + self.sigma * self.width * (2 * self.uniforms(num_samples) - 1)
+            ligands = np.exp(log_ligands)
+            weights = norm.pdf(log_ligands, self.mu, self.sigma)
+            weights /= weights.sum()
+        else:
+            ligands = np.exp(self.mu + self.sigma * norm.ppf(self.uniforms(num_samples)))
+            weights = np.full(num_samples, 1.0 / num_samples)
+
+        return [int(i) for i in np.round(ligands)], weights
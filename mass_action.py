@@ -0,0 +1,116 @@
+'''Mass-action kinetics evaluated from index arrays. Every reaction rate of a generated network is a monomial
+c * prod(parameters ** p) * prod(species ** order); the network is compiled once into padded index arrays so that the
+RHS is S . (k * prod(x[reactants])) and the Jacobian non-zeros are one sparse product, for a whole
+(n_species x n_samples) state array at a time.'''
+
+import numpy as np
+import sympy
+from scipy.sparse import csr_matrix
+
+
+def monomial(rate, species_symbols, parameter_symbols):
+    '''Splits a rate expression into its constant, {parameter: power} and {species: order}; raises ValueError when it
+    is not a mass-action monomial.'''
+    coefficient, factors = sympy.sympify(rate).as_coeff_Mul()
+    parameters = {}
+    species = {}
+    for base, power in factors.as_powers_dict().items():
+        if base in species_symbols and power.is_Integer and power > 0:
+            species[species_symbols[base]] = int(power)
+        elif base in parameter_symbols and power.is_number:
+            parameters[parameter_symbols[base]] = float(power)
+        elif base.is_number:
+            coefficient *= base ** power
+        else:
+            raise ValueError("Rate {0} is not mass action".format(rate))
+    return float(coefficient), parameters, species
+
+
+class MassActionKinetics(object):
+    def __init__(self, network):
+        num_species = len(network['species'])
+        parameter_names = [name for name, value in network['parameters']]
+        species_symbols = dict((sympy.Symbol("__s{0}".format(i)), i) for i in range(num_species))
+        parameter_symbols = dict((sympy.Symbol(name), j) for j, name in enumerate(parameter_names))
+
+        terms = [monomial(reaction['rate'], species_symbols, parameter_symbols) for reaction in network['reactions']]
+        num_reactions = len(terms)
+
+        # Reactant slots, with a species repeated once per order; the padding index points at a row of ones.
+        slots = [sum(([i] * order for i, order in sorted(species.items())), []) for c, p, species in terms]
+        width = max([len(s) for s in slots] + [1])
+        self.reactants = np.full((width, num_reactions), num_species, dtype=int)
+        for k, s in enumerate(slots):
+            self.reactants[:len(s), k] = s
+
+        factors = max([len(p) for c, p, s in terms] + [1])
+        self.parameters = np.full((factors, num_reactions), len(parameter_names), dtype=int)
+        self.powers = np.zeros((factors, num_reactions))
+        for k, (c, p, s) in enumerate(terms):
+            for f, (j, power) in enumerate(sorted(p.items())):
+                self.parameters[f, k] = j
+                self.powers[f, k] = power
+        self.coefficients = np.array([c for c, p, s in terms])
+        # Unit powers (the usual case) are multiplied in directly.
+        self.integer_powers = [np.all((self.powers[f] == 1) | (self.parameters[f] == len(parameter_names)))
+                               for f in range(factors)]
+        self.cached_values = None
+        self.cached_constants = None
+
+        self.stoichiometry = csr_matrix(network['stoichiometry'])
+
+        # d(rate k)/d(slot s) scattered onto the Jacobian non-zeros: entry (i, j) collects S[i, k] for every slot of
+        # reaction k holding species j. Entries missing from the pattern cancel exactly and are left out.
+        position = dict(((i, j), e) for e, (i, j) in enumerate(zip(network['jacobian_rows'],
+                                                                   network['jacobian_columns'])))
+        stoichiometry = network['stoichiometry']
+        rows, columns, data = [], [], []
+        for s in range(width):
+            for k in range(num_reactions):
+                j = self.reactants[s, k]
+                if j == num_species:
+                    continue
+                for i in np.flatnonzero(stoichiometry[:, k]):
+                    if (i, j) in position:
+                        rows.append(position[(i, j)])
+                        columns.append(s * num_reactions + k)
+                        data.append(stoichiometry[i, k])
+        self.jacobian_map = csr_matrix((data, (rows, columns)), shape=(len(position), width * num_reactions))
+
+    def rate_constants(self, values):
+        '''Per-reaction rate constants with shape (n_reactions, n_samples) from the per-parameter value arrays. The
+        integrators call this with the same values list at every step, so the last result is kept.'''
+        if self.cached_values is not values:
+            parameters = np.vstack(values + [np.ones_like(values[0])])
+            k = np.repeat(self.coefficients[:, None], len(values[0]), axis=1)
+            for f in range(self.parameters.shape[0]):
+                factor = parameters[self.parameters[f]]
+                k *= factor if self.integer_powers[f] else factor ** self.powers[f][:, None]
+            self.cached_values, self.cached_constants = values, k
+        return self.cached_constants
+
+    def reactant_amounts(self, y):
+        '''Amount in each reactant slot, with shape (n_slots, n_reactions, n_samples).'''
+        return np.vstack([y, np.ones((1, y.shape[1]))])[self.reactants]
+
+    def rates(self, y, values):
+        x = self.reactant_amounts(y)
+        rates = self.rate_constants(values) * x[0]
+        for s in range(1, x.shape[0]):
+            rates *= x[s]
+        return rates
+
+    def rhs(self, y, values):
+        return self.stoichiometry.dot(self.rates(y, values))
+
+    def jacobian_data(self, y, values):
+        '''Values of the Jacobian non-zeros, in the order of the network's jacobian_rows/columns.'''
+        x = self.reactant_amounts(y)
+        k = self.rate_constants(values)
+        derivatives = np.empty(x.shape)
+        for s in range(x.shape[0]):
+            derivatives[s] = k
+            for other in range(x.shape[0]):
+                if other != s:
+                    derivatives[s] *= x[other]
+        return self.jacobian_map.dot(derivatives.reshape(-1, y.shape[1]))
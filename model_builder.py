@@ -0,0 +1,41 @@
+'''Explicit construction of PySB models. Components are created with _export=False, added to self.model and looked up
+by name on it, so no module globals are involved and several model variants can be built side by side in one
+process.'''
+
+from pysb import Initial, Model, Monomer, Observable, Parameter, Rule
+
+
+class ModelBuilder(object):
+    def new_model(self):
+        return Model(name=type(self).__name__, _export=False)
+
+    def pattern(self, species):
+        return self.model.monomers[species]()
+
+    def add_monomer(self, name):
+        monomer = Monomer(name, _export=False)
+        self.model.add_component(monomer)
+        return monomer
+
+    def add_parameter(self, name, value):
+        parameter = Parameter(name, value, _export=False)
+        self.model.add_component(parameter)
+        return parameter
+
+    def add_initial(self, species, parameter):
+        self.model.add_initial(Initial(self.pattern(species), self.model.parameters[parameter], _export=False))
+
+    def add_rule(self, name, rule_expression, *rates):
+        '''rates are parameter names: the forward rate and, for reversible rules, the reverse rate.'''
+        rule = Rule(name, rule_expression, *[self.model.parameters[rate] for rate in rates], _export=False)
+        self.model.add_component(rule)
+        return rule
+
+    def add_observable(self, species):
+        self.model.add_component(Observable("O_{0}".format(species), self.pattern(species), _export=False))
+
+    def add_new_monomer(self, product):
+        if product not in self.model.monomers.keys():
+            self.add_monomer(product)
+            self.add_parameter(product + "_0", 0)
+            self.add_initial(product, product + "_0")
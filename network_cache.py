@@ -0,0 +1,94 @@
+'''On-disk cache of expanded reaction networks. A network is stored under a hash of everything that determines it:
+the model class, its constructor arguments, the contents of parameters.pickle and the source of the modules that define
+the model. Jobs that build the same variant reuse the stored description instead of rebuilding and expanding the
+model.'''
+
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import sys
+import tempfile
+
+from ode_simulator import describe_network
+
+PROJECT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+# Jobs run from their own directories, so the default is next to the modules rather than relative to the cwd.
+CACHE_DIRECTORY = os.environ.get("NETWORK_CACHE_DIR", os.path.join(PROJECT_DIRECTORY, "network_cache"))
+# Modules every model's network depends on besides the ones defining its class: the rule and parameter helpers and
+# describe_network.
+MODEL_MODULES = ("model_builder", "simulation_parameters", "ode_simulator")
+# Constructor arguments that only set the ligand sample design, not the network
+SAMPLING_KWARGS = ("num_samples", "sampling")
+
+
+def source_files(owner):
+    '''Project source files that define owner's model: the modules of its class and base classes and MODEL_MODULES.'''
+    modules = [sys.modules[cls.__module__] for cls in type(owner).__mro__] + \
+        [sys.modules[name] for name in MODEL_MODULES if name in sys.modules]
+    paths = set()
+    for module in modules:
+        try:
+            path = os.path.abspath(inspect.getsourcefile(module))
+        except TypeError:
+            continue
+        if os.path.dirname(path) == PROJECT_DIRECTORY:
+            paths.add(path)
+    return sorted(paths)
+
+
+def source_hash(owner):
+    digest = hashlib.sha256()
+    for path in source_files(owner):
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def network_key(owner):
+    parameters = sorted(owner.parameters.items()) if getattr(owner, 'p_flag', False) else None
+    init_kwargs = sorted((name, value) for name, value in getattr(owner, 'init_kwargs', {}).items()
+                         if name not in SAMPLING_KWARGS)
+    description = repr((type(owner).__module__, type(owner).__name__, init_kwargs, parameters,
+                        source_hash(owner)))
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+def cached_network(owner, directory=CACHE_DIRECTORY):
+    '''Returns the network description for owner, building it with owner.make_model() and storing it on a miss.'''
+    path = os.path.join(directory, network_key(owner) + ".pickle")
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    outputs = owner.make_model()
+    network = describe_network(owner.model, outputs)
+
+    write_atomically(path, pickle.dumps(network, protocol=pickle.HIGHEST_PROTOCOL))
+
+    return network
+
+
+def write_atomically(path, data, mode="wb"):
+    '''Array jobs may write the same entry at the same time: write to a private file and rename it into place.'''
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handle, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(handle, mode) as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+def solver_settings(owner, batched=False, directory=CACHE_DIRECTORY):
+    '''OdeSimulator keyword arguments stored for owner's variant by solver_selection.py, for batched sweeps or for
+    samples solved one at a time, or {} for the defaults.'''
+    path = os.path.join(directory, network_key(owner) + ".solver.json")
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f).get('batch' if batched else 'single', {})
+    return {}
+
+
+def store_solver_settings(owner, settings, directory=CACHE_DIRECTORY):
+    '''settings maps 'single' and 'batch' to OdeSimulator keyword arguments.'''
+    write_atomically(os.path.join(directory, network_key(owner) + ".solver.json"), json.dumps(settings), mode="w")
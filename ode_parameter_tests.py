@@ -7,8 +7,11 @@ import subprocess
 import numpy as np
 import pandas as pd
 
+from grid_executor import GridExecutor
+from pysb_t_cell_network import PysbTcrSelfWithForeign
 from realistic_network import make_and_cd
 from simulation_parameters import BindingParameters
+from step_sweep import VARIANTS
 
 
 class ParameterTesting(object):
@@ -78,61 +81,48 @@ class ParameterTesting(object):
         self.make_launch_simulations(param_grid)
         os.chdir(self.home_directory)
 
-    def run_neg_fb_parameter_search(self):
-        count = 0
-
-        on_rates = [0.5, 1.0, 2.0, 3.0, 5.0]
-        negative_fb = [0.0, 0.001, 0.01, 0.05, 0.1]
-
-        param_grid = {}
-
-        for on_rate in on_rates:
-            param_grid['k_lck_on_RL'] = on_rate / self.binding_constants.initial.lck_0
-            param_grid['k_p_on_R_pmhc'] = on_rate
-            param_grid['k_zap_on_R_pmhc'] = on_rate / self.binding_constants.initial.zap_0
-            param_grid['k_p_on_zap_species'] = on_rate
-            param_grid['k_lat_on_species'] = on_rate / self.binding_constants.initial.lat_0
-            param_grid['kp_on_lat1'] = on_rate
-            param_grid['k_p_lat_on_species'] = on_rate / 10.0
-
-            for i in negative_fb:
-                param_grid['k_neg_fb'] = i
-                param_grid['k_lcki'] = 0.01
-                self.create_submit(count, param_grid)
-
-                count += 1
-
-        df = pd.DataFrame({'file_path': self.paths})
-        df.to_csv("./file_paths", sep='\t')
-
-        df_2 = pd.DataFrame({'file_path': self.paths, 'parameters': self.parameters})
-        df_2.to_csv("./parameters", sep='\t')
-
-        pickle_out = open("parameter_range.pickle", "wb")
-        pickle.dump(param_grid, pickle_out)
-        pickle_out.close()
-
-    def run_real_neg_fb_parameter_search(self):
-        count = 0
-
-        on_rates = [0.5, 1.0, 2.0, 3.0, 5.0]
-        negative_fb = [0.01, 0.005, 0.001, 0.0005, 0.0001]
-        param_grid = {}
-
-        for on_rate in on_rates:
-            param_grid['k_lck_on_RL'] = on_rate / self.binding_constants.initial.lck_0
-            param_grid['k_p_on_R_pmhc'] = on_rate
-            param_grid['k_zap_on_R_pmhc'] = on_rate / self.binding_constants.initial.zap_0
-            param_grid['k_p_on_zap_species'] = on_rate
-            param_grid['k_lat_on_species'] = on_rate / self.binding_constants.initial.lat_0
-            param_grid['kp_on_lat1'] = on_rate
-            param_grid['k_p_lat_on_species'] = on_rate / 10.0
-
-            for i in negative_fb:
-                param_grid['k_lcki'] = i
-                self.create_submit(count, param_grid)
+    def on_rate_parameters(self, on_rate):
+        return {'k_lck_on_RL': on_rate / self.binding_constants.initial.lck_0,
+                'k_p_on_R_pmhc': on_rate,
+                'k_zap_on_R_pmhc': on_rate / self.binding_constants.initial.zap_0,
+                'k_p_on_zap_species': on_rate,
+                'k_lat_on_species': on_rate / self.binding_constants.initial.lat_0,
+                'kp_on_lat1': on_rate}
+
+    def neg_fb_grid(self):
+        grid = []
+        for on_rate in [0.5, 1.0, 2.0, 3.0, 5.0]:
+            for i in [0.0, 0.001, 0.01, 0.05, 0.1]:
+                point = self.on_rate_parameters(on_rate)
+                point.update({'k_p_lat_on_species': on_rate / 10.0, 'k_neg_fb': i, 'k_lcki': 0.01})
+                grid.append(point)
+        return grid
+
+    def real_neg_fb_grid(self):
+        grid = []
+        for on_rate in [0.5, 1.0, 2.0, 3.0, 5.0]:
+            for i in [0.01, 0.005, 0.001, 0.0005, 0.0001]:
+                point = self.on_rate_parameters(on_rate)
+                point.update({'k_p_lat_on_species': on_rate / 10.0, 'k_lcki': i})
+                grid.append(point)
+        return grid
+
+    def on_rate_grid(self):
+        grid = []
+        for on_rate in np.linspace(0.5, 5.0, 10).tolist():
+            if self.steps > 7:
+                for i in [1.0, 5.0, 10.0, 50.0, 100.0]:
+                    point = self.on_rate_parameters(on_rate)
+                    point['kp_on_lat2'] = on_rate / i
+                    grid.append(point)
+            else:
+                grid.append(self.on_rate_parameters(on_rate))
+        return grid
 
-                count += 1
+    def submit(self, grid):
+        '''One directory, parameters.pickle and qsub job per grid point and input, for runs on the cluster.'''
+        for count, param_grid in enumerate(grid):
+            self.create_submit(count, param_grid)
 
         df = pd.DataFrame({'file_path': self.paths})
         df.to_csv("./file_paths", sep='\t')
@@ -141,44 +131,29 @@ class ParameterTesting(object):
         df_2.to_csv("./parameters", sep='\t')
 
         pickle_out = open("parameter_range.pickle", "wb")
-        pickle.dump(param_grid, pickle_out)
+        pickle.dump(grid, pickle_out)
         pickle_out.close()
 
     def run_parameter_search(self):
-        count = 0
-
-        on_rates = np.linspace(0.5, 5.0, 10)
-        discount = [1.0, 5.0, 10.0, 50.0, 100.0]
-
-        param_grid = {}
-
-        for on_rate in on_rates:
-            param_grid['k_lck_on_RL'] = on_rate / self.binding_constants.initial.lck_0
-            param_grid['k_p_on_R_pmhc'] = on_rate
-            param_grid['k_zap_on_R_pmhc'] = on_rate / self.binding_constants.initial.zap_0
-            param_grid['k_p_on_zap_species'] = on_rate
-            param_grid['k_lat_on_species'] = on_rate / self.binding_constants.initial.lat_0
-            param_grid['kp_on_lat1'] = on_rate
-
-            if self.steps > 7:
-                for i in discount:
-                    param_grid['kp_on_lat2'] = on_rate / i
-                    self.create_submit(count, param_grid)
-
-                    count += 1
-            else:
-                self.create_submit(count, param_grid)
-                count += 1
-
-        df = pd.DataFrame({'file_path': self.paths})
-        df.to_csv("./file_paths", sep='\t')
+        self.submit(self.on_rate_grid())
 
-        df_2 = pd.DataFrame({'file_path': self.paths, 'parameters': self.parameters})
-        df_2.to_csv("./parameters", sep='\t')
+    def run_neg_fb_parameter_search(self):
+        self.submit(self.neg_fb_grid())
 
-        pickle_out = open("parameter_range.pickle", "wb")
-        pickle.dump(param_grid, pickle_out)
-        pickle_out.close()
+    def run_real_neg_fb_parameter_search(self):
+        self.submit(self.real_neg_fb_grid())
+
+    def execute(self, grid, model_class=PysbTcrSelfWithForeign, file_name="parameter_grid", **kwargs):
+        '''Solves every grid point in this process (or its worker pool) with GridExecutor and writes
+        <file_name>.npz. Like parameters.pickle for submitted jobs, parameters the network lacks are left out (with a
+        warning). kwargs are passed to GridExecutor.'''
+        executor = GridExecutor(model_class, steps=self.steps, lf=self.lf, **kwargs)
+        try:
+            executor.run(executor.restrict(grid))
+        finally:
+            executor.close()
+        executor.write_results(file_name)
+        return executor
 
     # def run_tests(self):
     #     paths = []
@@ -210,14 +185,35 @@ class ParameterTesting(object):
 
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Submitting ode calculations as function of steps",
+    parser = argparse.ArgumentParser(description="Capacity over parameter grids, as one job per point or in-process",
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument('--steps', dest='steps', action='store', type=int, default=8, help="number of KP steps.")
-    parser.add_argument('--run', action='store_true', default=False, help='Flag for submitting simulations.')
     parser.add_argument('--lf', dest='lf', action='store', type=int, default=10, help="number of foreign ligands.")
+    parser.add_argument('--grid', dest='grid', action='store', default='real_neg_fb',
+                        choices=['neg_fb', 'real_neg_fb', 'on_rates'], help='Parameter grid to evaluate.')
+    parser.add_argument('--model', dest='model', action='store', default='tcr', choices=sorted(VARIANTS),
+                        help='Model variant (on_rates sets kp_on_lat2, which only latpp_ext has).')
+    parser.add_argument('--workers', dest='workers', action='store', type=int, default=1,
+                        help='Number of processes the grid points are spread across.')
+    parser.add_argument('--points_per_batch', dest='points_per_batch', action='store', type=int, default=1,
+                        help='Number of grid points solved together in one batched pass.')
+    parser.add_argument('--num_samples', dest='num_samples', action='store', type=int, default=1000,
+                        help='Number of ligand samples shared by every grid point.')
+    parser.add_argument('--seed', dest='seed', action='store', type=int, help='Seed for the ligand samples.')
+    parser.add_argument('--in_process', dest='in_process', action='store_true', default=False,
+                        help='Solve the grid in this process and write one parameter_grid.npz instead of one '
+                             'directory and job per grid point and input. --model, --workers, --points_per_batch, '
+                             '--num_samples and --seed only apply with it.')
+    parser.add_argument('--run', action='store_true', default=False, help='Flag for submitting simulations.')
 
     args = parser.parse_args()
 
     p_test = ParameterTesting(steps=args.steps, lf=args.lf)
-
-    p_test.run_real_neg_fb_parameter_search()
+    grid = {'neg_fb': p_test.neg_fb_grid, 'real_neg_fb': p_test.real_neg_fb_grid,
+            'on_rates': p_test.on_rate_grid}[args.grid]()
+
+    if args.in_process:
+        p_test.execute(grid, model_class=VARIANTS[args.model], workers=args.workers,
+                       points_per_batch=args.points_per_batch, num_samples=args.num_samples, seed=args.seed)
+    else:
+        p_test.submit(grid)
@@ -0,0 +1,363 @@
+'''Vectorised integration of generated PySB networks. All samples of a sweep are stacked into one block-diagonal
+stiff system and the right-hand side is evaluated over an (n_species x n_samples) state array.'''
+
+import warnings
+from multiprocessing import Pool
+
+import numpy as np
+import sympy
+from pysb.bng import generate_equations
+from pysb.core import as_complex_pattern
+from scipy.integrate import BDF, LSODA, RK23, RK45, DOP853, Radau, solve_ivp
+from scipy.sparse import csr_matrix
+from sympy.printing.numpy import NumPyPrinter
+
+from mass_action import MassActionKinetics
+
+# Output intervals the relative rate must stay below the settling tolerance by default before a sample counts as settled
+SETTLING_INTERVALS = 5
+
+SOLVERS = {'BDF': BDF, 'LSODA': LSODA, 'RK23': RK23, 'RK45': RK45, 'DOP853': DOP853, 'Radau': Radau}
+
+
+class BatchResult(object):
+    def __init__(self, simulator, tspan, species, settling_time=None):
+        self.simulator = simulator
+        self.tspan = tspan
+
+        # species has shape (n_samples, n_times, n_species)
+        self.species = species
+
+        # Time from which each sample stayed at steady state; nan when settling was not monitored, inf when the
+        # sample had not settled by the end of tspan.
+        if settling_time is None:
+            settling_time = np.full(species.shape[0], np.nan)
+        self.settling_time = settling_time
+
+    def observable(self, name):
+        indices, coefficients = self.simulator.observables[name]
+        return np.dot(self.species[:, :, indices], coefficients)
+
+    def sample(self, i):
+        return dict((name, self.observable(name)[i]) for name in self.simulator.observables)
+
+
+def print_expressions(expressions):
+    printer = NumPyPrinter()
+    return [printer.doprint(expression) for expression in expressions]
+
+
+def compile_function(arguments, expressions):
+    '''Compiles printed expressions into a function returning them as a list; the same job sympy.lambdify does,
+    but from source text that can be stored and recompiled without sympy.'''
+    source = "def f({0}):\n    return [{1}]\n".format(", ".join(arguments), ", ".join(expressions))
+    namespace = {'numpy': np}
+    exec(compile(source, "<generated network>", "exec"), namespace)
+    return namespace['f']
+
+
+def describe_network(model, outputs=None):
+    '''Expands the model and reduces it to plain data: species, reactions, stoichiometry, parameter values,
+    initial and observable species, and the printed RHS and analytic Jacobian in terms of __s{i} and the
+    parameter names. outputs is the list make_model returns; model attributes are kept as text for the run
+    records.'''
+    generate_equations(model)
+
+    num_species = len(model.species)
+    species_symbols = [sympy.Symbol("__s{0}".format(i)) for i in range(num_species)]
+    odes = list(model.odes)
+
+    stoichiometry = np.zeros((num_species, len(model.reactions)))
+    for k, reaction in enumerate(model.reactions):
+        for i in reaction['reactants']:
+            stoichiometry[i, k] -= 1
+        for i in reaction['products']:
+            stoichiometry[i, k] += 1
+
+    index = dict((symbol, j) for j, symbol in enumerate(species_symbols))
+    jacobian_rows = []
+    jacobian_columns = []
+    derivatives = []
+    for i, ode in enumerate(odes):
+        for j in sorted(index[symbol] for symbol in sympy.sympify(ode).free_symbols if symbol in index):
+            jacobian_rows.append(i)
+            jacobian_columns.append(j)
+            derivatives.append(sympy.diff(ode, species_symbols[j]))
+
+    return {
+        'species': [str(species) for species in model.species],
+        'parameters': [(p.name, p.value) for p in model.parameters],
+        'reactions': [{'reactants': tuple(r['reactants']), 'products': tuple(r['products']), 'rate': str(r['rate'])}
+                      for r in model.reactions],
+        'stoichiometry': stoichiometry,
+        'initials': dict((initial.value.name, model.get_species_index(as_complex_pattern(initial.pattern)))
+                         for initial in model.initials),
+        'observables': dict((observable.name, (np.array(observable.species, dtype=int),
+                                               np.array(observable.coefficients, dtype=float)))
+                            for observable in model.observables),
+        'odes': print_expressions(odes),
+        'jacobian_rows': np.array(jacobian_rows, dtype=int),
+        'jacobian_columns': np.array(jacobian_columns, dtype=int),
+        'jacobian': print_expressions(derivatives),
+        'outputs': outputs,
+        'rules': [str(rule) for rule in model.rules],
+        'model_parameters': [str(p) for p in model.parameters],
+        'model_observables': [str(observable) for observable in model.observables],
+    }
+
+
+class OdeSimulator(object):
+    def __init__(self, model, rtol=1e-6, atol=1e-6, method='BDF', batch_size=None, network=None, backend=None):
+        '''network is a describe_network(...) result, e.g. from the network cache; when given, model is only kept
+        as an identity and is not expanded again. backend 'numpy' evaluates the RHS and Jacobian from mass-action
+        index arrays (MassActionKinetics) and raises ValueError for networks whose rates are not mass-action
+        monomials, 'python' goes through the compiled printed expressions. By default 'numpy' is used where the
+        network allows it, with a warning when it falls back to 'python'.'''
+        if backend not in (None, 'numpy', 'python'):
+            raise ValueError("Unknown backend {0}; expected 'numpy' or 'python'".format(backend))
+
+        if network is None:
+            network = describe_network(model)
+
+        self.model = model
+        self.network = network
+        self.rtol = rtol
+        self.atol = atol
+        self.method = method
+        self.batch_size = batch_size
+
+        self.num_species = len(network['species'])
+        self.parameter_names = [name for name, value in network['parameters']]
+        self.parameter_defaults = np.array([value for name, value in network['parameters']], dtype=float)
+
+        arguments = ["__s{0}".format(i) for i in range(self.num_species)] + self.parameter_names
+        self.odes = network['odes']
+        self.kinetics = compile_function(arguments, self.odes)
+        self.stoichiometry = network['stoichiometry']
+
+        # Analytic Jacobian in CSR order: one compiled derivative per structural non-zero
+        self.jacobian_rows = network['jacobian_rows']
+        self.jacobian_columns = network['jacobian_columns']
+        self.pattern = csr_matrix((np.ones(len(self.jacobian_rows)), (self.jacobian_rows, self.jacobian_columns)),
+                                  shape=(self.num_species, self.num_species))
+        self.jacobian_kinetics = compile_function(arguments, network['jacobian'])
+        self.batch_pattern = {}
+
+        self.initial_species = network['initials']
+        self.observables = network['observables']
+
+        self.mass_action = None
+        if backend != 'python':
+            try:
+                self.mass_action = MassActionKinetics(network)
+            except ValueError as error:
+                if backend == 'numpy':
+                    raise
+                warnings.warn("Using the python backend: {0}".format(error))
+
+    def parameter_values(self, num_samples, param_values=None):
+        values = []
+        for name, default in zip(self.parameter_names, self.parameter_defaults):
+            if param_values and name in param_values:
+                values.append(np.broadcast_to(np.asarray(param_values[name], dtype=float), (num_samples,)))
+            else:
+                values.append(np.full(num_samples, default))
+        return values
+
+    def initial_state(self, values):
+        y0 = np.zeros((len(self.network['species']), len(values[0])))
+        for name, index in self.initial_species.items():
+            y0[index] += values[self.parameter_names.index(name)]
+        return y0
+
+    def rhs(self, y, values):
+        if self.mass_action is not None:
+            return self.mass_action.rhs(y, values)
+        dydt = np.empty_like(y)
+        for i, rate in enumerate(self.kinetics(*(list(y) + values))):
+            dydt[i] = rate
+        return dydt
+
+    def jacobian_data(self, y, values):
+        '''Values of the structural non-zeros of the Jacobian, with shape (nnz, n_samples).'''
+        if self.mass_action is not None:
+            return self.mass_action.jacobian_data(y, values)
+        data = np.empty((len(self.network['jacobian']), y.shape[1]))
+        for k, derivative in enumerate(self.jacobian_kinetics(*(list(y) + values))):
+            data[k] = derivative
+        return data
+
+    def block_diagonal_pattern(self, num_samples):
+        '''CSR layout of the stacked Jacobian for species-major states y[i * num_samples + sample], plus the
+        permutation taking jacobian_data(...).ravel() into that layout.'''
+        if num_samples not in self.batch_pattern:
+            samples = np.arange(num_samples)
+            permutation = []
+            indices = []
+            for i in range(self.num_species):
+                entries = np.arange(self.pattern.indptr[i], self.pattern.indptr[i + 1])
+                permutation.append((entries[None, :] * num_samples + samples[:, None]).ravel())
+                indices.append((self.pattern.indices[entries][None, :] * num_samples + samples[:, None]).ravel())
+
+            row_lengths = np.repeat(np.diff(self.pattern.indptr), num_samples)
+            indptr = np.concatenate([[0], np.cumsum(row_lengths)])
+            self.batch_pattern[num_samples] = (np.concatenate(permutation).astype(int),
+                                               np.concatenate(indices).astype(int), indptr)
+        return self.batch_pattern[num_samples]
+
+    def jacobian(self, y, values):
+        '''Sparse block-diagonal Jacobian of the stacked system.'''
+        num_samples = y.shape[1]
+        permutation, indices, indptr = self.block_diagonal_pattern(num_samples)
+        data = self.jacobian_data(y, values).ravel()[permutation]
+        size = self.num_species * num_samples
+        return csr_matrix((data, indices, indptr), shape=(size, size))
+
+    def integrate(self, tspan, values):
+        num_samples = len(values[0])
+        y0 = self.initial_state(values)
+
+        def f(t, y):
+            return self.rhs(y.reshape(self.num_species, num_samples), values).ravel()
+
+        def jac(t, y):
+            jacobian = self.jacobian(y.reshape(self.num_species, num_samples), values)
+            # LSODA only accepts dense Jacobians
+            return jacobian.toarray() if self.method == 'LSODA' else jacobian
+
+        solution = solve_ivp(f, (tspan[0], tspan[-1]), y0.ravel(), method=self.method, t_eval=tspan,
+                             rtol=self.rtol, atol=self.atol, jac=jac)
+        if not solution.success:
+            raise RuntimeError("Batched integration failed: {0}".format(solution.message))
+
+        return solution.y.reshape(self.num_species, num_samples, len(tspan)).transpose(1, 2, 0)
+
+    def full_species(self, y, values):
+        '''All species from a state of the integrated system, with shape (n_species, n_samples). The state is
+        already complete here; ReducedOdeSimulator reconstructs the species it eliminated.'''
+        return y
+
+    def relative_rate(self, y, values):
+        '''Largest rate of change of any species relative to its own amount, max_i |f_i| / (|y_i| + atol), per
+        sample. Norms over the whole state are dominated by the large receptor, kinase and LAT pools, which settle
+        long before the small downstream species the outputs are read from.'''
+        return np.max(np.abs(self.rhs(y, values)) / (np.abs(y) + self.atol), axis=0)
+
+    def integrate_until_settled(self, tspan, values, tolerance, window):
+        '''Steps the stacked system until every sample has kept its relative rate, times the time left until
+        tspan[-1], below tolerance for window time units. While the rates decay, no species can then change by more
+        than that fraction before tspan[-1]; a bound on the rate alone is not enough, as slow species still move by
+        the rate times their time scale. Output times after the stop are filled with the final, settled state.'''
+        num_samples = len(values[0])
+        y0 = self.initial_state(values)
+
+        def f(t, y):
+            return self.rhs(y.reshape(self.num_species, num_samples), values).ravel()
+
+        def jac(t, y):
+            jacobian = self.jacobian(y.reshape(self.num_species, num_samples), values)
+            # LSODA only accepts dense Jacobians
+            return jacobian.toarray() if self.method == 'LSODA' else jacobian
+
+        solver = SOLVERS[self.method](f, tspan[0], y0.ravel(), tspan[-1], rtol=self.rtol, atol=self.atol, jac=jac)
+        species = np.empty((len(tspan), y0.size))
+        species[0] = y0.ravel()
+        k = 1
+
+        def below(t, y):
+            return self.relative_rate(y.reshape(self.num_species, num_samples), values) * (tspan[-1] - t) < tolerance
+
+        settled_since = np.where(below(tspan[0], y0), tspan[0], np.inf)
+        while solver.status == 'running' and np.any(solver.t - settled_since < window):
+            solver.step()
+            if solver.status == 'failed':
+                raise RuntimeError("Batched integration failed at t = {0}".format(solver.t))
+
+            if k < len(tspan) and tspan[k] <= solver.t:
+                dense = solver.dense_output()
+                while k < len(tspan) and tspan[k] <= solver.t:
+                    species[k] = dense(tspan[k])
+                    k += 1
+
+            settled_since = np.where(below(solver.t, solver.y), np.minimum(settled_since, solver.t), np.inf)
+
+        species[k:] = solver.y
+        settling_time = np.where(solver.t - settled_since >= window, settled_since, np.inf)
+
+        return species.reshape(len(tspan), self.num_species, num_samples).transpose(2, 0, 1), settling_time
+
+    def run(self, tspan, initials=None, param_values=None, num_samples=1, settling_tolerance=None,
+            settling_window=None):
+        '''initials and param_values map parameter names to a scalar or to one value per sample. With a
+        settling_tolerance, integration stops once no species of any sample could still change by more than that
+        fraction before tspan[-1] for settling_window (default: SETTLING_INTERVALS output intervals), and the result
+        records each sample's settling time.'''
+        overrides = dict(param_values or {})
+        overrides.update(initials or {})
+        for value in overrides.values():
+            if np.ndim(value) > 0:
+                num_samples = len(value)
+
+        values = self.parameter_values(num_samples, overrides)
+        # LSODA factorises dense Jacobians, so its samples are integrated one at a time unless batch_size says otherwise
+        batch_size = self.batch_size or (1 if self.method == 'LSODA' else num_samples)
+        tspan = np.asarray(tspan, dtype=float)
+        if settling_window is None:
+            settling_window = min(SETTLING_INTERVALS * (tspan[1] - tspan[0]), tspan[-1] - tspan[0])
+
+        species = []
+        settling_time = []
+        for start in range(0, num_samples, batch_size):
+            batch_values = [v[start:start + batch_size] for v in values]
+            if settling_tolerance is None:
+                species.append(self.integrate(tspan, batch_values))
+                settling_time.append(np.full(len(batch_values[0]), np.nan))
+            else:
+                y, settled = self.integrate_until_settled(tspan, batch_values, settling_tolerance, settling_window)
+                species.append(y)
+                settling_time.append(settled)
+
+        return BatchResult(self, tspan, np.concatenate(species), np.concatenate(settling_time))
+
+
+# Per-process state of the sweep workers: the model is built once when the worker starts and reused for every chunk.
+worker_model = None
+worker_observables = None
+
+
+def initialise_worker(model_class, kwargs):
+    global worker_model, worker_observables
+    worker_model = model_class(**kwargs)
+    worker_observables = worker_model.build_network()
+    worker_model.build_simulator()
+
+
+def solve_chunk(arguments):
+    ligands, kwargs = arguments
+    return worker_model.solve_samples(ligands, worker_observables, **kwargs)
+
+
+def worker_pool(owner, workers):
+    '''A process pool whose workers each rebuild owner's model from owner.init_kwargs, for parallel_sweep calls that
+    share it.'''
+    return Pool(workers, initializer=initialise_worker, initargs=(type(owner), owner.init_kwargs))
+
+
+def parallel_sweep(owner, ligands, workers, pool=None, **kwargs):
+    '''Splits the ligand samples into one chunk per worker and solves them with owner.solve_samples in a process
+    pool. Each worker rebuilds the model from owner.init_kwargs; every array solve_samples returns is concatenated
+    back in the original sample order. A pool from worker_pool is reused and left open; otherwise one is created for
+    this sweep only.'''
+    chunks = np.array_split(np.asarray(ligands, dtype=float), workers)
+    arguments = [(chunk, kwargs) for chunk in chunks if len(chunk)]
+    if pool is not None:
+        results = pool.map(solve_chunk, arguments)
+    else:
+        pool = worker_pool(owner, workers)
+        try:
+            results = pool.map(solve_chunk, arguments)
+        finally:
+            pool.close()
+            pool.join()
+
+    return tuple(np.concatenate(parts) for parts in zip(*results))
@@ -11,59 +11,80 @@ if __name__ == "__main__":
     parser.add_argument('--steps', dest='steps', action='store', type=int, default=8,
                         help="number of KP steps.")
     parser.add_argument('--fb', dest='fb', action='store', type=float)
+    parser.add_argument('--sweep', dest='sweep', action='store',
+                        help="capacity_vs_steps.npz written by step_sweep.py, read instead of the step directories.")
 
     args = parser.parse_args()
     steps = args.steps
     lf = 30
 
-    num_steps = []
-    capacity = []
-    for i in range(1, 9):
-        if i == 5:
-            continue
+    if args.sweep:
+        sweep = np.load(args.sweep)
+        for i, c in zip(sweep['steps'], sweep['capacity']):
+            plt.hist(sweep["foreign_output_{0}".format(i)], bins=100, density=True, weights=sweep['ligand_weights'],
+                     label="Ls_Lf_{0}".format(lf))
+            plt.hist(sweep["self_output_{0}".format(i)], bins=100, density=True, weights=sweep['ligand_weights'],
+                     label="Ls")
+            plt.title("{:.0f} Steps: C = {:.3f}".format(i, c))
+            plt.legend()
+            plt.savefig("{0}_step.pdf".format(i), format="pdf")
+            plt.close()
 
-        if args.fb:
-            file_path = "{0}_step_k_pos_{1}/".format(i, args.fb)
-        else:
-            file_path = "{0}_step/".format(i)
+        plt.plot(sweep['steps'], sweep['capacity'], linestyle='-', marker='o')
+        plt.xlabel("Number of Steps", size=15)
+        plt.ylabel("C (bits)", size=15)
+        plt.ylim(0, 1)
+        plt.savefig("ic_steps.pdf", format="pdf")
+        plt.close()
+    else:
+        num_steps = []
+        capacity = []
+        for i in range(1, 9):
+            if i == 5:
+                continue
 
-        num_steps.append(i)
-        ic_lf = InformationCapacity(foreign_directory=file_path + "Ls_Lf_{0}/".format(lf),
-                                    self_directory=file_path + "Ls/", limiting="self")
+            if args.fb:
+                file_path = "{0}_step_k_pos_{1}/".format(i, args.fb)
+            else:
+                file_path = "{0}_step/".format(i)
 
-        if i == 1:
-            xhi = 1500
-        elif i == 2:
-            xhi = 1000
-        elif i == 3:
-            xhi = 600
-        elif i == 4:
-            xhi = 400
-        # elif i > 8:
-        #     xhi = 30
-        else:
-            xhi = 400
+            num_steps.append(i)
+            ic_lf = InformationCapacity(foreign_directory=file_path + "Ls_Lf_{0}/".format(lf),
+                                        self_directory=file_path + "Ls/", limiting="self")
 
-        plt.xlim(0, xhi)
-        plt.title(
-            "{:.0f} Steps: C = {:.3f}, P_0_integral = {:.3f}".format(steps, ic_lf.capacity, ic_lf.p0_integral))
-        # plt.title("{0} Steps: IC = {1}".format(i, ic_lf.calculate_ic()))
-        plt.legend()
-        plt.savefig(file_path + "{0}_step.pdf".format(i), format="pdf")
-        plt.close()
+            if i == 1:
+                xhi = 1500
+            elif i == 2:
+                xhi = 1000
+            elif i == 3:
+                xhi = 600
+            elif i == 4:
+                xhi = 400
+            # elif i > 8:
+            #     xhi = 30
+            else:
+                xhi = 400
 
-        capacity.append(ic_lf.capacity)
+            plt.xlim(0, xhi)
+            plt.title(
+                "{:.0f} Steps: C = {:.3f}, P_0_integral = {:.3f}".format(steps, ic_lf.capacity, ic_lf.p0_integral))
+            # plt.title("{0} Steps: IC = {1}".format(i, ic_lf.calculate_ic()))
+            plt.legend()
+            plt.savefig(file_path + "{0}_step.pdf".format(i), format="pdf")
+            plt.close()
 
-        plt.plot(num_steps, capacity, linestyle='-', marker='o', label="$k_{on} = 1.0s^{-1}$")
+            capacity.append(ic_lf.capacity)
 
-        plt.legend()
-        plt.xlabel("Number of Steps", size=15)
-        plt.ylabel("C (bits)", size=15)
-        plt.xlim(0, 8)
-        plt.ylim(0, 1)
-        plt.locator_params(axis='x', nbins=11)
-        plt.savefig(file_path + "ic_{0}_step.pdf".format(i), format="pdf")
-        plt.close()
+            plt.plot(num_steps, capacity, linestyle='-', marker='o', label="$k_{on} = 1.0s^{-1}$")
+
+            plt.legend()
+            plt.xlabel("Number of Steps", size=15)
+            plt.ylabel("C (bits)", size=15)
+            plt.xlim(0, 8)
+            plt.ylim(0, 1)
+            plt.locator_params(axis='x', nbins=11)
+            plt.savefig(file_path + "ic_{0}_step.pdf".format(i), format="pdf")
+            plt.close()
 
-    np.savetxt("num_steps", num_steps, fmt='%f')
-    np.savetxt("ic", capacity, fmt='%f')
+        np.savetxt("num_steps", num_steps, fmt='%f')
+        np.savetxt("ic", capacity, fmt='%f')
@@ -1,30 +1,29 @@
 import os
 
 import numpy as np
-from pysb import Parameter, Rule
 from pysb.simulator import BngSimulator
 
-from pysb_t_cell_network import PysbTcrSelfWithForeign, add_observable, write_columns, \
-    write_model_attributes
+from pysb_t_cell_network import PysbTcrSelfWithForeign, write_columns, write_model_attributes
 
 
 class EarlyPositiveFeedback(PysbTcrSelfWithForeign):
-    def __init__(self, steps=8, self_foreign=False, lf=30):
-        PysbTcrSelfWithForeign.__init__(self, steps=steps, self_foreign=self_foreign, lf=lf)
+    def __init__(self, steps=8, self_foreign=False, lf=30, seed=None, num_samples=1000, sampling='random'):
+        PysbTcrSelfWithForeign.__init__(self, steps=steps, self_foreign=self_foreign, lf=lf, seed=seed,
+                                        num_samples=num_samples, sampling=sampling)
 
     def cycle_4(self, i):
 
         if i == "Ls":
-            Parameter('k_p_on_zap_species', self.rate_constants.k_p_on_zap_species)
-            Parameter('k_p_off_zap_species', self.rate_constants.k_p_off_zap_species)
+            self.add_parameter('k_p_on_zap_species', self.rate_constants.k_p_on_zap_species)
+            self.add_parameter('k_p_off_zap_species', self.rate_constants.k_p_off_zap_species)
 
         previous_product = self.cycle_3(i)
         product = "RP{0}_Lck_Zap_P".format(i)
         self.add_new_monomer(product)
 
-        Rule('{0}_cat'.format(product), eval('{0}()'.format(previous_product)) | eval('{0}()'.format(product)),
-             k_p_on_zap_species, k_p_off_zap_species)
-        add_observable(product)
+        self.add_rule('{0}_cat'.format(product), self.pattern(previous_product) | self.pattern(product),
+                      'k_p_on_zap_species', 'k_p_off_zap_species')
+        self.add_observable(product)
 
         no_ligand = self.unbind_ligand(i, product)
 
@@ -38,17 +37,17 @@ class EarlyPositiveFeedback(PysbTcrSelfWithForeign):
 
         if i == "Ls":
             self.model.parameters['Sos_0'].value = 2000
-            Parameter('k_sos_on', 0.0002 / 4)
-            Parameter('k_sos_off', 0.005)
+            self.add_parameter('k_sos_on', 0.0002 / 4)
+            self.add_parameter('k_sos_off', 0.005)
 
         previous_product = self.cycle_4(i)
         product = previous_product + "_Sos"
         self.add_new_monomer(product)
 
-        Rule("{0}_bind".format(product),
-             eval('{0}()'.format(previous_product)) + Sos() | eval('{0}()'.format(product)),
-             k_sos_on, k_sos_off)
-        add_observable(product)
+        self.add_rule("{0}_bind".format(product),
+                      self.pattern(previous_product) + self.pattern('Sos') | self.pattern(product),
+                      'k_sos_on', 'k_sos_off')
+        self.add_observable(product)
 
         return product
 
@@ -57,26 +56,26 @@ class EarlyPositiveFeedback(PysbTcrSelfWithForeign):
         product_rd = previous_product + "_Ras_GDP"
 
         if i == "Ls":
-            Parameter('k_sos_on_rgdp', 0.0024)
-            Parameter('k_sos_off_rgdp', 3.0)
+            self.add_parameter('k_sos_on_rgdp', 0.0024)
+            self.add_parameter('k_sos_off_rgdp', 3.0)
 
         self.add_new_monomer(product_rd)
 
-        Rule('{0}_bind'.format(product_rd),
-             eval('{0}()'.format(previous_product)) + Ras_GDP() | eval('{0}()'.format(product_rd)),
-             k_sos_on_rgdp, k_sos_off_rgdp)
+        self.add_rule('{0}_bind'.format(product_rd),
+                      self.pattern(previous_product) + self.pattern('Ras_GDP') | self.pattern(product_rd),
+                      'k_sos_on_rgdp', 'k_sos_off_rgdp')
 
         product_rt = previous_product + "_Ras_GTP"
 
         if i == "Ls":
-            Parameter('k_sos_on_rgtp', 0.0022)
-            Parameter('k_sos_off_rgtp', 0.4)
+            self.add_parameter('k_sos_on_rgtp', 0.0022)
+            self.add_parameter('k_sos_off_rgtp', 0.4)
 
         self.add_new_monomer(product_rt)
 
-        Rule('{0}_bind'.format(product_rt),
-             eval('{0}()'.format(previous_product)) + Ras_GTP() | eval('{0}()'.format(product_rt)),
-             k_sos_on_rgtp, k_sos_off_rgtp)
+        self.add_rule('{0}_bind'.format(product_rt),
+                      self.pattern(previous_product) + self.pattern('Ras_GTP') | self.pattern(product_rt),
+                      'k_sos_on_rgtp', 'k_sos_off_rgtp')
 
         return product_rd, product_rt
 
@@ -85,36 +84,36 @@ class EarlyPositiveFeedback(PysbTcrSelfWithForeign):
         product_rt_rd = previous_product_rt + "_Ras_GDP"
 
         if i == "Ls":
-            Parameter('k_rgdp_on_sos_rgtp', 0.001)
-            Parameter('k_rgdp_off_sos_rgtp', 0.1)
-            Parameter('k_cat_3', 0.038 * 1.7)
+            self.add_parameter('k_rgdp_on_sos_rgtp', 0.001)
+            self.add_parameter('k_rgdp_off_sos_rgtp', 0.1)
+            self.add_parameter('k_cat_3', 0.038 * 1.7)
 
         self.add_new_monomer(product_rt_rd)
 
-        Rule('{0}_bind'.format(product_rt_rd),
-             eval('{0}()'.format(previous_product_rt)) + Ras_GDP() | eval('{0}()'.format(product_rt_rd)),
-             k_rgdp_on_sos_rgtp, k_rgdp_off_sos_rgtp)
+        self.add_rule('{0}_bind'.format(product_rt_rd),
+                      self.pattern(previous_product_rt) + self.pattern('Ras_GDP') | self.pattern(product_rt_rd),
+                      'k_rgdp_on_sos_rgtp', 'k_rgdp_off_sos_rgtp')
 
-        Rule('{0}_cat'.format(product_rt_rd),
-             eval('{0}()'.format(product_rt_rd)) >> eval('{0}()'.format(previous_product_rt)) + Ras_GTP(),
-             k_cat_3)
+        self.add_rule('{0}_cat'.format(product_rt_rd),
+                      self.pattern(product_rt_rd) >> self.pattern(previous_product_rt) + self.pattern('Ras_GTP'),
+                      'k_cat_3')
 
         product_rd_rd = previous_product_rd + "_Ras_GDP"
 
         if i == "Ls":
-            Parameter('k_rgdp_on_sos_rgdp', 0.0014)
-            Parameter('k_rgdp_off_sos_rgdp', 1.0)
-            Parameter('k_cat_4', 0.003)
+            self.add_parameter('k_rgdp_on_sos_rgdp', 0.0014)
+            self.add_parameter('k_rgdp_off_sos_rgdp', 1.0)
+            self.add_parameter('k_cat_4', 0.003)
 
         self.add_new_monomer(product_rd_rd)
 
-        Rule('{0}_bind'.format(product_rd_rd),
-             eval('{0}()'.format(previous_product_rd)) + Ras_GDP() | eval('{0}()'.format(product_rd_rd)),
-             k_rgdp_on_sos_rgdp, k_rgdp_off_sos_rgdp)
+        self.add_rule('{0}_bind'.format(product_rd_rd),
+                      self.pattern(previous_product_rd) + self.pattern('Ras_GDP') | self.pattern(product_rd_rd),
+                      'k_rgdp_on_sos_rgdp', 'k_rgdp_off_sos_rgdp')
 
-        Rule('{0}_cat'.format(product_rd_rd),
-             eval('{0}()'.format(product_rd_rd)) >> eval('{0}()'.format(previous_product_rd)) + Ras_GTP(),
-             k_cat_4)
+        self.add_rule('{0}_cat'.format(product_rd_rd),
+                      self.pattern(product_rd_rd) >> self.pattern(previous_product_rd) + self.pattern('Ras_GTP'),
+                      'k_cat_4')
 
         # Deactivate - convert Ras_GTP to Ras_GDP
 
@@ -122,23 +121,23 @@ class EarlyPositiveFeedback(PysbTcrSelfWithForeign):
         new_product = "Ras_GTP"
 
         if i == "Ls":
-            Parameter('k_rgap_on_rgtp', 0.0348)
-            Parameter('k_rgap_off_rgtp', 0.2)
-            Parameter('k_cat_5', 0.1)
+            self.add_parameter('k_rgap_on_rgtp', 0.0348)
+            self.add_parameter('k_rgap_off_rgtp', 0.2)
+            self.add_parameter('k_cat_5', 0.1)
 
             self.add_new_monomer(product)
 
-            Rule('{0}_bind'.format(product),
-                 Ras_GAP() + Ras_GTP() | eval('{0}()'.format(product)),
-                 k_rgap_on_rgtp, k_rgap_off_rgtp)
+            self.add_rule('{0}_bind'.format(product),
+                          self.pattern('Ras_GAP') + self.pattern('Ras_GTP') | self.pattern(product),
+                          'k_rgap_on_rgtp', 'k_rgap_off_rgtp')
 
-            add_observable(product)
+            self.add_observable(product)
 
-            Rule('{0}_cat'.format(product),
-                 eval('{0}()'.format(product)) >> Ras_GAP() + Ras_GDP(),
-                 k_cat_5)
+            self.add_rule('{0}_cat'.format(product),
+                          self.pattern(product) >> self.pattern('Ras_GAP') + self.pattern('Ras_GDP'),
+                          'k_cat_5')
 
-            add_observable(new_product)
+            self.add_observable(new_product)
 
         return new_product
 
@@ -215,18 +214,19 @@ class PysbStochasticSimulations(PysbTcrSelfWithForeign):
 
 
 class PysbTcrCubicFbLoop(PysbTcrSelfWithForeign):
-    def __init__(self, steps=8, self_foreign=False, lf=30):
-        PysbTcrSelfWithForeign.__init__(self, steps=steps, self_foreign=self_foreign, lf=lf)
+    def __init__(self, steps=8, self_foreign=False, lf=30, seed=None, num_samples=1000, sampling='random'):
+        PysbTcrSelfWithForeign.__init__(self, steps=steps, self_foreign=self_foreign, lf=lf, seed=seed,
+                                        num_samples=num_samples, sampling=sampling)
 
     def non_specific_step_8(self, i):
 
         if i == "Ls":
             if self.p_flag:
-                Parameter('k_grb_on', self.parameters['k_8_1'])
-                Parameter('k_grb_product', self.parameters['k_8_2'])
+                self.add_parameter('k_grb_on', self.parameters['k_8_1'])
+                self.add_parameter('k_grb_product', self.parameters['k_8_2'])
             else:
-                Parameter('k_grb_on', 0.00005)
-                Parameter('k_grb_product', 0.01)
+                self.add_parameter('k_grb_on', 0.00005)
+                self.add_parameter('k_grb_product', 0.01)
 
         previous_product = self.step_8(i)
         intermediate_product = "LATP_Grb"
@@ -234,17 +234,17 @@ class PysbTcrCubicFbLoop(PysbTcrSelfWithForeign):
 
         if i == "Ls":
             self.add_new_monomer(intermediate_product)
-            Rule("{0}_convert".format(intermediate_product),
-                 eval('{0}()'.format(previous_product)) + Grb() | eval('{0}()'.format(intermediate_product)),
-                 k_grb_on, k_p_off_R_pmhc)
+            self.add_rule("{0}_convert".format(intermediate_product),
+                          self.pattern(previous_product) + self.pattern('Grb') | self.pattern(intermediate_product),
+                          'k_grb_on', 'k_p_off_R_pmhc')
 
             self.add_new_monomer(product)
-            Rule("{0}_cat".format(product),
-                 eval('{0}()'.format(intermediate_product)) >> LATP() + eval('{0}()'.format(product)),
-                 k_grb_product)
-            Rule("{0}_uncat".format(product), eval('{0}()'.format(product)) >> Grb(), k_p_off_R_pmhc)
+            self.add_rule("{0}_cat".format(product),
+                          self.pattern(intermediate_product) >> self.pattern('LATP') + self.pattern(product),
+                          'k_grb_product')
+            self.add_rule("{0}_uncat".format(product), self.pattern(product) >> self.pattern('Grb'), 'k_p_off_R_pmhc')
 
-            add_observable(product)
+            self.add_observable(product)
 
         return product
 
@@ -252,13 +252,13 @@ class PysbTcrCubicFbLoop(PysbTcrSelfWithForeign):
 
         if i == "Ls":
             if self.p_flag:
-                Parameter('k_latp_product', self.parameters['k_9_1'])
-                Parameter('k_latp_product_grb', self.parameters['k_9_2'])
-                Parameter('k_positive_fb', self.parameters['k_9_3'])
+                self.add_parameter('k_latp_product', self.parameters['k_9_1'])
+                self.add_parameter('k_latp_product_grb', self.parameters['k_9_2'])
+                self.add_parameter('k_positive_fb', self.parameters['k_9_3'])
             else:
-                Parameter('k_latp_product', 0.0003)
-                Parameter('k_latp_product_grb', 0.0004)
-                Parameter('k_positive_fb', 5.0)
+                self.add_parameter('k_latp_product', 0.0003)
+                self.add_parameter('k_latp_product_grb', 0.0004)
+                self.add_parameter('k_positive_fb', 5.0)
 
         previous_product = self.non_specific_step_8(i)
         intermediate_product = "LATP_" + previous_product
@@ -266,19 +266,20 @@ class PysbTcrCubicFbLoop(PysbTcrSelfWithForeign):
 
         if i == "Ls":
             self.add_new_monomer(intermediate_product)
-            Rule("{0}_bind".format(intermediate_product),
-                 LATP() + eval('{0}()'.format(previous_product)) | eval('{0}()'.format(intermediate_product)),
-                 k_latp_product, k_p_off_R_pmhc)
+            self.add_rule("{0}_bind".format(intermediate_product),
+                          self.pattern('LATP') + self.pattern(previous_product) | self.pattern(intermediate_product),
+                          'k_latp_product', 'k_p_off_R_pmhc')
 
             # self.add_observable(intermediate_product)
             self.add_new_monomer(intermediate_product_2)
-            Rule("{0}_bind".format(intermediate_product_2),
-                 eval('{0}()'.format(intermediate_product)) + Grb() | eval('{0}()'.format(intermediate_product_2)),
-                 k_latp_product_grb, k_p_off_R_pmhc)
-
-            Rule("{0}_cat".format(intermediate_product_2),
-                 eval('{0}()'.format(intermediate_product_2)) >> eval('{0}()'.format(intermediate_product)) + eval(
-                     '{0}()'.format(previous_product)),
-                 k_positive_fb)
+            self.add_rule("{0}_bind".format(intermediate_product_2),
+                          self.pattern(intermediate_product) + self.pattern('Grb')
+                          | self.pattern(intermediate_product_2),
+                          'k_latp_product_grb', 'k_p_off_R_pmhc')
+
+            self.add_rule("{0}_cat".format(intermediate_product_2),
+                          self.pattern(intermediate_product_2)
+                          >> self.pattern(intermediate_product) + self.pattern(previous_product),
+                          'k_positive_fb')
 
         return previous_product
@@ -5,26 +5,17 @@ import subprocess
 
 import numpy as np
 import pandas as pd
-from pysb import *
-from pysb.integrate import odesolve
 
+from bifurcation import trace_branch
+from model_builder import ModelBuilder
+from network_cache import cached_network, solver_settings
+from ode_simulator import OdeSimulator
 from pysb_t_cell_network import write_columns, write_model_attributes
 from realistic_network import make_and_cd
+from reduced_simulator import ReducedOdeSimulator
 
 
-def add_new_monomer(product):
-    try:
-        model.monomers[product]
-    except:
-        Monomer(product)
-        Initial(eval(product + "()"), Parameter(product + "_0", 0))
-
-
-def add_observable(species):
-    Observable("O_{0}".format(species), eval('{0}()'.format(species)))
-
-
-class SoSFeedback(object):
+class SoSFeedback(ModelBuilder):
 
     def __init__(self):
         self.run_time = 300
@@ -32,104 +23,107 @@ class SoSFeedback(object):
 
         self.sos = [round(i) for i in np.linspace(25, 500, num=40)]
 
-        self.model = Model()
+        self.model = self.new_model()
+        self.network = None
+        self.simulator = None
+        self.simulator_settings = None
 
     def define_monomers(self):
-        Monomer('Sos')
-        Monomer('Ras_GDP')
-        Monomer('Ras_GTP')
-        Monomer('Ras_GAP')
+        self.add_monomer('Sos')
+        self.add_monomer('Ras_GDP')
+        self.add_monomer('Ras_GTP')
+        self.add_monomer('Ras_GAP')
 
-        Parameter('Sos_0', self.sos[0])
-        Parameter('Ras_GDP_0', 300)
-        Parameter('Ras_GAP_0', 10)
-        Parameter('Ras_GTP_0', 0)
+        self.add_parameter('Sos_0', self.sos[0])
+        self.add_parameter('Ras_GDP_0', 300)
+        self.add_parameter('Ras_GAP_0', 10)
+        self.add_parameter('Ras_GTP_0', 0)
 
-        Initial(Sos(), Sos_0)
-        Initial(Ras_GDP(), Ras_GDP_0)
-        Initial(Ras_GAP(), Ras_GAP_0)
-        Initial(Ras_GTP(), Ras_GTP_0)
+        self.add_initial('Sos', 'Sos_0')
+        self.add_initial('Ras_GDP', 'Ras_GDP_0')
+        self.add_initial('Ras_GAP', 'Ras_GAP_0')
+        self.add_initial('Ras_GTP', 'Ras_GTP_0')
 
     def add_step_1(self):
-        Parameter('k_sos_on_rgdp', 0.0024)
-        Parameter('k_sos_off_rgdp', 3.0)
+        self.add_parameter('k_sos_on_rgdp', 0.0024)
+        self.add_parameter('k_sos_off_rgdp', 3.0)
 
         product = "Sos_Ras_GDP"
-        add_new_monomer(product)
+        self.add_new_monomer(product)
 
-        Rule('{0}_bind'.format(product), Sos() + Ras_GDP() | eval('{0}()'.format(product)),
-             k_sos_on_rgdp, k_sos_off_rgdp)
+        self.add_rule('{0}_bind'.format(product), self.pattern('Sos') + self.pattern('Ras_GDP') | self.pattern(product),
+                      'k_sos_on_rgdp', 'k_sos_off_rgdp')
 
-        add_observable(product)
+        self.add_observable(product)
         return product
 
     def add_step_2(self):
-        Parameter('k_sos_on_rgtp', 0.0022)
-        Parameter('k_sos_off_rgtp', 0.4)
+        self.add_parameter('k_sos_on_rgtp', 0.0022)
+        self.add_parameter('k_sos_off_rgtp', 0.4)
 
         product = "Sos_Ras_GTP"
-        add_new_monomer(product)
+        self.add_new_monomer(product)
 
-        Rule('{0}_bind'.format(product), Sos() + Ras_GTP() | eval('{0}()'.format(product)),
-             k_sos_on_rgtp, k_sos_off_rgtp)
+        self.add_rule('{0}_bind'.format(product), self.pattern('Sos') + self.pattern('Ras_GTP') | self.pattern(product),
+                      'k_sos_on_rgtp', 'k_sos_off_rgtp')
 
-        add_observable(product)
+        self.add_observable(product)
 
         return product
 
     def add_step_3(self):
-        Parameter('k_rgdp_on_sos_rgtp', 0.001)
-        Parameter('k_rgdp_off_sos_rgtp', 0.1)
-        Parameter('k_cat_3', 0.038 * 1.7)
+        self.add_parameter('k_rgdp_on_sos_rgtp', 0.001)
+        self.add_parameter('k_rgdp_off_sos_rgtp', 0.1)
+        self.add_parameter('k_cat_3', 0.038 * 1.7)
 
         previous_product = self.add_step_2()
 
         product = "Sos_Ras_GTP_Ras_GDP"
-        add_new_monomer(product)
+        self.add_new_monomer(product)
 
-        Rule('{0}_bind'.format(product),
-             eval('{0}()'.format(previous_product)) + Ras_GDP() | eval('{0}()'.format(product)),
-             k_rgdp_on_sos_rgtp, k_rgdp_off_sos_rgtp)
+        self.add_rule('{0}_bind'.format(product),
+                      self.pattern(previous_product) + self.pattern('Ras_GDP') | self.pattern(product),
+                      'k_rgdp_on_sos_rgtp', 'k_rgdp_off_sos_rgtp')
 
-        Rule('{0}_cat'.format(product),
-             eval('{0}()'.format(product)) >> eval('{0}()'.format(previous_product)) + Ras_GTP(),
-             k_cat_3)
+        self.add_rule('{0}_cat'.format(product),
+                      self.pattern(product) >> self.pattern(previous_product) + self.pattern('Ras_GTP'),
+                      'k_cat_3')
 
     def add_step_4(self):
-        Parameter('k_rgdp_on_sos_rgdp', 0.0014)
-        Parameter('k_rgdp_off_sos_rgdp', 1.0)
-        Parameter('k_cat_4', 0.003)
+        self.add_parameter('k_rgdp_on_sos_rgdp', 0.0014)
+        self.add_parameter('k_rgdp_off_sos_rgdp', 1.0)
+        self.add_parameter('k_cat_4', 0.003)
 
         previous_product = self.add_step_1()
 
         product = "Sos_Ras_GDP_Ras_GDP"
-        add_new_monomer(product)
+        self.add_new_monomer(product)
 
-        Rule('{0}_bind'.format(product),
-             eval('{0}()'.format(previous_product)) + Ras_GDP() | eval('{0}()'.format(product)),
-             k_rgdp_on_sos_rgdp, k_rgdp_off_sos_rgdp)
+        self.add_rule('{0}_bind'.format(product),
+                      self.pattern(previous_product) + self.pattern('Ras_GDP') | self.pattern(product),
+                      'k_rgdp_on_sos_rgdp', 'k_rgdp_off_sos_rgdp')
 
-        Rule('{0}_cat'.format(product),
-             eval('{0}()'.format(product)) >> eval('{0}()'.format(previous_product)) + Ras_GTP(),
-             k_cat_4)
+        self.add_rule('{0}_cat'.format(product),
+                      self.pattern(product) >> self.pattern(previous_product) + self.pattern('Ras_GTP'),
+                      'k_cat_4')
 
     def add_step_5(self):
-        Parameter('k_rgap_on_rgtp', 0.0348)
-        Parameter('k_rgap_off_rgtp', 0.2)
-        Parameter('k_cat_5', 0.1)
+        self.add_parameter('k_rgap_on_rgtp', 0.0348)
+        self.add_parameter('k_rgap_off_rgtp', 0.2)
+        self.add_parameter('k_cat_5', 0.1)
 
         product = "Ras_GAP_Ras_GTP"
-        add_new_monomer(product)
+        self.add_new_monomer(product)
 
-        Rule('{0}_bind'.format(product),
-             Ras_GAP() + Ras_GTP() | eval('{0}()'.format(product)),
-             k_rgap_on_rgtp, k_rgap_off_rgtp)
+        self.add_rule('{0}_bind'.format(product),
+                      self.pattern('Ras_GAP') + self.pattern('Ras_GTP') | self.pattern(product),
+                      'k_rgap_on_rgtp', 'k_rgap_off_rgtp')
 
-        add_observable(product)
+        self.add_observable(product)
 
-        Rule('{0}_cat'.format(product),
-             eval('{0}()'.format(product)) >> Ras_GAP() + Ras_GDP(),
-             k_cat_5)
+        self.add_rule('{0}_cat'.format(product),
+                      self.pattern(product) >> self.pattern('Ras_GAP') + self.pattern('Ras_GDP'),
+                      'k_cat_5')
 
     def make_model(self):
         # Model()
@@ -142,39 +136,75 @@ class SoSFeedback(object):
         self.add_step_4()
         self.add_step_5()
 
-        add_observable("Ras_GTP")
+        self.add_observable("Ras_GTP")
 
         product = "Ras_GTP"
         observables.append("O_{0}".format(product))
 
         return observables
 
-    def main(self):
+    def build_network(self):
+        self.network = cached_network(self)
+        return self.network['outputs']
+
+    def build_simulator(self, reduced=False, batched=False):
+        '''reduced integrates with the conservation laws eliminated (ReducedOdeSimulator); the solver settings stored by
+        solver_selection.py for batched or one-at-a-time runs are applied.'''
+        simulator_class = ReducedOdeSimulator if reduced else OdeSimulator
+        settings = solver_settings(self, batched)
+        if type(self.simulator) is not simulator_class or self.simulator.model is not self.model or \
+                self.simulator_settings != settings:
+            self.simulator = simulator_class(self.model, network=self.network, **settings)
+            self.simulator_settings = settings
+        return self.simulator
+
+    def main(self, settling_tolerance=None, settling_window=None, reduced=False):
         sos_array = []
         output = []
-        observables = self.make_model()
+        settling_time = []
+        observables = self.build_network()
 
         write_columns(observables)
-        write_model_attributes(model.rules, "rules")
-        write_model_attributes(model.parameters, "parameters")
-        write_model_attributes(model.observables, "observables")
+        write_model_attributes(self.network['rules'], "rules")
+        write_model_attributes(self.network['model_parameters'], "parameters")
+        write_model_attributes(self.network['model_observables'], "observables")
 
         np.savetxt("time", self.tspan, fmt='%f')
 
+        simulator = self.build_simulator(reduced)
+
         for sos in self.sos:
-            model.parameters['Sos_0'].value = sos
-            y = odesolve(model, self.tspan, compiler="python")
+            result = simulator.run(self.tspan, initials={'Sos_0': sos}, settling_tolerance=settling_tolerance,
+                                   settling_window=settling_window)
+            y = result.sample(0)
+            settling_time.append(result.settling_time[0])
 
             sos_array.append(sos)
             # print(y[observables[0]][-1])
             output.append(y[observables[0]][-1])
 
         df = pd.DataFrame({'Sos': sos_array, 'RasGTP': output})
+        if settling_tolerance is not None:
+            df['settling_time'] = settling_time
         df.to_csv("./sos_rasgtp", sep='\t')
 
         # np.savetxt("Sos", sos_array, fmt='%f')
         # np.savetxt("RasGTP", output, fmt='%f')
 
+    def main_continuation(self, low=None, high=None):
+        '''Steady-state Ras-GTP against Sos_0 by arclength continuation instead of one time integration per Sos
+        value. Both stable branches and the unstable one between the folds are written, with a stable column; the
+        folds bounding the bistable range go to sos_folds.'''
+        observables = self.build_network()
+        low = min(self.sos) if low is None else low
+        high = max(self.sos) if high is None else high
+
+        branch = trace_branch(self, 'Sos_0', low, high)
+        df = pd.DataFrame({'Sos': branch.parameter, 'RasGTP': branch.observable(observables[0]),
+                           'stable': branch.stable})
+        df.to_csv("./sos_rasgtp", sep='\t')
+        np.savetxt("sos_folds", [fold for fold, index in branch.folds], fmt='%f')
+
 
 class SoSFeedbackLigandSpecific(SoSFeedback):
     def __init__(self):
@@ -213,6 +243,16 @@ if __name__ == "__main__":
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument('--run', action='store_true', default=False,
                         help='Flag for submitting simulations.')
+    parser.add_argument('--continuation', dest='continuation', action='store_true', default=False,
+                        help='Trace the steady states over Sos_0 by arclength continuation, including the unstable '
+                             'branch and its folds.')
+    parser.add_argument('--reduced', dest='reduced', action='store_true', default=False,
+                        help='Integrate with the conservation laws eliminated.')
+    parser.add_argument('--settling_tolerance', dest='settling_tolerance', action='store', type=float,
+                        help='Stop integrating once max_i |dy_i/dt| / |y_i| times the time left to run_time stays '
+                             'below this for --settling_window.')
+    parser.add_argument('--settling_window', dest='settling_window', action='store', type=float,
+                        help='Time the settling test must hold (default: five output intervals).')
 
     args = parser.parse_args()
 
@@ -223,4 +263,8 @@ if __name__ == "__main__":
         qsub.launch()
     else:
         sos = SoSFeedback()
-        sos.main()
+        if args.continuation:
+            sos.main_continuation()
+        else:
+            sos.main(settling_tolerance=args.settling_tolerance, settling_window=args.settling_window,
+                     reduced=args.reduced)
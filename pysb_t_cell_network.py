@@ -5,30 +5,22 @@ import os
 import pickle
 
 import numpy as np
-from pysb import *
-from pysb.integrate import odesolve
 
+from channel_capacity import paired_bootstrap_capacity
+from dose_response import DoseResponse
+from ligand_sampler import LigandSampler, SAMPLING_METHODS
+from model_builder import ModelBuilder
+from network_cache import cached_network, solver_settings
+from ode_simulator import OdeSimulator, parallel_sweep, worker_pool
+from qssa import QssaOdeSimulator, qssa_error
+from reduced_simulator import ReducedOdeSimulator
+from sensitivity import ForwardSensitivity, ranked_sensitivities
 from simulation_parameters import InitialConcentrations, BindingParameters
+from steady_state import SteadyStateSolver
 
 
-def e(i, s=""):
-    eval('{0}{1}()'.format(i, s))
-
-
-def add_new_monomer(product):
-    try:
-        model.monomers[product]
-    except:
-        Monomer(product)
-        Initial(eval(product + "()"), Parameter(product + "_0", 0))
-
-
-def add_observable(species):
-    Observable("O_{0}".format(species), eval('{0}()'.format(species)))
-
-
-def write_columns(observables):
-    f = open("column_names", "w")
+def write_columns(observables, file_name="column_names"):
+    f = open(file_name, "w")
     for item in observables:
         f.write("{0} ".format(item))
     f.write("\n")
@@ -43,8 +35,10 @@ def write_model_attributes(attributes, file_name):
     f.close()
 
 
-class PysbTcrSelfWithForeign(object):
-    def __init__(self, steps=8, self_foreign=False, lf=30):
+class PysbTcrSelfWithForeign(ModelBuilder):
+    def __init__(self, steps=8, self_foreign=False, lf=30, seed=None, num_samples=1000, sampling='random'):
+        self.init_kwargs = dict(steps=steps, self_foreign=self_foreign, lf=lf, num_samples=num_samples,
+                                sampling=sampling)
         self.rate_constants = BindingParameters()
         self.initial_conditions = InitialConcentrations()
         self.self_foreign = self_foreign
@@ -58,7 +52,8 @@ class PysbTcrSelfWithForeign(object):
 
         self.mu = 6
         self.sigma = 1.0
-        self.num_samples = 1000
+        self.num_samples = num_samples
+        self.sampling = sampling
 
         self.p_flag = os.path.exists("parameters.pickle")
 
@@ -66,123 +61,129 @@ class PysbTcrSelfWithForeign(object):
             self.parameters = pickle.load(open("parameters.pickle", "rb"))
             print(self.parameters)
 
-        self.p_ligand = [int(i) for i in np.round(np.random.lognormal(self.mu, self.sigma, self.num_samples))]
+        self.seed = np.random.randint(2 ** 31 - 1) if seed is None else seed
+        self.p_ligand = self.sample_ligands()
 
         if self.self_foreign:
             self.output = ["Ls", "Lf"]
         else:
             self.output = ["Ls"]
 
-        self.model = Model()
+        self.model = self.new_model()
+        self.network = None
+        self.simulator = None
+        self.simulator_settings = None
+        self.dose_response = None
+
+    def sample_ligands(self):
+        '''Draws num_samples ligand numbers with the design named by self.sampling and keeps their weights in
+        self.weights.'''
+        sampler = LigandSampler(self.mu, self.sigma, method=self.sampling, seed=self.seed)
+        ligands, self.weights = sampler.sample(self.num_samples)
+        return ligands
 
     def define_monomers(self):
-        Monomer('R')
-        Monomer('Ls')
-        Monomer('Lck')
-        Monomer('Zap')
-        Monomer('LAT')
-        Monomer('Grb')
-        Monomer('Sos')
-
-        Parameter('R_0', self.initial_conditions.r_0)
-        Parameter('Ls_0', self.ls)
-        Parameter('Lck_0', self.initial_conditions.lck_0)
-        Parameter('Zap_0', self.initial_conditions.zap_0)
-        Parameter('LAT_0', self.initial_conditions.lat_0)
-        Parameter('Sos_0', self.initial_conditions.sos_0)
-
-        Initial(R(), R_0)
-        Initial(Ls(), Ls_0)
-        Initial(Lck(), Lck_0)
-        Initial(Zap(), Zap_0)
-        Initial(LAT(), LAT_0)
-        Initial(Sos(), Sos_0)
+        self.add_monomer('R')
+        self.add_monomer('Ls')
+        self.add_monomer('Lck')
+        self.add_monomer('Zap')
+        self.add_monomer('LAT')
+        self.add_monomer('Grb')
+        self.add_monomer('Sos')
+
+        self.add_parameter('R_0', self.initial_conditions.r_0)
+        self.add_parameter('Ls_0', self.ls)
+        self.add_parameter('Lck_0', self.initial_conditions.lck_0)
+        self.add_parameter('Zap_0', self.initial_conditions.zap_0)
+        self.add_parameter('LAT_0', self.initial_conditions.lat_0)
+        self.add_parameter('Sos_0', self.initial_conditions.sos_0)
+
+        self.add_initial('R', 'R_0')
+        self.add_initial('Ls', 'Ls_0')
+        self.add_initial('Lck', 'Lck_0')
+        self.add_initial('Zap', 'Zap_0')
+        self.add_initial('LAT', 'LAT_0')
+        self.add_initial('Sos', 'Sos_0')
 
         # Positive Feedback loop
-        Monomer('Ras_GDP')
-        Monomer('Ras_GTP')
-        Monomer('Ras_GAP')
+        self.add_monomer('Ras_GDP')
+        self.add_monomer('Ras_GTP')
+        self.add_monomer('Ras_GAP')
 
-        Parameter('Ras_GDP_0', self.initial_conditions.ras_gdp_0)
-        Parameter('Ras_GAP_0', self.initial_conditions.ras_gap_0)
-        Parameter('Ras_GTP_0', 0)
+        self.add_parameter('Ras_GDP_0', self.initial_conditions.ras_gdp_0)
+        self.add_parameter('Ras_GAP_0', self.initial_conditions.ras_gap_0)
+        self.add_parameter('Ras_GTP_0', 0)
 
-        Initial(Ras_GDP(), Ras_GDP_0)
-        Initial(Ras_GAP(), Ras_GAP_0)
-        Initial(Ras_GTP(), Ras_GTP_0)
+        self.add_initial('Ras_GDP', 'Ras_GDP_0')
+        self.add_initial('Ras_GAP', 'Ras_GAP_0')
+        self.add_initial('Ras_GTP', 'Ras_GTP_0')
 
         if "Lf" in self.output:
-            Monomer('Lf')
-            Parameter('Lf_0', self.lf)
-            Initial(Lf(), Lf_0)
-
-    def add_new_monomer(self, product):
-        try:
-            self.model.monomers[product]
-        except:
-            Monomer(product)
-            Initial(eval(product + "()"), Parameter(product + "_0", 0))
+            self.add_monomer('Lf')
+            self.add_parameter('Lf_0', self.lf)
+            self.add_initial('Lf', 'Lf_0')
 
     def define_rates(self):
-        Parameter('k_L_on', self.rate_constants.k_L_on)
+        self.add_parameter('k_L_on', self.rate_constants.k_L_on)
         if "Lf" in self.output:
-            Parameter('k_Lf_off', self.rate_constants.k_foreign_off)
-        Parameter('k_Ls_off', self.rate_constants.k_self_off)
+            self.add_parameter('k_Lf_off', self.rate_constants.k_foreign_off)
+        self.add_parameter('k_Ls_off', self.rate_constants.k_self_off)
 
     def add_step_0(self, i):
         product = "R{0}".format(i)
         self.add_new_monomer(product)
 
-        Rule('{0}_bind'.format(product), R() + eval('{0}()'.format(i)) | eval('{0}()'.format(product)),
-             k_L_on, eval('k_{0}_off'.format(i)))
+        self.add_rule('{0}_bind'.format(product), self.pattern('R') + self.pattern(i) | self.pattern(product),
+                      'k_L_on', 'k_{0}_off'.format(i))
 
-        add_observable(i)
-        add_observable(product)
+        self.add_observable(i)
+        self.add_observable(product)
         return product
 
     def zap_off(self, product):
         new = product.replace("_Zap", "")
         self.add_new_monomer(new)
-        Rule('{0}_unbindZap'.format(product), eval('{0}()'.format(product)) | eval('{0}()'.format(new)) + Zap(),
-             k_zap_off_R, k_zap_on_R)
+        self.add_rule('{0}_unbindZap'.format(product), self.pattern(product) | self.pattern(new) + self.pattern('Zap'),
+                      'k_zap_off_R', 'k_zap_on_R')
         return new
 
     def lck_off(self, no_ligand_product, k_off="k_lck_off_R"):
         new = no_ligand_product.replace("_Lck", "")
         self.add_new_monomer(new)
-        Rule('{0}_unbindLck'.format(no_ligand_product),
-             eval('{0}()'.format(no_ligand_product)) | eval('{0}()'.format(new)) + Lck(),
-             eval(k_off), k_lck_on_R)
+        self.add_rule('{0}_unbindLck'.format(no_ligand_product),
+                      self.pattern(no_ligand_product) | self.pattern(new) + self.pattern('Lck'),
+                      k_off, 'k_lck_on_R')
 
         return new
 
     def unbind_ligand(self, i, final_product):
         new = final_product.replace(i, "")
         self.add_new_monomer(new)
-        Rule('{0}_unbindL'.format(final_product),
-             eval('{0}()'.format(final_product)) | eval('{0}()'.format(i)) + eval('{0}()'.format(new)),
-             eval('k_{0}_off'.format(i)), k_L_on)
+        self.add_rule('{0}_unbindL'.format(final_product),
+                      self.pattern(final_product) | self.pattern(i) + self.pattern(new),
+                      'k_{0}_off'.format(i), 'k_L_on')
 
         return new
 
     def cycle_1(self, i):
         if i == "Ls":
             if self.p_flag:
-                Parameter('k_lck_on_RL', self.parameters['k_lck_on_RL'])
+                self.add_parameter('k_lck_on_RL', self.parameters['k_lck_on_RL'])
             else:
-                Parameter('k_lck_on_RL', self.rate_constants.k_lck_on_R_pmhc)
-            Parameter('k_lck_off_RL', self.rate_constants.k_lck_off_R_pmhc)
+                self.add_parameter('k_lck_on_RL', self.rate_constants.k_lck_on_R_pmhc)
+            self.add_parameter('k_lck_off_RL', self.rate_constants.k_lck_off_R_pmhc)
 
-            Parameter('k_lck_on_R', self.rate_constants.k_lck_on_R)
-            Parameter('k_lck_off_R', self.rate_constants.k_lck_off_R)
+            self.add_parameter('k_lck_on_R', self.rate_constants.k_lck_on_R)
+            self.add_parameter('k_lck_off_R', self.rate_constants.k_lck_off_R)
 
         previous_product = self.add_step_0(i)
 
         product = "R{0}_Lck".format(i)
-        add_new_monomer(product)
-        Rule('{0}_bind'.format(product), eval('{0}()'.format(previous_product)) + Lck() | eval('{0}()'.format(product)),
-             k_lck_on_RL, k_lck_off_RL)
-        add_observable(product)
+        self.add_new_monomer(product)
+        self.add_rule('{0}_bind'.format(product),
+                      self.pattern(previous_product) + self.pattern('Lck') | self.pattern(product),
+                      'k_lck_on_RL', 'k_lck_off_RL')
+        self.add_observable(product)
 
         no_ligand = self.unbind_ligand(i, product)
         if i == "Ls":
@@ -193,51 +194,52 @@ class PysbTcrSelfWithForeign(object):
     def cycle_2(self, i):
         if i == "Ls":
             if self.p_flag:
-                Parameter('k_p_on_R_pmhc', self.parameters['k_p_on_R_pmhc'])
+                self.add_parameter('k_p_on_R_pmhc', self.parameters['k_p_on_R_pmhc'])
             else:
-                Parameter('k_p_on_R_pmhc', self.rate_constants.k_p_on_R_pmhc)
-            Parameter('k_p_off_R_pmhc', self.rate_constants.k_p_off_R_pmhc)
+                self.add_parameter('k_p_on_R_pmhc', self.rate_constants.k_p_on_R_pmhc)
+            self.add_parameter('k_p_off_R_pmhc', self.rate_constants.k_p_off_R_pmhc)
 
-            Parameter('k_p_on_R', self.rate_constants.k_p_on_R)
-            Parameter('k_p_off_R', self.rate_constants.k_p_off_R)
+            self.add_parameter('k_p_on_R', self.rate_constants.k_p_on_R)
+            self.add_parameter('k_p_off_R', self.rate_constants.k_p_off_R)
 
         previous_product = self.cycle_1(i)
 
         product = "RP{0}_Lck".format(i)
-        add_new_monomer(product)
-        Rule('{0}_cat'.format(product), eval('{0}()'.format(previous_product)) | eval('{0}()'.format(product)),
-             k_p_on_R_pmhc, k_p_off_R_pmhc)
-        add_observable(product)
+        self.add_new_monomer(product)
+        self.add_rule('{0}_cat'.format(product), self.pattern(previous_product) | self.pattern(product),
+                      'k_p_on_R_pmhc', 'k_p_off_R_pmhc')
+        self.add_observable(product)
 
         no_ligand = self.unbind_ligand(i, product)
 
         if i == "Ls":
             no_lck = self.lck_off(no_ligand)
 
-            Rule('{0}_uncat'.format(no_lck), eval('{0}()'.format(no_lck)) | R(), k_p_off_R, k_p_on_R)
+            self.add_rule('{0}_uncat'.format(no_lck), self.pattern(no_lck) | self.pattern('R'), 'k_p_off_R', 'k_p_on_R')
         return product
 
     def cycle_3(self, i):
         if i == "Ls":
             if self.p_flag:
-                Parameter('k_zap_on_R_pmhc', self.parameters['k_zap_on_R_pmhc'])
+                self.add_parameter('k_zap_on_R_pmhc', self.parameters['k_zap_on_R_pmhc'])
             else:
-                Parameter('k_zap_on_R_pmhc', self.rate_constants.k_zap_on_R_pmhc)
-            Parameter('k_zap_off_R_pmhc', self.rate_constants.k_zap_off_R_pmhc)
+                self.add_parameter('k_zap_on_R_pmhc', self.rate_constants.k_zap_on_R_pmhc)
+            self.add_parameter('k_zap_off_R_pmhc', self.rate_constants.k_zap_off_R_pmhc)
 
-            # Parameter('k_lck_on_zap_R', self.rate_constants.k_lck_on_zap_R)
-            Parameter('k_lck_off_zap_R', self.rate_constants.k_lck_off_zap_R)
+            # self.add_parameter('k_lck_on_zap_R', self.rate_constants.k_lck_on_zap_R)
+            self.add_parameter('k_lck_off_zap_R', self.rate_constants.k_lck_off_zap_R)
 
-            Parameter('k_zap_on_R', self.rate_constants.k_zap_on_R)
-            Parameter('k_zap_off_R', self.rate_constants.k_zap_off_R)
+            self.add_parameter('k_zap_on_R', self.rate_constants.k_zap_on_R)
+            self.add_parameter('k_zap_off_R', self.rate_constants.k_zap_off_R)
 
         previous_product = self.cycle_2(i)
         product = "RP{0}_Lck_Zap".format(i)
-        add_new_monomer(product)
+        self.add_new_monomer(product)
 
-        Rule('{0}_bind'.format(product), eval('{0}()'.format(previous_product)) + Zap() | eval('{0}()'.format(product)),
-             k_zap_on_R_pmhc, k_zap_off_R_pmhc)
-        add_observable(product)
+        self.add_rule('{0}_bind'.format(product),
+                      self.pattern(previous_product) + self.pattern('Zap') | self.pattern(product),
+                      'k_zap_on_R_pmhc', 'k_zap_off_R_pmhc')
+        self.add_observable(product)
 
         no_ligand = self.unbind_ligand(i, product)
 
@@ -249,17 +251,18 @@ class PysbTcrSelfWithForeign(object):
 
     def dephosphorylate_zap(self, product):
         new = product.replace("_Zap_P", "_Zap")
-        add_new_monomer(new)
-        Rule('{0}_uncat'.format(product), eval('{0}()'.format(product)) | eval('{0}()'.format(new)),
-             k_p_off_R, k_p_on_R)
+        self.add_new_monomer(new)
+        self.add_rule('{0}_uncat'.format(product), self.pattern(product) | self.pattern(new),
+                      'k_p_off_R', 'k_p_on_R')
 
         return new
 
     def rp_zap_off(self, product):
         new = product.replace("RP_Zap_", "")
-        add_new_monomer(new)
-        Rule('{0}_rpzap_off'.format(product), eval('{0}()'.format(product)) | RP_Zap() + eval('{0}()'.format(new)),
-             k_zap_off_R, k_zap_on_R)
+        self.add_new_monomer(new)
+        self.add_rule('{0}_rpzap_off'.format(product),
+                      self.pattern(product) | self.pattern('RP_Zap') + self.pattern(new),
+                      'k_zap_off_R', 'k_zap_on_R')
 
         return new
 
@@ -267,19 +270,19 @@ class PysbTcrSelfWithForeign(object):
 
         if i == "Ls":
             if self.p_flag:
-                Parameter('k_p_on_zap_species', self.parameters['k_p_on_zap_species'])
+                self.add_parameter('k_p_on_zap_species', self.parameters['k_p_on_zap_species'])
             else:
-                Parameter('k_p_on_zap_species', self.rate_constants.k_p_on_zap_species)
+                self.add_parameter('k_p_on_zap_species', self.rate_constants.k_p_on_zap_species)
 
-            Parameter('k_p_off_zap_species', self.rate_constants.k_p_off_zap_species)
+            self.add_parameter('k_p_off_zap_species', self.rate_constants.k_p_off_zap_species)
 
         previous_product = self.cycle_3(i)
         product = "RP{0}_Lck_Zap_P".format(i)
-        add_new_monomer(product)
+        self.add_new_monomer(product)
 
-        Rule('{0}_cat'.format(product), eval('{0}()'.format(previous_product)) | eval('{0}()'.format(product)),
-             k_p_on_zap_species, k_p_off_zap_species)
-        add_observable(product)
+        self.add_rule('{0}_cat'.format(product), self.pattern(previous_product) | self.pattern(product),
+                      'k_p_on_zap_species', 'k_p_off_zap_species')
+        self.add_observable(product)
 
         no_ligand = self.unbind_ligand(i, product)
 
@@ -292,85 +295,95 @@ class PysbTcrSelfWithForeign(object):
     def add_negative_feedback(self):
 
         if self.p_flag:
-            Parameter('k_neg_fb', self.parameters['k_neg_fb'])
-            Parameter('k_lcki', self.parameters['k_lcki'])
+            self.add_parameter('k_neg_fb', self.parameters['k_neg_fb'])
+            self.add_parameter('k_lcki', self.parameters['k_lcki'])
         else:
-            Parameter('k_neg_fb', self.rate_constants.k_negative_loop)
-            Parameter('k_lcki', self.rate_constants.k_lcki)
+            self.add_parameter('k_neg_fb', self.rate_constants.k_negative_loop)
+            self.add_parameter('k_lcki', self.rate_constants.k_lcki)
 
-        add_new_monomer("LckI")
+        self.add_new_monomer("LckI")
 
         if self.self_foreign:
-            Rule('Neg_fb_1_self', eval("RPLs_Lck_Zap_P()") + eval('Lck()') >> eval(
-                'LckI()') + eval('RPLs_Lck_Zap_P()'), k_neg_fb)
-            Rule('Neg_fb_1_foreign', eval("RPLf_Lck_Zap_P()") + eval('Lck()') >> eval(
-                'LckI()') + eval("RPLf_Lck_Zap_P()"), k_neg_fb)
+            self.add_rule('Neg_fb_1_self',
+                          self.pattern('RPLs_Lck_Zap_P') + self.pattern('Lck')
+                          >> self.pattern('LckI') + self.pattern('RPLs_Lck_Zap_P'), 'k_neg_fb')
+            self.add_rule('Neg_fb_1_foreign',
+                          self.pattern('RPLf_Lck_Zap_P') + self.pattern('Lck')
+                          >> self.pattern('LckI') + self.pattern('RPLf_Lck_Zap_P'), 'k_neg_fb')
         else:
-            Rule('Neg_fb_1', eval("RPLs_Lck_Zap_P()") + eval('Lck()') >> eval(
-                'LckI()') + eval('RPLs_Lck_Zap_P()'), k_neg_fb)
+            self.add_rule('Neg_fb_1',
+                          self.pattern('RPLs_Lck_Zap_P') + self.pattern('Lck')
+                          >> self.pattern('LckI') + self.pattern('RPLs_Lck_Zap_P'), 'k_neg_fb')
 
-        Rule('Neg_fb_2', LckI() >> Lck(), k_lcki)
+        self.add_rule('Neg_fb_2', self.pattern('LckI') >> self.pattern('Lck'), 'k_lcki')
 
     def add_negative_feedback_late_zap(self):
 
         if self.p_flag:
-            Parameter('k_neg_fb', self.parameters['k_neg_fb'])
-            Parameter('k_lcki', self.parameters['k_lcki'])
+            self.add_parameter('k_neg_fb', self.parameters['k_neg_fb'])
+            self.add_parameter('k_lcki', self.parameters['k_lcki'])
         else:
-            Parameter('k_neg_fb', self.rate_constants.k_negative_loop)
-            Parameter('k_lcki', self.rate_constants.k_lcki)
+            self.add_parameter('k_neg_fb', self.rate_constants.k_negative_loop)
+            self.add_parameter('k_lcki', self.rate_constants.k_lcki)
 
-        add_new_monomer("ZapI")
+        self.add_new_monomer("ZapI")
 
         if self.self_foreign:
-            Rule('Neg_fb_1_self', eval("RPLs_Lck_Zap_P_LATP()") + eval('Zap()') >> eval(
-                'ZapI()') + eval('RPLs_Lck_Zap_P_LATP()'), k_neg_fb)
-            Rule('Neg_fb_1_foreign', eval("RPLf_Lck_Zap_P_LATP()") + eval('Zap()') >> eval(
-                'ZapI()') + eval("RPLf_Lck_Zap_P_LATP()"), k_neg_fb)
+            self.add_rule('Neg_fb_1_self',
+                          self.pattern('RPLs_Lck_Zap_P_LATP') + self.pattern('Zap')
+                          >> self.pattern('ZapI') + self.pattern('RPLs_Lck_Zap_P_LATP'), 'k_neg_fb')
+            self.add_rule('Neg_fb_1_foreign',
+                          self.pattern('RPLf_Lck_Zap_P_LATP') + self.pattern('Zap')
+                          >> self.pattern('ZapI') + self.pattern('RPLf_Lck_Zap_P_LATP'), 'k_neg_fb')
         else:
-            Rule('Neg_fb_1', eval("RPLs_Lck_Zap_P_LATP()") + eval('Zap()') >> eval(
-                'ZapI()') + eval('RPLs_Lck_Zap_P_LATP()'), k_neg_fb)
+            self.add_rule('Neg_fb_1',
+                          self.pattern('RPLs_Lck_Zap_P_LATP') + self.pattern('Zap')
+                          >> self.pattern('ZapI') + self.pattern('RPLs_Lck_Zap_P_LATP'), 'k_neg_fb')
 
-        Rule('Neg_fb_2', ZapI() >> Zap(), k_lcki)
+        self.add_rule('Neg_fb_2', self.pattern('ZapI') >> self.pattern('Zap'), 'k_lcki')
 
     def add_negative_feedback_late_lat(self):
 
         if self.p_flag:
-            Parameter('k_neg_fb', self.parameters['k_neg_fb'])
-            Parameter('k_lcki', self.parameters['k_lcki'])
+            self.add_parameter('k_neg_fb', self.parameters['k_neg_fb'])
+            self.add_parameter('k_lcki', self.parameters['k_lcki'])
         else:
-            Parameter('k_neg_fb', self.rate_constants.k_negative_loop)
-            Parameter('k_lcki', self.rate_constants.k_lcki)
+            self.add_parameter('k_neg_fb', self.rate_constants.k_negative_loop)
+            self.add_parameter('k_lcki', self.rate_constants.k_lcki)
 
-        add_new_monomer("LATI")
+        self.add_new_monomer("LATI")
 
         if self.self_foreign:
-            Rule('Neg_fb_1_self', eval("RPLs_Lck_Zap_P_LATP()") + eval('LAT()') >> eval(
-                'LATI()') + eval('RPLs_Lck_Zap_P_LATP()'), k_neg_fb)
-            Rule('Neg_fb_1_foreign', eval("RPLf_Lck_Zap_P_LATP()") + eval('LAT()') >> eval(
-                'LATI()') + eval("RPLf_Lck_Zap_P_LATP()"), k_neg_fb)
+            self.add_rule('Neg_fb_1_self',
+                          self.pattern('RPLs_Lck_Zap_P_LATP') + self.pattern('LAT')
+                          >> self.pattern('LATI') + self.pattern('RPLs_Lck_Zap_P_LATP'), 'k_neg_fb')
+            self.add_rule('Neg_fb_1_foreign',
+                          self.pattern('RPLf_Lck_Zap_P_LATP') + self.pattern('LAT')
+                          >> self.pattern('LATI') + self.pattern('RPLf_Lck_Zap_P_LATP'), 'k_neg_fb')
         else:
-            Rule('Neg_fb_1', eval("RPLs_Lck_Zap_P_LATP()") + eval('LAT()') >> eval(
-                'LATI()') + eval('RPLs_Lck_Zap_P_LATP()'), k_neg_fb)
+            self.add_rule('Neg_fb_1',
+                          self.pattern('RPLs_Lck_Zap_P_LATP') + self.pattern('LAT')
+                          >> self.pattern('LATI') + self.pattern('RPLs_Lck_Zap_P_LATP'), 'k_neg_fb')
 
-        Rule('Neg_fb_2', LATI() >> LAT(), k_lcki)
+        self.add_rule('Neg_fb_2', self.pattern('LATI') >> self.pattern('LAT'), 'k_lcki')
 
     def cycle_6(self, i):
 
         if i == "Ls":
             if self.p_flag:
-                Parameter('k_lat_on_species', self.parameters['k_lat_on_species'])
+                self.add_parameter('k_lat_on_species', self.parameters['k_lat_on_species'])
             else:
-                Parameter('k_lat_on_species', self.rate_constants.k_lat_on_species)
-            Parameter('k_lat_off_species', self.rate_constants.k_lat_off_species)
+                self.add_parameter('k_lat_on_species', self.rate_constants.k_lat_on_species)
+            self.add_parameter('k_lat_off_species', self.rate_constants.k_lat_off_species)
 
         previous_product = self.cycle_4(i)  # self.add_negative_feedback(i)
         product = "RP{0}_Lck_Zap_P_LAT".format(i)
-        add_new_monomer(product)
+        self.add_new_monomer(product)
 
-        Rule("{0}_bind".format(product), eval('{0}()'.format(previous_product)) + LAT() | eval('{0}()'.format(product)),
-             k_lat_on_species, k_lat_off_species)
-        add_observable(product)
+        self.add_rule("{0}_bind".format(product),
+                      self.pattern(previous_product) + self.pattern('LAT') | self.pattern(product),
+                      'k_lat_on_species', 'k_lat_off_species')
+        self.add_observable(product)
 
         no_ligand = self.unbind_ligand(i, product)
 
@@ -383,27 +396,27 @@ class PysbTcrSelfWithForeign(object):
 
     def dephosphorylate_latp(self, product):
         new = product.replace("LATP", "LAT")
-        add_new_monomer(new)
-        Rule('{0}_uncat'.format(product), eval('{0}()'.format(product)) | eval('{0}()'.format(new)),
-             k_p_off_R, k_p_on_R)
+        self.add_new_monomer(new)
+        self.add_rule('{0}_uncat'.format(product), self.pattern(product) | self.pattern(new),
+                      'k_p_off_R', 'k_p_on_R')
         return new
 
     def cycle_7(self, i):
 
         if i == "Ls":
             if self.p_flag:
-                Parameter('kp_on_lat1', self.parameters['kp_on_lat1'])
+                self.add_parameter('kp_on_lat1', self.parameters['kp_on_lat1'])
             else:
-                Parameter('kp_on_lat1', self.rate_constants.k_p_lat_1)
-            Parameter('kp_off_lat1', self.rate_constants.k_p_lat_off_species)
+                self.add_parameter('kp_on_lat1', self.rate_constants.k_p_lat_1)
+            self.add_parameter('kp_off_lat1', self.rate_constants.k_p_lat_off_species)
 
         previous_product = self.cycle_6(i)
         product = "RP{0}_Lck_Zap_P_LATP".format(i)
-        add_new_monomer(product)
+        self.add_new_monomer(product)
 
-        Rule("{0}_bind".format(product), eval('{0}()'.format(previous_product)) | eval('{0}()'.format(product)),
-             kp_on_lat1, kp_off_lat1)
-        add_observable(product)
+        self.add_rule("{0}_bind".format(product), self.pattern(previous_product) | self.pattern(product),
+                      'kp_on_lat1', 'kp_off_lat1')
+        self.add_observable(product)
 
         no_ligand = self.unbind_ligand(i, product)
 
@@ -417,37 +430,37 @@ class PysbTcrSelfWithForeign(object):
     def step_8(self, i):
         if i == "Ls":
             if self.p_flag:
-                Parameter('k_p_lat_on_species', self.parameters['k_p_lat_on_species'])
+                self.add_parameter('k_p_lat_on_species', self.parameters['k_p_lat_on_species'])
             else:
-                Parameter('k_p_lat_on_species', self.rate_constants.k_p_lat_2)
+                self.add_parameter('k_p_lat_on_species', self.rate_constants.k_p_lat_2)
 
         previous_product = self.cycle_7(i)
         product = "LATPP"
         if i == "Ls":
-            add_new_monomer(product)
+            self.add_new_monomer(product)
 
-        Rule("{0}_cat".format(previous_product),
-             eval('{0}()'.format(previous_product)) >> eval('{0}()'.format("RP{0}_Lck_Zap_P".format(i))) + eval(
-                 '{0}()'.format(product)), k_p_lat_on_species)
+        self.add_rule("{0}_cat".format(previous_product),
+                      self.pattern(previous_product)
+                      >> self.pattern("RP{0}_Lck_Zap_P".format(i)) + self.pattern(product), 'k_p_lat_on_species')
         if i == "Ls":
-            add_observable(product)
+            self.add_observable(product)
 
-            Rule("{0}_uncat".format(product), eval('{0}()'.format(product)) >> LAT(), k_p_off_R_pmhc)
+            self.add_rule("{0}_uncat".format(product), self.pattern(product) >> self.pattern('LAT'), 'k_p_off_R_pmhc')
 
         return product
 
     def non_specific_step_8(self, i):
 
         if i == "Ls":
-            Parameter('k_product_on', self.rate_constants.k_product_on)
+            self.add_parameter('k_product_on', self.rate_constants.k_product_on)
 
         previous_product = self.step_8(i)
         product = "final_product"
         if i == "Ls":
-            add_new_monomer(product)
-            Rule("{0}_convert".format(product), eval('{0}()'.format(previous_product)) | eval('{0}()'.format(product)),
-                 k_product_on, k_p_off_R_pmhc)
-            add_observable(product)
+            self.add_new_monomer(product)
+            self.add_rule("{0}_convert".format(product), self.pattern(previous_product) | self.pattern(product),
+                          'k_product_on', 'k_p_off_R_pmhc')
+            self.add_observable(product)
 
         return product
 
@@ -458,17 +471,17 @@ class PysbTcrSelfWithForeign(object):
 
         if i == "Ls":
             if self.p_flag:
-                Parameter('k_sos_on', self.parameters['k_8_1'])
+                self.add_parameter('k_sos_on', self.parameters['k_8_1'])
             else:
-                Parameter('k_sos_on', self.rate_constants.k_sos_on)
+                self.add_parameter('k_sos_on', self.rate_constants.k_sos_on)
 
-            Parameter('k_sos_off', self.rate_constants.k_sos_off)
+            self.add_parameter('k_sos_off', self.rate_constants.k_sos_off)
 
-            add_new_monomer(product)
-            Rule("{0}_bind".format(product),
-                 eval('{0}()'.format(previous_product)) + Sos() | eval('{0}()'.format(product)),
-                 k_sos_on, k_sos_off)
-            add_observable(product)
+            self.add_new_monomer(product)
+            self.add_rule("{0}_bind".format(product),
+                          self.pattern(previous_product) + self.pattern('Sos') | self.pattern(product),
+                          'k_sos_on', 'k_sos_off')
+            self.add_observable(product)
 
         return product
 
@@ -477,26 +490,26 @@ class PysbTcrSelfWithForeign(object):
         product_rd = previous_product + "_Ras_GDP"
 
         if i == "Ls":
-            Parameter('k_sos_on_rgdp', self.rate_constants.k_sos_on_rgdp)
-            Parameter('k_sos_off_rgdp', self.rate_constants.k_sos_off_rgdp)
+            self.add_parameter('k_sos_on_rgdp', self.rate_constants.k_sos_on_rgdp)
+            self.add_parameter('k_sos_off_rgdp', self.rate_constants.k_sos_off_rgdp)
 
-            add_new_monomer(product_rd)
+            self.add_new_monomer(product_rd)
 
-            Rule('{0}_bind'.format(product_rd),
-                 eval('{0}()'.format(previous_product)) + Ras_GDP() | eval('{0}()'.format(product_rd)),
-                 k_sos_on_rgdp, k_sos_off_rgdp)
+            self.add_rule('{0}_bind'.format(product_rd),
+                          self.pattern(previous_product) + self.pattern('Ras_GDP') | self.pattern(product_rd),
+                          'k_sos_on_rgdp', 'k_sos_off_rgdp')
 
         product_rt = previous_product + "_Ras_GTP"
 
         if i == "Ls":
-            Parameter('k_sos_on_rgtp', self.rate_constants.k_sos_on_rgtp)
-            Parameter('k_sos_off_rgtp', self.rate_constants.k_sos_off_rgtp)
+            self.add_parameter('k_sos_on_rgtp', self.rate_constants.k_sos_on_rgtp)
+            self.add_parameter('k_sos_off_rgtp', self.rate_constants.k_sos_off_rgtp)
 
-            add_new_monomer(product_rt)
+            self.add_new_monomer(product_rt)
 
-            Rule('{0}_bind'.format(product_rt),
-                 eval('{0}()'.format(previous_product)) + Ras_GTP() | eval('{0}()'.format(product_rt)),
-                 k_sos_on_rgtp, k_sos_off_rgtp)
+            self.add_rule('{0}_bind'.format(product_rt),
+                          self.pattern(previous_product) + self.pattern('Ras_GTP') | self.pattern(product_rt),
+                          'k_sos_on_rgtp', 'k_sos_off_rgtp')
 
         return product_rd, product_rt
 
@@ -505,36 +518,36 @@ class PysbTcrSelfWithForeign(object):
         product_rt_rd = previous_product_rt + "_Ras_GDP"
 
         if i == "Ls":
-            Parameter('k_rgdp_on_sos_rgtp', self.rate_constants.k_rgdp_on_sos_rgtp)
-            Parameter('k_rgdp_off_sos_rgtp', self.rate_constants.k_rgdp_off_sos_rgtp)
-            Parameter('k_cat_3', self.rate_constants.k_cat_3)
+            self.add_parameter('k_rgdp_on_sos_rgtp', self.rate_constants.k_rgdp_on_sos_rgtp)
+            self.add_parameter('k_rgdp_off_sos_rgtp', self.rate_constants.k_rgdp_off_sos_rgtp)
+            self.add_parameter('k_cat_3', self.rate_constants.k_cat_3)
 
-            add_new_monomer(product_rt_rd)
+            self.add_new_monomer(product_rt_rd)
 
-            Rule('{0}_bind'.format(product_rt_rd),
-                 eval('{0}()'.format(previous_product_rt)) + Ras_GDP() | eval('{0}()'.format(product_rt_rd)),
-                 k_rgdp_on_sos_rgtp, k_rgdp_off_sos_rgtp)
+            self.add_rule('{0}_bind'.format(product_rt_rd),
+                          self.pattern(previous_product_rt) + self.pattern('Ras_GDP') | self.pattern(product_rt_rd),
+                          'k_rgdp_on_sos_rgtp', 'k_rgdp_off_sos_rgtp')
 
-            Rule('{0}_cat'.format(product_rt_rd),
-                 eval('{0}()'.format(product_rt_rd)) >> eval('{0}()'.format(previous_product_rt)) + Ras_GTP(),
-                 k_cat_3)
+            self.add_rule('{0}_cat'.format(product_rt_rd),
+                          self.pattern(product_rt_rd) >> self.pattern(previous_product_rt) + self.pattern('Ras_GTP'),
+                          'k_cat_3')
 
         product_rd_rd = previous_product_rd + "_Ras_GDP"
 
         if i == "Ls":
-            Parameter('k_rgdp_on_sos_rgdp', self.rate_constants.k_rgdp_on_sos_rgdp)
-            Parameter('k_rgdp_off_sos_rgdp', self.rate_constants.k_rgdp_off_sos_rgdp)
-            Parameter('k_cat_4', self.rate_constants.k_cat_4)
+            self.add_parameter('k_rgdp_on_sos_rgdp', self.rate_constants.k_rgdp_on_sos_rgdp)
+            self.add_parameter('k_rgdp_off_sos_rgdp', self.rate_constants.k_rgdp_off_sos_rgdp)
+            self.add_parameter('k_cat_4', self.rate_constants.k_cat_4)
 
-            add_new_monomer(product_rd_rd)
+            self.add_new_monomer(product_rd_rd)
 
-            Rule('{0}_bind'.format(product_rd_rd),
-                 eval('{0}()'.format(previous_product_rd)) + Ras_GDP() | eval('{0}()'.format(product_rd_rd)),
-                 k_rgdp_on_sos_rgdp, k_rgdp_off_sos_rgdp)
+            self.add_rule('{0}_bind'.format(product_rd_rd),
+                          self.pattern(previous_product_rd) + self.pattern('Ras_GDP') | self.pattern(product_rd_rd),
+                          'k_rgdp_on_sos_rgdp', 'k_rgdp_off_sos_rgdp')
 
-            Rule('{0}_cat'.format(product_rd_rd),
-                 eval('{0}()'.format(product_rd_rd)) >> eval('{0}()'.format(previous_product_rd)) + Ras_GTP(),
-                 k_cat_4)
+            self.add_rule('{0}_cat'.format(product_rd_rd),
+                          self.pattern(product_rd_rd) >> self.pattern(previous_product_rd) + self.pattern('Ras_GTP'),
+                          'k_cat_4')
 
         # Deactivate - convert Ras_GTP to Ras_GDP
 
@@ -542,36 +555,36 @@ class PysbTcrSelfWithForeign(object):
         new_product = "Ras_GTP"
 
         if i == "Ls":
-            Parameter('k_rgap_on_rgtp', self.rate_constants.k_rgap_on_rgtp)
-            Parameter('k_rgap_off_rgtp', self.rate_constants.k_rgap_off_rgtp)
-            Parameter('k_cat_5', self.rate_constants.k_cat_5)
+            self.add_parameter('k_rgap_on_rgtp', self.rate_constants.k_rgap_on_rgtp)
+            self.add_parameter('k_rgap_off_rgtp', self.rate_constants.k_rgap_off_rgtp)
+            self.add_parameter('k_cat_5', self.rate_constants.k_cat_5)
 
-            add_new_monomer(product)
+            self.add_new_monomer(product)
 
-            Rule('{0}_bind'.format(product),
-                 Ras_GAP() + Ras_GTP() | eval('{0}()'.format(product)),
-                 k_rgap_on_rgtp, k_rgap_off_rgtp)
+            self.add_rule('{0}_bind'.format(product),
+                          self.pattern('Ras_GAP') + self.pattern('Ras_GTP') | self.pattern(product),
+                          'k_rgap_on_rgtp', 'k_rgap_off_rgtp')
 
-            add_observable(product)
+            self.add_observable(product)
 
-            Rule('{0}_cat'.format(product),
-                 eval('{0}()'.format(product)) >> Ras_GAP() + Ras_GDP(),
-                 k_cat_5)
+            self.add_rule('{0}_cat'.format(product),
+                          self.pattern(product) >> self.pattern('Ras_GAP') + self.pattern('Ras_GDP'),
+                          'k_cat_5')
 
-            add_observable(new_product)
+            self.add_observable(new_product)
 
         return new_product
 
     def add_positive_feedback_nonspecific(self, i):
 
         if i == "Ls":
-            Parameter('k_positive_fb', self.rate_constants.k_positive_loop)
+            self.add_parameter('k_positive_fb', self.rate_constants.k_positive_loop)
 
         product = self.non_specific_step_8(i)
         if i == "Ls":
-            Rule("{0}_posfb".format(product),
-                 eval('{0}()'.format(product)) + eval('{0}()'.format("LATP")) >> eval(
-                     '{0}()'.format(product)) + eval('{0}()'.format(product)), k_positive_fb)
+            self.add_rule("{0}_posfb".format(product),
+                          self.pattern(product) + self.pattern("LATP") >> self.pattern(product) + self.pattern(product),
+                          'k_positive_fb')
 
         return product
 
@@ -618,24 +631,43 @@ class PysbTcrSelfWithForeign(object):
 
         return observables
 
-    def main_truncated_time(self):
+    def readout_tspan(self, readout_times=None):
+        '''Integration grid that stops at the latest readout time, plus the index of each readout time in it. The
+        default readout is the third point of self.tspan.'''
+        if readout_times is None:
+            readout_times = [self.tspan[2]]
+        readout_times = np.asarray(readout_times, dtype=float)
+        tspan = np.unique(np.concatenate([[0.0], readout_times]))
+        return tspan, np.searchsorted(tspan, readout_times)
+
+    def main_truncated_time(self, batch=False, workers=1, readout_times=None):
         output = []
         ligand_array = []
-        observables = self.make_model()
+        observables = self.build_network()
 
         write_columns(observables)
-        write_model_attributes(self.model.rules, "rules")
-        write_model_attributes(self.model.parameters, "parameters")
-        write_model_attributes(self.model.observables, "observables")
+        write_model_attributes(self.network['rules'], "rules")
+        write_model_attributes(self.network['model_parameters'], "parameters")
+        write_model_attributes(self.network['model_observables'], "observables")
 
-        np.savetxt("time", self.tspan, fmt='%f')
-        time_index = 2
+        tspan, time_index = self.readout_tspan(readout_times)
+        np.savetxt("time", tspan, fmt='%f')
+        np.savetxt("seed", [self.seed], fmt='%d')
+        np.savetxt("ligand_weights", self.weights, fmt='%e')
+        np.savetxt("truncated_time", tspan[time_index], fmt='%f')
+
+        if batch or workers > 1:
+            output_array, ligand_array, settling_time = self.main_batch(observables, workers=workers, tspan=tspan)
+            np.savetxt("Ligand_concentrations", ligand_array, fmt='%f')
+            np.savetxt("output", np.squeeze(output_array[:, time_index]), fmt='%f')
+            return
+
+        simulator = self.build_simulator()
 
         for ligand in self.p_ligand:
-            self.model.parameters['Ls_0'].value = ligand
             ligand_array.append(ligand)
 
-            y = odesolve(self.model, self.tspan, compiler="python")
+            y = simulator.run(tspan, initials={'Ls_0': ligand}).sample(0)
 
             if len(observables) > 1:
                 output_array = y[observables[0]] + y[observables[1]]
@@ -649,27 +681,56 @@ class PysbTcrSelfWithForeign(object):
                 output_array = y[observables[0]]
                 output.append(output_array[time_index])
 
-        np.savetxt("truncated_time", [self.tspan[time_index]], fmt='%f')
         np.savetxt("Ligand_concentrations", ligand_array, fmt='%f')
-        np.savetxt("output", output, fmt='%f')
+        np.savetxt("output", np.squeeze(output), fmt='%f')
 
-    def main(self):
+    def main(self, batch=False, steady_state=False, continuation=False, workers=1, settling_tolerance=None,
+             settling_window=None, dose_response=False, exact_density=False, reduced=False, qssa=False):
         output = []
         ligand_array = []
-        observables = self.make_model()
+        settling_time = []
+        observables = self.build_network()
 
         write_columns(observables)
-        write_model_attributes(self.model.rules, "rules")
-        write_model_attributes(self.model.parameters, "parameters")
-        write_model_attributes(self.model.observables, "observables")
+        write_model_attributes(self.network['rules'], "rules")
+        write_model_attributes(self.network['model_parameters'], "parameters")
+        write_model_attributes(self.network['model_observables'], "observables")
 
         np.savetxt("time", self.tspan, fmt='%f')
+        np.savetxt("seed", [self.seed], fmt='%d')
+        np.savetxt("ligand_weights", self.weights, fmt='%e')
+
+        if qssa:
+            self.write_qssa_report(observables)
+
+        if batch or steady_state or workers > 1 or dose_response or exact_density:
+            output_array, ligand_array, settling_time = self.main_batch(
+                observables, steady_state=steady_state, continuation=continuation, workers=workers,
+                settling_tolerance=settling_tolerance, settling_window=settling_window,
+                dose_response=dose_response or exact_density, exact_density=exact_density, reduced=reduced,
+                qssa=qssa)
+            np.savetxt("Ligand_concentrations", ligand_array, fmt='%f')
+            np.savetxt("output", output_array[:, -1], fmt='%f')
+            if settling_tolerance is not None:
+                np.savetxt("settling_time", settling_time, fmt='%f')
+            if dose_response:
+                np.savetxt("dose_response", np.column_stack([self.dose_response.doses, self.dose_response.responses]),
+                           fmt='%f')
+                np.savetxt("interpolation_error", [self.dose_response.error], fmt='%e')
+            if exact_density:
+                np.savetxt("output_density", np.column_stack(self.dose_response.output_density(self.mu, self.sigma)),
+                           fmt='%e')
+            return
+
+        simulator = self.build_simulator(reduced, qssa)
 
         for ligand in self.p_ligand:
-            self.model.parameters['Ls_0'].value = ligand
             ligand_array.append(ligand)
 
-            y = odesolve(self.model, self.tspan, compiler="python")
+            result = simulator.run(self.tspan, initials={'Ls_0': ligand}, settling_tolerance=settling_tolerance,
+                                   settling_window=settling_window)
+            y = result.sample(0)
+            settling_time.append(result.settling_time[0])
 
             if len(observables) > 1:
                 output_array = y[observables[0]] + y[observables[1]]
@@ -685,35 +746,211 @@ class PysbTcrSelfWithForeign(object):
 
         np.savetxt("Ligand_concentrations", ligand_array, fmt='%f')
         np.savetxt("output", output, fmt='%f')
+        if settling_tolerance is not None:
+            np.savetxt("settling_time", settling_time, fmt='%f')
+
+    def build_network(self):
+        self.network = cached_network(self)
+        return self.network['outputs']
+
+    def build_simulator(self, reduced=False, qssa=False, batched=False):
+        '''reduced integrates with the conservation laws eliminated (ReducedOdeSimulator), qssa with the fast species
+        at quasi-steady state (QssaOdeSimulator). The solver settings stored by solver_selection.py for batched or
+        one-at-a-time runs are applied.'''
+        if qssa:
+            simulator_class = QssaOdeSimulator
+        elif reduced:
+            simulator_class = ReducedOdeSimulator
+        else:
+            simulator_class = OdeSimulator
+        settings = solver_settings(self, batched)
+        if type(self.simulator) is not simulator_class or self.simulator.model is not self.model or \
+                self.simulator_settings != settings:
+            self.simulator = simulator_class(self.model, network=self.network, **settings)
+            self.simulator_settings = settings
+        return self.simulator
+
+    def solve_samples(self, ligands, observables, steady_state=False, continuation=False, tspan=None,
+                      settling_tolerance=None, settling_window=None, reduced=False, qssa=False, foreign=None,
+                      param_values=None):
+        '''foreign, when given, sets the number of foreign ligands of each sample instead of self.lf; param_values
+        overrides parameter values of the built network.'''
+        if steady_state and qssa:
+            raise ValueError("QSSA only applies to time integration; the steady states of the full model are exact")
+
+        simulator = self.build_simulator(reduced, qssa, batched=True)
+        tspan = self.tspan if tspan is None else tspan
+        initials = {'Ls_0': ligands}
+        if foreign is not None:
+            initials['Lf_0'] = foreign
+
+        if steady_state and continuation:
+            if foreign is not None:
+                raise ValueError("Continuation sweeps Ls_0 alone; solve samples with varying Lf_0 directly")
+            y = SteadyStateSolver(simulator).continuation('Ls_0', ligands, param_values=param_values)
+        elif steady_state:
+            y = SteadyStateSolver(simulator).solve(initials=initials, param_values=param_values)
+        else:
+            y = simulator.run(tspan, initials=initials, param_values=param_values,
+                              settling_tolerance=settling_tolerance, settling_window=settling_window)
+
+        output_array = y.observable(observables[0])
+        if len(observables) > 1:
+            output_array = output_array + y.observable(observables[1])
+
+        return output_array, y.settling_time
+
+    def solve_paired(self, ligands, observables, **options):
+        '''Outputs of every ligand sample without and with the foreign ligands, solved in one batched pass. The self
+        condition is this self_foreign network with Lf_0 = 0, whose foreign species then stay at zero, so both
+        conditions share the samples and the model. options are passed to solve_samples.'''
+        if not self.self_foreign:
+            raise ValueError("Paired runs need the self_foreign model, which includes the foreign ligand")
+
+        ligands = np.asarray(ligands, dtype=float)
+        foreign = np.concatenate([np.zeros(len(ligands)), np.full(len(ligands), float(self.lf))])
+        output_array, settling_time = self.solve_samples(np.concatenate([ligands, ligands]), observables,
+                                                         foreign=foreign, **options)
+        return output_array[:len(ligands)], output_array[len(ligands):], settling_time
+
+    def main_paired(self, steady_state=False, reduced=False, num_bootstrap=200):
+        '''Writes Ls/ and Ls_Lf_{lf}/ as the separate runs do, but from one set of ligand samples solved in one
+        batched pass (common random numbers). paired_capacity holds the capacity with the standard error and 95%
+        interval of a bootstrap that resamples the shared samples.'''
+        observables = self.build_network()
+        ligand_array = np.array(self.p_ligand, dtype=float)
+        self_output, foreign_output, settling_time = self.solve_paired(ligand_array, observables,
+                                                                       steady_state=steady_state, reduced=reduced)
+
+        for directory, output, columns in [("Ls", self_output, observables[:1]),
+                                           ("Ls_Lf_{0}".format(self.lf), foreign_output, observables)]:
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            write_columns(columns, os.path.join(directory, "column_names"))
+            np.savetxt(os.path.join(directory, "time"), self.tspan, fmt='%f')
+            np.savetxt(os.path.join(directory, "seed"), [self.seed], fmt='%d')
+            np.savetxt(os.path.join(directory, "ligand_weights"), self.weights, fmt='%e')
+            np.savetxt(os.path.join(directory, "Ligand_concentrations"), ligand_array, fmt='%f')
+            np.savetxt(os.path.join(directory, "output"), output[:, -1], fmt='%f')
+
+        capacity, error, interval = paired_bootstrap_capacity(foreign_output[:, -1], self_output[:, -1],
+                                                              weights=self.weights, num_bootstrap=num_bootstrap,
+                                                              seed=self.seed)
+        np.savetxt("paired_capacity", [[capacity, error, interval[0], interval[1]]], fmt='%f',
+                   header="capacity standard_error ci_low ci_high")
+
+    def output_sensitivity(self, ligands, observables, parameters=None, tspan=None, foreign=None, param_values=None):
+        '''Output and d(output)/d(log k) at the end of tspan for each ligand dose, with shapes (n_doses,) and
+        (n_doses, n_parameters), from one forward sensitivity solve; parameters default to every rate constant.
+        foreign and param_values are as in solve_samples.'''
+        analysis = ForwardSensitivity(self.build_simulator(batched=True), parameters)
+        initials = {'Ls_0': ligands}
+        if foreign is not None:
+            initials['Lf_0'] = foreign
+        result = analysis.run(self.tspan if tspan is None else tspan, initials=initials, param_values=param_values)
+
+        output = sum(result.observable(name)[:, -1] for name in observables)
+        sensitivity = sum(result.observable_sensitivity(name)[:, -1] for name in observables)
+        return output, sensitivity, analysis.parameters
+
+    def main_sensitivity(self, doses=None, parameters=None):
+        '''Writes, for each ligand dose (default: the lognormal mean and +/- 1 and 2 sigma), the rate constants
+        ranked by the magnitude of d(output)/d(log k) to sensitivity_Ls_<dose>.'''
+        observables = self.build_network()
+        if doses is None:
+            doses = np.round(np.exp(self.mu + self.sigma * np.arange(-2, 3)))
+        doses = np.asarray(doses, dtype=float)
+
+        output, sensitivity, parameters = self.output_sensitivity(doses, observables, parameters)
+        defaults = dict(self.network['parameters'])
+        for k, dose in enumerate(doses):
+            with open("sensitivity_Ls_{0:g}".format(dose), "w") as f:
+                f.write("# Ls_0 = {0:g}, output = {1:f}\n".format(dose, output[k]))
+                f.write("parameter value d_output_d_log_k d_log_output_d_log_k\n")
+                for name, value, derivative, normalised in ranked_sensitivities(
+                        parameters, [defaults[name] for name in parameters], sensitivity[k], output[k]):
+                    f.write("{0} {1:e} {2:e} {3:e}\n".format(name, value, derivative, normalised))
+
+    def write_qssa_report(self, observables, num_validation=10):
+        '''Writes the species and reactions the QSSA treats as fast, and the largest error of the QSSA output against
+        the full model over the run, relative to the full output's range, at num_validation quantiles of the ligand
+        samples.'''
+        ligands = np.quantile(np.array(self.p_ligand, dtype=float), np.linspace(0, 1, num_validation))
+        full = self.solve_samples(ligands, observables)[0]
+        approximate = self.solve_samples(ligands, observables, qssa=True)[0]
+
+        write_model_attributes([self.network['species'][i] for i in self.simulator.fast], "qssa_species")
+        write_model_attributes([self.network['reactions'][k] for k in self.simulator.fast_reactions],
+                               "qssa_reactions")
+        np.savetxt("qssa_error", [qssa_error(full, approximate)], fmt='%e')
+
+    def main_batch(self, observables, steady_state=False, continuation=False, workers=1, tspan=None,
+                   settling_tolerance=None, settling_window=None, dose_response=False, exact_density=False,
+                   reduced=False, qssa=False):
+        '''With dose_response, the final output is solved on an adaptive log grid of doses spanning the samples and
+        interpolated for every sample (self.dose_response holds the grid and its error estimate); settling times are
+        then not recorded. exact_density widens the grid to mu +/- 5 sigma in log(dose), so that the curve covers
+        almost all of the ligand distribution for DoseResponse.output_density.'''
+        ligand_array = np.array(self.p_ligand, dtype=float)
+        options = dict(steady_state=steady_state, continuation=continuation, tspan=tspan,
+                       settling_tolerance=settling_tolerance, settling_window=settling_window, reduced=reduced,
+                       qssa=qssa)
+
+        # One pool for the whole sweep, also across the refinement rounds of the dose-response fit
+        pool = worker_pool(self, workers) if workers > 1 else None
+
+        def solve(ligands):
+            if pool is not None:
+                return parallel_sweep(self, ligands, workers, pool=pool, **options)
+            return self.solve_samples(ligands, observables, **options)
+
+        try:
+            if dose_response:
+                self.dose_response = DoseResponse(lambda doses: solve(doses)[0][:, -1])
+                if exact_density:
+                    low, high = np.exp(self.mu - 5 * self.sigma), np.exp(self.mu + 5 * self.sigma)
+                else:
+                    low, high = None, None
+                output_array = self.dose_response.fit_samples(ligand_array, low=low, high=high)[:, None]
+                return output_array, ligand_array, np.full(len(ligand_array), np.nan)
+
+            output_array, settling_time = solve(ligand_array)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+
+        return output_array, ligand_array, settling_time
 
 
 class NonSpecificEarlyPositiveFeedback(PysbTcrSelfWithForeign):
-    def __init__(self, steps=3, self_foreign=False, lf=30):
-        PysbTcrSelfWithForeign.__init__(self, steps=steps, self_foreign=self_foreign, lf=lf)
+    def __init__(self, steps=3, self_foreign=False, lf=30, seed=None, num_samples=1000, sampling='random'):
+        PysbTcrSelfWithForeign.__init__(self, steps=steps, self_foreign=self_foreign, lf=lf, seed=seed,
+                                        num_samples=num_samples, sampling=sampling)
 
     def step_4(self, i):
 
         if i == "Ls":
             if self.p_flag:
-                Parameter('k_p_on_zap_species', self.parameters['k_p_on_zap_species'])
+                self.add_parameter('k_p_on_zap_species', self.parameters['k_p_on_zap_species'])
             else:
-                Parameter('k_p_on_zap_species', self.rate_constants.k_p_on_zap_species)
+                self.add_parameter('k_p_on_zap_species', self.rate_constants.k_p_on_zap_species)
 
-            Parameter('k_p_off_zap_species', self.rate_constants.k_p_off_zap_species)
+            self.add_parameter('k_p_off_zap_species', self.rate_constants.k_p_off_zap_species)
 
         previous_product = self.cycle_3(i)
         product = "Zap_P"
         if i == "Ls":
-            add_new_monomer(product)
+            self.add_new_monomer(product)
 
-        Rule('{0}_cat'.format(previous_product),
-             eval('{0}()'.format(previous_product)) >> eval('{0}()'.format("RP{0}_Lck".format(i))) +
-             eval('{0}()'.format(product)), k_p_on_zap_species)
+        self.add_rule('{0}_cat'.format(previous_product),
+                      self.pattern(previous_product) >> self.pattern("RP{0}_Lck".format(i)) +
+                      self.pattern(product), 'k_p_on_zap_species')
 
         if i == "Ls":
-            add_observable(product)
+            self.add_observable(product)
 
-            Rule("{0}_uncat".format(product), eval('{0}()'.format(product)) >> Zap(), k_p_off_R_pmhc)
+            self.add_rule("{0}_uncat".format(product), self.pattern(product) >> self.pattern('Zap'), 'k_p_off_R_pmhc')
 
         return product
 
@@ -722,26 +959,26 @@ class NonSpecificEarlyPositiveFeedback(PysbTcrSelfWithForeign):
         product_rd = previous_product + "_Ras_GDP"
 
         if i == "Ls":
-            Parameter('k_sos_on_rgdp', self.rate_constants.k_sos_on_rgdp)
-            Parameter('k_sos_off_rgdp', self.rate_constants.k_sos_off_rgdp)
+            self.add_parameter('k_sos_on_rgdp', self.rate_constants.k_sos_on_rgdp)
+            self.add_parameter('k_sos_off_rgdp', self.rate_constants.k_sos_off_rgdp)
 
-            add_new_monomer(product_rd)
+            self.add_new_monomer(product_rd)
 
-            Rule('{0}_bind'.format(product_rd),
-                 eval('{0}()'.format(previous_product)) + Ras_GDP() | eval('{0}()'.format(product_rd)),
-                 k_sos_on_rgdp, k_sos_off_rgdp)
+            self.add_rule('{0}_bind'.format(product_rd),
+                          self.pattern(previous_product) + self.pattern('Ras_GDP') | self.pattern(product_rd),
+                          'k_sos_on_rgdp', 'k_sos_off_rgdp')
 
         product_rt = previous_product + "_Ras_GTP"
 
         if i == "Ls":
-            Parameter('k_sos_on_rgtp', self.rate_constants.k_sos_on_rgtp)
-            Parameter('k_sos_off_rgtp', self.rate_constants.k_sos_off_rgtp)
+            self.add_parameter('k_sos_on_rgtp', self.rate_constants.k_sos_on_rgtp)
+            self.add_parameter('k_sos_off_rgtp', self.rate_constants.k_sos_off_rgtp)
 
-            add_new_monomer(product_rt)
+            self.add_new_monomer(product_rt)
 
-            Rule('{0}_bind'.format(product_rt),
-                 eval('{0}()'.format(previous_product)) + Ras_GTP() | eval('{0}()'.format(product_rt)),
-                 k_sos_on_rgtp, k_sos_off_rgtp)
+            self.add_rule('{0}_bind'.format(product_rt),
+                          self.pattern(previous_product) + self.pattern('Ras_GTP') | self.pattern(product_rt),
+                          'k_sos_on_rgtp', 'k_sos_off_rgtp')
 
         return product_rd, product_rt
 
@@ -772,53 +1009,55 @@ class NonSpecificEarlyPositiveFeedback(PysbTcrSelfWithForeign):
 
 
 class EarlyPositiveFeedback(PysbTcrSelfWithForeign):
-    def __init__(self, steps=3, self_foreign=False, lf=30):
-        PysbTcrSelfWithForeign.__init__(self, steps=steps, self_foreign=self_foreign, lf=lf)
+    def __init__(self, steps=3, self_foreign=False, lf=30, seed=None, num_samples=1000, sampling='random'):
+        PysbTcrSelfWithForeign.__init__(self, steps=steps, self_foreign=self_foreign, lf=lf, seed=seed,
+                                        num_samples=num_samples, sampling=sampling)
 
     def add_step_8_sos(self, i):
         if i == "Ls":
             if self.p_flag:
-                Parameter('k_sos_on', self.parameters['k_8_1'])
+                self.add_parameter('k_sos_on', self.parameters['k_8_1'])
             else:
-                Parameter('k_sos_on', self.rate_constants.k_sos_on)
+                self.add_parameter('k_sos_on', self.rate_constants.k_sos_on)
 
-            Parameter('k_sos_off', self.rate_constants.k_sos_off)
+            self.add_parameter('k_sos_off', self.rate_constants.k_sos_off)
 
         previous_product = self.cycle_3(i)
         product = previous_product + "_Sos"
 
-        add_new_monomer(product)
-        Rule("{0}_bind".format(product), eval('{0}()'.format(previous_product)) + Sos() | eval('{0}()'.format(product)),
-             k_sos_on, k_sos_off)
-        add_observable(product)
+        self.add_new_monomer(product)
+        self.add_rule("{0}_bind".format(product),
+                      self.pattern(previous_product) + self.pattern('Sos') | self.pattern(product),
+                      'k_sos_on', 'k_sos_off')
+        self.add_observable(product)
 
         return product
 
     def add_step_9(self, i):
         if i == "Ls":
-            Parameter('k_sos_on_rgdp', self.rate_constants.k_sos_on_rgdp)
-            Parameter('k_sos_off_rgdp', self.rate_constants.k_sos_off_rgdp)
+            self.add_parameter('k_sos_on_rgdp', self.rate_constants.k_sos_on_rgdp)
+            self.add_parameter('k_sos_off_rgdp', self.rate_constants.k_sos_off_rgdp)
 
         previous_product = self.cycle_3(i)
         product_rd = previous_product + "_Ras_GDP"
 
-        add_new_monomer(product_rd)
+        self.add_new_monomer(product_rd)
 
-        Rule('{0}_bind'.format(product_rd),
-             eval('{0}()'.format(previous_product)) + Ras_GDP() | eval('{0}()'.format(product_rd)),
-             k_sos_on_rgdp, k_sos_off_rgdp)
+        self.add_rule('{0}_bind'.format(product_rd),
+                      self.pattern(previous_product) + self.pattern('Ras_GDP') | self.pattern(product_rd),
+                      'k_sos_on_rgdp', 'k_sos_off_rgdp')
 
         product_rt = previous_product + "_Ras_GTP"
 
         if i == "Ls":
-            Parameter('k_sos_on_rgtp', self.rate_constants.k_sos_on_rgtp)
-            Parameter('k_sos_off_rgtp', self.rate_constants.k_sos_off_rgtp)
+            self.add_parameter('k_sos_on_rgtp', self.rate_constants.k_sos_on_rgtp)
+            self.add_parameter('k_sos_off_rgtp', self.rate_constants.k_sos_off_rgtp)
 
-        add_new_monomer(product_rt)
+        self.add_new_monomer(product_rt)
 
-        Rule('{0}_bind'.format(product_rt),
-             eval('{0}()'.format(previous_product)) + Ras_GTP() | eval('{0}()'.format(product_rt)),
-             k_sos_on_rgtp, k_sos_off_rgtp)
+        self.add_rule('{0}_bind'.format(product_rt),
+                      self.pattern(previous_product) + self.pattern('Ras_GTP') | self.pattern(product_rt),
+                      'k_sos_on_rgtp', 'k_sos_off_rgtp')
 
         return product_rd, product_rt
 
@@ -827,36 +1066,36 @@ class EarlyPositiveFeedback(PysbTcrSelfWithForeign):
         product_rt_rd = previous_product_rt + "_Ras_GDP"
 
         if i == "Ls":
-            Parameter('k_rgdp_on_sos_rgtp', self.rate_constants.k_rgdp_on_sos_rgtp)
-            Parameter('k_rgdp_off_sos_rgtp', self.rate_constants.k_rgdp_off_sos_rgtp)
-            Parameter('k_cat_3', self.rate_constants.k_cat_3)
+            self.add_parameter('k_rgdp_on_sos_rgtp', self.rate_constants.k_rgdp_on_sos_rgtp)
+            self.add_parameter('k_rgdp_off_sos_rgtp', self.rate_constants.k_rgdp_off_sos_rgtp)
+            self.add_parameter('k_cat_3', self.rate_constants.k_cat_3)
 
-        add_new_monomer(product_rt_rd)
+        self.add_new_monomer(product_rt_rd)
 
-        Rule('{0}_bind'.format(product_rt_rd),
-             eval('{0}()'.format(previous_product_rt)) + Ras_GDP() | eval('{0}()'.format(product_rt_rd)),
-             k_rgdp_on_sos_rgtp, k_rgdp_off_sos_rgtp)
+        self.add_rule('{0}_bind'.format(product_rt_rd),
+                      self.pattern(previous_product_rt) + self.pattern('Ras_GDP') | self.pattern(product_rt_rd),
+                      'k_rgdp_on_sos_rgtp', 'k_rgdp_off_sos_rgtp')
 
-        Rule('{0}_cat'.format(product_rt_rd),
-             eval('{0}()'.format(product_rt_rd)) >> eval('{0}()'.format(previous_product_rt)) + Ras_GTP(),
-             k_cat_3)
+        self.add_rule('{0}_cat'.format(product_rt_rd),
+                      self.pattern(product_rt_rd) >> self.pattern(previous_product_rt) + self.pattern('Ras_GTP'),
+                      'k_cat_3')
 
         product_rd_rd = previous_product_rd + "_Ras_GDP"
 
         if i == "Ls":
-            Parameter('k_rgdp_on_sos_rgdp', self.rate_constants.k_rgdp_on_sos_rgdp)
-            Parameter('k_rgdp_off_sos_rgdp', self.rate_constants.k_rgdp_off_sos_rgdp)
-            Parameter('k_cat_4', self.rate_constants.k_cat_4)
+            self.add_parameter('k_rgdp_on_sos_rgdp', self.rate_constants.k_rgdp_on_sos_rgdp)
+            self.add_parameter('k_rgdp_off_sos_rgdp', self.rate_constants.k_rgdp_off_sos_rgdp)
+            self.add_parameter('k_cat_4', self.rate_constants.k_cat_4)
 
-        add_new_monomer(product_rd_rd)
+        self.add_new_monomer(product_rd_rd)
 
-        Rule('{0}_bind'.format(product_rd_rd),
-             eval('{0}()'.format(previous_product_rd)) + Ras_GDP() | eval('{0}()'.format(product_rd_rd)),
-             k_rgdp_on_sos_rgdp, k_rgdp_off_sos_rgdp)
+        self.add_rule('{0}_bind'.format(product_rd_rd),
+                      self.pattern(previous_product_rd) + self.pattern('Ras_GDP') | self.pattern(product_rd_rd),
+                      'k_rgdp_on_sos_rgdp', 'k_rgdp_off_sos_rgdp')
 
-        Rule('{0}_cat'.format(product_rd_rd),
-             eval('{0}()'.format(product_rd_rd)) >> eval('{0}()'.format(previous_product_rd)) + Ras_GTP(),
-             k_cat_4)
+        self.add_rule('{0}_cat'.format(product_rd_rd),
+                      self.pattern(product_rd_rd) >> self.pattern(previous_product_rd) + self.pattern('Ras_GTP'),
+                      'k_cat_4')
 
         # Deactivate - convert Ras_GTP to Ras_GDP
 
@@ -864,23 +1103,23 @@ class EarlyPositiveFeedback(PysbTcrSelfWithForeign):
         new_product = "Ras_GTP"
 
         if i == "Ls":
-            Parameter('k_rgap_on_rgtp', self.rate_constants.k_rgap_on_rgtp)
-            Parameter('k_rgap_off_rgtp', self.rate_constants.k_rgap_off_rgtp)
-            Parameter('k_cat_5', self.rate_constants.k_cat_5)
+            self.add_parameter('k_rgap_on_rgtp', self.rate_constants.k_rgap_on_rgtp)
+            self.add_parameter('k_rgap_off_rgtp', self.rate_constants.k_rgap_off_rgtp)
+            self.add_parameter('k_cat_5', self.rate_constants.k_cat_5)
 
-            add_new_monomer(product)
+            self.add_new_monomer(product)
 
-            Rule('{0}_bind'.format(product),
-                 Ras_GAP() + Ras_GTP() | eval('{0}()'.format(product)),
-                 k_rgap_on_rgtp, k_rgap_off_rgtp)
+            self.add_rule('{0}_bind'.format(product),
+                          self.pattern('Ras_GAP') + self.pattern('Ras_GTP') | self.pattern(product),
+                          'k_rgap_on_rgtp', 'k_rgap_off_rgtp')
 
-            add_observable(product)
+            self.add_observable(product)
 
-            Rule('{0}_cat'.format(product),
-                 eval('{0}()'.format(product)) >> Ras_GAP() + Ras_GDP(),
-                 k_cat_5)
+            self.add_rule('{0}_cat'.format(product),
+                          self.pattern(product) >> self.pattern('Ras_GAP') + self.pattern('Ras_GDP'),
+                          'k_cat_5')
 
-            add_observable(new_product)
+            self.add_observable(new_product)
 
         return new_product
 
@@ -909,25 +1148,26 @@ class EarlyPositiveFeedback(PysbTcrSelfWithForeign):
 
 
 class LatPhosphorylationExtension(PysbTcrSelfWithForeign):
-    def __init__(self, steps=8, self_foreign=False, lf=30):
-        PysbTcrSelfWithForeign.__init__(self, steps=steps, self_foreign=self_foreign, lf=lf)
+    def __init__(self, steps=8, self_foreign=False, lf=30, seed=None, num_samples=1000, sampling='random'):
+        PysbTcrSelfWithForeign.__init__(self, steps=steps, self_foreign=self_foreign, lf=lf, seed=seed,
+                                        num_samples=num_samples, sampling=sampling)
 
     def cycle_7(self, i):
 
         if i == "Ls":
             if self.p_flag:
-                Parameter('kp_on_lat1', self.parameters['kp_on_lat1'])
+                self.add_parameter('kp_on_lat1', self.parameters['kp_on_lat1'])
             else:
-                Parameter('kp_on_lat1', self.rate_constants.k_p_lat_1)
-            Parameter('kp_off_lat1', self.rate_constants.k_p_lat_off_species)
+                self.add_parameter('kp_on_lat1', self.rate_constants.k_p_lat_1)
+            self.add_parameter('kp_off_lat1', self.rate_constants.k_p_lat_off_species)
 
         previous_product = self.cycle_6(i)
         product = "RP{0}_Lck_Zap_P_LATP".format(i)
-        add_new_monomer(product)
+        self.add_new_monomer(product)
 
-        Rule("{0}_bind".format(product), eval('{0}()'.format(previous_product)) | eval('{0}()'.format(product)),
-             kp_on_lat1, kp_off_lat1)
-        add_observable(product)
+        self.add_rule("{0}_bind".format(product), self.pattern(previous_product) | self.pattern(product),
+                      'kp_on_lat1', 'kp_off_lat1')
+        self.add_observable(product)
 
         no_ligand = self.unbind_ligand(i, product)
 
@@ -942,18 +1182,18 @@ class LatPhosphorylationExtension(PysbTcrSelfWithForeign):
 
         if i == "Ls":
             if self.p_flag:
-                Parameter('kp_on_lat2', self.parameters['kp_on_lat2'])
+                self.add_parameter('kp_on_lat2', self.parameters['kp_on_lat2'])
             else:
-                Parameter('kp_on_lat2', self.rate_constants.k_p_lat_2)
-            Parameter('kp_off_lat2', self.rate_constants.k_p_lat_off_species)
+                self.add_parameter('kp_on_lat2', self.rate_constants.k_p_lat_2)
+            self.add_parameter('kp_off_lat2', self.rate_constants.k_p_lat_off_species)
 
         previous_product = self.cycle_7(i)
         product = "RP{0}_Lck_Zap_P_LATPP".format(i)
-        add_new_monomer(product)
+        self.add_new_monomer(product)
 
-        Rule("{0}_bind".format(product), eval('{0}()'.format(previous_product)) | eval('{0}()'.format(product)),
-             kp_on_lat2, kp_off_lat2)
-        add_observable(product)
+        self.add_rule("{0}_bind".format(product), self.pattern(previous_product) | self.pattern(product),
+                      'kp_on_lat2', 'kp_off_lat2')
+        self.add_observable(product)
 
         no_ligand = self.unbind_ligand(i, product)
 
@@ -997,43 +1237,44 @@ class LatPhosphorylationExtension(PysbTcrSelfWithForeign):
 
 
 class PysbTcrLckFeedbackLoop(PysbTcrSelfWithForeign):
-    def __init__(self, steps=8, self_foreign=False, lf=30):
-        PysbTcrSelfWithForeign.__init__(self, steps=steps, self_foreign=self_foreign, lf=lf)
+    def __init__(self, steps=8, self_foreign=False, lf=30, seed=None, num_samples=1000, sampling='random'):
+        PysbTcrSelfWithForeign.__init__(self, steps=steps, self_foreign=self_foreign, lf=lf, seed=seed,
+                                        num_samples=num_samples, sampling=sampling)
 
     def inactive_lck_off(self, no_ligand_product, k_off="k_lck_off_R"):
         new = no_ligand_product.replace("_LckI", "")
         self.add_new_monomer(new)
-        Rule('{0}_unbindLckI'.format(no_ligand_product),
-             eval('{0}()'.format(no_ligand_product)) | eval('{0}()'.format(new)) + LckI(),
-             eval(k_off), k_lck_on_R)
+        self.add_rule('{0}_unbindLckI'.format(no_ligand_product),
+                      self.pattern(no_ligand_product) | self.pattern(new) + self.pattern('LckI'),
+                      k_off, 'k_lck_on_R')
         return new
 
     def add_negative_feedback(self):
 
         if self.p_flag:
-            Parameter('k_lcki', self.parameters['k_lcki'])
+            self.add_parameter('k_lcki', self.parameters['k_lcki'])
         else:
-            Parameter('k_lcki', self.rate_constants.k_lcki)
+            self.add_parameter('k_lcki', self.rate_constants.k_lcki)
 
-        Rule('Neg_fb_2', LckI() >> Lck(), k_lcki)
+        self.add_rule('Neg_fb_2', self.pattern('LckI') >> self.pattern('Lck'), 'k_lcki')
 
     def cycle_4(self, i):
 
         if i == "Ls":
             if self.p_flag:
-                Parameter('k_p_on_zap_species', self.parameters['k_p_on_zap_species'])
+                self.add_parameter('k_p_on_zap_species', self.parameters['k_p_on_zap_species'])
             else:
-                Parameter('k_p_on_zap_species', self.rate_constants.k_p_on_zap_species)
+                self.add_parameter('k_p_on_zap_species', self.rate_constants.k_p_on_zap_species)
 
-            Parameter('k_p_off_zap_species', self.rate_constants.k_p_off_zap_species)
+            self.add_parameter('k_p_off_zap_species', self.rate_constants.k_p_off_zap_species)
 
         previous_product = self.cycle_3(i)
         product = "RP{0}_LckI_Zap_P".format(i)
-        add_new_monomer(product)
+        self.add_new_monomer(product)
 
-        Rule('{0}_cat'.format(product), eval('{0}()'.format(previous_product)) | eval('{0}()'.format(product)),
-             k_p_on_zap_species, k_p_off_zap_species)
-        add_observable(product)
+        self.add_rule('{0}_cat'.format(product), self.pattern(previous_product) | self.pattern(product),
+                      'k_p_on_zap_species', 'k_p_off_zap_species')
+        self.add_observable(product)
 
         no_ligand = self.unbind_ligand(i, product)
 
@@ -1047,20 +1288,21 @@ class PysbTcrLckFeedbackLoop(PysbTcrSelfWithForeign):
 
         if i == "Ls":
             if self.p_flag:
-                Parameter('k_lat_on_species', self.parameters['k_lat_on_species'])
+                self.add_parameter('k_lat_on_species', self.parameters['k_lat_on_species'])
             else:
-                Parameter('k_lat_on_species', self.rate_constants.k_lat_on_species)
-            Parameter('k_lat_off_species', self.rate_constants.k_lat_off_species)
+                self.add_parameter('k_lat_on_species', self.rate_constants.k_lat_on_species)
+            self.add_parameter('k_lat_off_species', self.rate_constants.k_lat_off_species)
 
-            add_new_monomer("LckI")
+            self.add_new_monomer("LckI")
 
         previous_product = self.cycle_4(i)
         product = "RP{0}_LckI_Zap_P_LAT".format(i)
-        add_new_monomer(product)
+        self.add_new_monomer(product)
 
-        Rule("{0}_bind".format(product), eval('{0}()'.format(previous_product)) + LAT() | eval('{0}()'.format(product)),
-             k_lat_on_species, k_lat_off_species)
-        add_observable(product)
+        self.add_rule("{0}_bind".format(product),
+                      self.pattern(previous_product) + self.pattern('LAT') | self.pattern(product),
+                      'k_lat_on_species', 'k_lat_off_species')
+        self.add_observable(product)
 
         no_ligand = self.unbind_ligand(i, product)
 
@@ -1075,18 +1317,18 @@ class PysbTcrLckFeedbackLoop(PysbTcrSelfWithForeign):
 
         if i == "Ls":
             if self.p_flag:
-                Parameter('kp_on_lat1', self.parameters['kp_on_lat1'])
+                self.add_parameter('kp_on_lat1', self.parameters['kp_on_lat1'])
             else:
-                Parameter('kp_on_lat1', self.rate_constants.k_p_lat_1)
-            Parameter('kp_off_lat1', self.rate_constants.k_p_lat_off_species)
+                self.add_parameter('kp_on_lat1', self.rate_constants.k_p_lat_1)
+            self.add_parameter('kp_off_lat1', self.rate_constants.k_p_lat_off_species)
 
         previous_product = self.cycle_6(i)
         product = "RP{0}_LckI_Zap_P_LATP".format(i)
-        add_new_monomer(product)
+        self.add_new_monomer(product)
 
-        Rule("{0}_bind".format(product), eval('{0}()'.format(previous_product)) | eval('{0}()'.format(product)),
-             kp_on_lat1, kp_off_lat1)
-        add_observable(product)
+        self.add_rule("{0}_bind".format(product), self.pattern(previous_product) | self.pattern(product),
+                      'kp_on_lat1', 'kp_off_lat1')
+        self.add_observable(product)
 
         no_ligand = self.unbind_ligand(i, product)
 
@@ -1100,22 +1342,22 @@ class PysbTcrLckFeedbackLoop(PysbTcrSelfWithForeign):
     def step_8(self, i):
         if i == "Ls":
             if self.p_flag:
-                Parameter('k_p_lat_on_species', self.parameters['k_p_lat_on_species'])
+                self.add_parameter('k_p_lat_on_species', self.parameters['k_p_lat_on_species'])
             else:
-                Parameter('k_p_lat_on_species', self.rate_constants.k_p_lat_2)
+                self.add_parameter('k_p_lat_on_species', self.rate_constants.k_p_lat_2)
 
         previous_product = self.cycle_7(i)
         product = "LATPP"
         if i == "Ls":
-            add_new_monomer(product)
+            self.add_new_monomer(product)
 
-        Rule("{0}_cat".format(previous_product),
-             eval('{0}()'.format(previous_product)) >> eval('{0}()'.format("RP{0}_LckI_Zap_P".format(i))) + eval(
-                 '{0}()'.format(product)), k_p_lat_on_species)
+        self.add_rule("{0}_cat".format(previous_product),
+                      self.pattern(previous_product)
+                      >> self.pattern("RP{0}_LckI_Zap_P".format(i)) + self.pattern(product), 'k_p_lat_on_species')
         if i == "Ls":
-            add_observable(product)
+            self.add_observable(product)
 
-            Rule("{0}_uncat".format(product), eval('{0}()'.format(product)) >> LAT(), k_p_off_R_pmhc)
+            self.add_rule("{0}_uncat".format(product), self.pattern(product) >> self.pattern('LAT'), 'k_p_off_R_pmhc')
 
         return product
 
@@ -1166,30 +1408,86 @@ if __name__ == "__main__":
                         help='Flag for building and submitting early positive feedback loop.')
     parser.add_argument('--latpp_ext', dest='latpp_ext', action='store_true', default=False,
                         help='Building network with latpp attached to TCR complex.')
+    parser.add_argument('--batch', dest='batch', action='store_true', default=False,
+                        help='Integrate all ligand samples together as one stacked system.')
+    parser.add_argument('--steady_state', '--steady-state', dest='steady_state', action='store_true', default=False,
+                        help='Solve for the steady state directly instead of integrating to run_time.')
+    parser.add_argument('--continuation', dest='continuation', action='store_true', default=False,
+                        help='With --steady_state, sweep the sorted ligand samples warm-starting from each neighbour.')
+    parser.add_argument('--workers', dest='workers', action='store', type=int, default=1,
+                        help='Number of processes the ligand samples are split across.')
+    parser.add_argument('--seed', dest='seed', action='store', type=int, help='Seed for the ligand samples.')
+    parser.add_argument('--num_samples', dest='num_samples', action='store', type=int, default=1000,
+                        help='Number of ligand samples.')
+    parser.add_argument('--sampling', dest='sampling', action='store', default='random', choices=SAMPLING_METHODS,
+                        help='Design of the lognormal ligand samples; weights are written to ligand_weights.')
+    parser.add_argument('--dose_response', dest='dose_response', action='store_true', default=False,
+                        help='Solve on an adaptive grid of ligand doses and interpolate the output for every sample.')
+    parser.add_argument('--exact_density', dest='exact_density', action='store_true', default=False,
+                        help='With the dose-response curve, also write the exact output density (output_density) for '
+                             'InformationCapacity(estimator=\'exact\').')
+    parser.add_argument('--reduced', dest='reduced', action='store_true', default=False,
+                        help='Integrate with the conservation laws eliminated.')
+    parser.add_argument('--qssa', dest='qssa', action='store_true', default=False,
+                        help='Integrate with the fast species at quasi-steady state; writes the fast species and '
+                             'the error against the full model (qssa_species, qssa_reactions, qssa_error).')
+    parser.add_argument('--paired', dest='paired', action='store_true', default=False,
+                        help='With --lf, solve Ls and Ls_Lf from the same ligand samples in one pass and write both '
+                             'directories and the paired bootstrap capacity (paired_capacity).')
+    parser.add_argument('--sensitivity', dest='sensitivity', action='store_true', default=False,
+                        help='Write the rate constants ranked by d(output)/d(log k) for each of --doses '
+                             '(sensitivity_Ls_<dose>) instead of sampling the output distribution.')
+    parser.add_argument('--doses', dest='doses', action='store', type=float, nargs='+',
+                        help='Ligand doses for --sensitivity (default: exp(mu + sigma * [-2..2])).')
+    parser.add_argument('--settling_tolerance', dest='settling_tolerance', action='store', type=float,
+                        help='Stop integrating once max_i |dy_i/dt| / |y_i| times the time left to run_time stays '
+                             'below this for --settling_window.')
+    parser.add_argument('--settling_window', dest='settling_window', action='store', type=float,
+                        help='Time the settling test must hold (default: five output intervals).')
+    parser.add_argument('--truncated_time', dest='truncated_time', action='store_true', default=False,
+                        help='Read the output out at --readout_times, integrating only up to the latest of them.')
+    parser.add_argument('--readout_times', dest='readout_times', action='store', type=float, nargs='+',
+                        help='Times at which the truncated output is read out (default: third point of tspan).')
 
     args = parser.parse_args()
 
     if args.lf:
         if args.early_pos_fb:
-            tcr = EarlyPositiveFeedback(steps=args.steps, self_foreign=True, lf=args.lf)
+            tcr = EarlyPositiveFeedback(steps=args.steps, self_foreign=True, lf=args.lf, seed=args.seed,
+                                        num_samples=args.num_samples, sampling=args.sampling)
 
         elif args.latpp_ext:
-            tcr = LatPhosphorylationExtension(steps=args.steps, self_foreign=True, lf=args.lf)
+            tcr = LatPhosphorylationExtension(steps=args.steps, self_foreign=True, lf=args.lf, seed=args.seed,
+                                              num_samples=args.num_samples, sampling=args.sampling)
 
         else:
-            tcr = PysbTcrSelfWithForeign(steps=args.steps, self_foreign=True, lf=args.lf)
+            tcr = PysbTcrSelfWithForeign(steps=args.steps, self_foreign=True, lf=args.lf, seed=args.seed,
+                                         num_samples=args.num_samples, sampling=args.sampling)
 
     else:
         if args.early_pos_fb:
-            tcr = EarlyPositiveFeedback(steps=args.steps)
+            tcr = EarlyPositiveFeedback(steps=args.steps, seed=args.seed, num_samples=args.num_samples,
+                                        sampling=args.sampling)
 
         elif args.latpp_ext:
-            tcr = LatPhosphorylationExtension(steps=args.steps)
+            tcr = LatPhosphorylationExtension(steps=args.steps, seed=args.seed,
+                                              num_samples=args.num_samples, sampling=args.sampling)
 
         else:
-            tcr = PysbTcrSelfWithForeign(steps=args.steps)
-
-    tcr.main()
+            tcr = PysbTcrSelfWithForeign(steps=args.steps, seed=args.seed, num_samples=args.num_samples,
+                                         sampling=args.sampling)
+
+    if args.sensitivity:
+        tcr.main_sensitivity(doses=args.doses)
+    elif args.paired:
+        tcr.main_paired(steady_state=args.steady_state, reduced=args.reduced)
+    elif args.truncated_time:
+        tcr.main_truncated_time(batch=args.batch, workers=args.workers, readout_times=args.readout_times)
+    else:
+        tcr.main(batch=args.batch, steady_state=args.steady_state, continuation=args.continuation,
+                 workers=args.workers, settling_tolerance=args.settling_tolerance,
+                 settling_window=args.settling_window, dose_response=args.dose_response,
+                 exact_density=args.exact_density, reduced=args.reduced, qssa=args.qssa)
 
 ## Uncomment to make reaction network
 
@@ -1,5 +1,3 @@
-from pysb import *
-
 from pysb_t_cell_network import PysbTcrSelfWithForeign
 
 
@@ -9,8 +7,6 @@ class PysbTcrSelfWithForeignJupyter(PysbTcrSelfWithForeign):
         PysbTcrSelfWithForeign.__init__(self)
 
     def main(self):
-        Model()
-
         self.define_monomers()
         self.define_rates()
 
@@ -43,3 +39,4 @@ class PysbTcrSelfWithForeignJupyter(PysbTcrSelfWithForeign):
 tcr = PysbTcrSelfWithForeignJupyter()
 
 tcr.main()
+model = tcr.model
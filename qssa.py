@@ -0,0 +1,130 @@
+'''Quasi-steady-state reduction of mass-action networks. Species that are consumed much faster than anything else
+(the ligand-free intermediates unbinding at k_off = 20 s^-1) are found from the diagonal of the Jacobian, and their
+rate equations are replaced by the algebraic relations f_fast(y_slow, y_fast) = 0, solved by Newton at every RHS
+evaluation. Only the slow species are integrated, which removes the fast timescale that makes the full system
+stiff.'''
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from ode_simulator import OdeSimulator, compile_function
+
+
+def dense_jacobian(simulator, y, values):
+    '''Per-sample full Jacobians with shape (n_samples, n_species, n_species).'''
+    jac = np.zeros((y.shape[1], y.shape[0], y.shape[0]))
+    jac[:, simulator.network['jacobian_rows'], simulator.network['jacobian_columns']] = \
+        OdeSimulator.jacobian_data(simulator, y, values).T
+    return jac
+
+
+def fast_species(simulator, threshold=10.0):
+    '''Species whose first-order consumption rate -J_ii at the default initial state is at least threshold. Species
+    with a non-zero initial amount carry the inputs and are always kept dynamic.'''
+    values = simulator.parameter_values(1)
+    y0 = OdeSimulator.initial_state(simulator, values)
+    consumption = -np.diagonal(dense_jacobian(simulator, y0, values)[0])
+    return np.flatnonzero((consumption >= threshold) & (y0[:, 0] == 0))
+
+
+def fast_reactions(simulator, fast, threshold=10.0):
+    '''Reactions consuming a fast species with a pseudo-first-order rate constant of at least threshold, i.e. a rate
+    of at least threshold per molecule of that species at the default initial state.'''
+    values = simulator.parameter_values(1)
+    y0 = OdeSimulator.initial_state(simulator, values)
+    arguments = ["__s{0}".format(i) for i in range(len(y0))] + simulator.parameter_names
+    rates = compile_function(arguments, [reaction['rate'] for reaction in simulator.network['reactions']])
+
+    reactions = set()
+    for i in fast:
+        y = y0.copy()
+        y[i] = 1.0
+        for k, rate in enumerate(rates(*(list(y) + values))):
+            if i in simulator.network['reactions'][k]['reactants'] and np.all(rate >= threshold):
+                reactions.add(k)
+    return sorted(reactions)
+
+
+class QssaOdeSimulator(OdeSimulator):
+    def __init__(self, model, threshold=10.0, max_iterations=20, **kwargs):
+        OdeSimulator.__init__(self, model, **kwargs)
+
+        self.max_iterations = max_iterations
+        self.fast = fast_species(self, threshold)
+        self.slow = np.setdiff1d(np.arange(self.num_species), self.fast)
+        self.fast_reactions = fast_reactions(self, self.fast, threshold)
+        self.fast_guess = None
+        # With at most one fast reactant per reaction the fast equations are linear in the fast species and a single
+        # Newton step solves them exactly.
+        self.linear = all(sum(i in self.fast for i in reaction['reactants']) <= 1
+                          for reaction in self.network['reactions'])
+
+        # Non-zeros of the full Jacobian inside the fast block, and their positions in it
+        position = np.full(len(self.network['species']), -1)
+        position[self.fast] = np.arange(len(self.fast))
+        rows = position[self.network['jacobian_rows']]
+        columns = position[self.network['jacobian_columns']]
+        self.fast_entries = np.flatnonzero((rows >= 0) & (columns >= 0))
+        self.fast_rows = rows[self.fast_entries]
+        self.fast_columns = columns[self.fast_entries]
+
+        # The reduced Jacobian J_ss - J_sf J_ff^-1 J_fs is dense in the slow species.
+        self.num_species = len(self.slow)
+        self.jacobian_rows = np.repeat(np.arange(self.num_species), self.num_species)
+        self.jacobian_columns = np.tile(np.arange(self.num_species), self.num_species)
+        self.pattern = csr_matrix(np.ones((self.num_species, self.num_species)))
+        self.batch_pattern = {}
+
+    def full_species(self, y, values):
+        '''Completes the slow species y with the fast species at quasi-steady state, warm-starting Newton from the
+        previous solution when the batch size matches.'''
+        full = np.zeros((len(self.network['species']), y.shape[1]))
+        full[self.slow] = y
+        if self.fast_guess is not None and self.fast_guess.shape[1] == y.shape[1]:
+            full[self.fast] = self.fast_guess
+
+        for iteration in range(self.max_iterations):
+            f = OdeSimulator.rhs(self, full, values)[self.fast]
+            jac = np.zeros((y.shape[1], len(self.fast), len(self.fast)))
+            jac[:, self.fast_rows, self.fast_columns] = \
+                OdeSimulator.jacobian_data(self, full, values)[self.fast_entries].T
+            dy = -np.linalg.solve(jac, f.T[:, :, None])[:, :, 0].T
+            full[self.fast] += dy
+            if self.linear or np.all(np.abs(dy) <= self.atol * 1e-3 + self.rtol * 1e-3 * np.abs(full[self.fast])):
+                break
+
+        self.fast_guess = full[self.fast].copy()
+        return full
+
+    def initial_state(self, values):
+        return OdeSimulator.initial_state(self, values)[self.slow]
+
+    def rhs(self, y, values):
+        return OdeSimulator.rhs(self, self.full_species(y, values), values)[self.slow]
+
+    def jacobian_data(self, y, values):
+        jac = dense_jacobian(self, self.full_species(y, values), values)
+        slow_fast = jac[:, self.slow][:, :, self.fast]
+        fast_slow = np.linalg.solve(jac[:, self.fast][:, :, self.fast], jac[:, self.fast][:, :, self.slow])
+        reduced = jac[:, self.slow][:, :, self.slow] - np.matmul(slow_fast, fast_slow)
+        return reduced.reshape(y.shape[1], -1).T
+
+    def full_trajectories(self, species, values):
+        full = np.empty(species.shape[:2] + (len(self.network['species']),))
+        for t in range(species.shape[1]):
+            full[:, t, :] = self.full_species(species[:, t, :].T, values).T
+        return full
+
+    def integrate(self, tspan, values):
+        return self.full_trajectories(OdeSimulator.integrate(self, tspan, values), values)
+
+    def integrate_until_settled(self, tspan, values, tolerance, window):
+        species, settling_time = OdeSimulator.integrate_until_settled(self, tspan, values, tolerance, window)
+        return self.full_trajectories(species, values), settling_time
+
+
+def qssa_error(full, reduced):
+    '''Largest relative difference between two output arrays, relative to the full model's output range.'''
+    full = np.asarray(full, dtype=float)
+    scale = max(np.max(np.abs(full)), np.finfo(float).tiny)
+    return np.max(np.abs(np.asarray(reduced, dtype=float) - full)) / scale
@@ -5,13 +5,16 @@ import subprocess
 
 import numpy as np
 
+from ligand_sampler import LigandSampler
 from realistic_network import make_and_cd
 
 
 class LaunchQsub(object):
-    def __init__(self, steps, lf=30, self_foreign=False, early_pos=False, toy_model=False, latpp_ext=False):
+    def __init__(self, steps, lf=30, self_foreign=False, early_pos=False, toy_model=False, latpp_ext=False,
+                 paired=False):
         self.steps = steps
         self.lf = lf
+        self.paired = paired
 
         self.self_foreign = self_foreign
         self.early_pos = early_pos
@@ -32,20 +35,20 @@ class LaunchQsub(object):
         q.write("cd $PBS_O_WORKDIR\n")
         q.write("echo $PBS_JOBID > job_id\n\n")
 
+        paired = " --paired" if self.paired else ""
         if self.self_foreign:
             if self.early_pos:
-                q.write(
-                    "python ~/SSC_python_modules/pysb_t_cell_network.py --steps {0} --lf {1} --early_pos_fb\n".format(
-                        self.steps, self.lf))
+                q.write("python ~/SSC_python_modules/pysb_t_cell_network.py --steps {0} --lf {1} "
+                        "--early_pos_fb{2}\n".format(self.steps, self.lf, paired))
             elif self.toy_model:
                 q.write("python ~/SSC_python_modules/toy_model.py --lf \n")
             elif self.latpp_ext:
                 q.write(
-                    "python ~/SSC_python_modules/pysb_t_cell_network.py --steps {0} --lf {1} --latpp_ext\n".format(
-                        self.steps, self.lf))
+                    "python ~/SSC_python_modules/pysb_t_cell_network.py --steps {0} --lf {1} --latpp_ext{2}\n".format(
+                        self.steps, self.lf, paired))
             else:
-                q.write("python ~/SSC_python_modules/pysb_t_cell_network.py --steps {0} --lf {1}\n".format(self.steps,
-                                                                                                           self.lf))
+                q.write("python ~/SSC_python_modules/pysb_t_cell_network.py --steps {0} --lf {1}{2}\n".format(
+                    self.steps, self.lf, paired))
 
         else:
             if self.early_pos:
@@ -68,16 +71,45 @@ class LaunchQsub(object):
                                             cwd=os.getcwd()).communicate()
 
 
+class LaunchStepSweep(LaunchQsub):
+    def __init__(self, max_steps, lf=30, early_pos=False, latpp_ext=False):
+        LaunchQsub.__init__(self, max_steps, lf=lf, self_foreign=True, early_pos=early_pos, latpp_ext=latpp_ext)
+
+        self.simulation_name = "ODE_steps_0_to_" + str(self.steps)
+        self.simulation_time = 60
+
+    def generate_qsub(self):
+        if self.early_pos:
+            model = "early_pos_fb"
+        elif self.latpp_ext:
+            model = "latpp_ext"
+        else:
+            model = "tcr"
+
+        q = open("qsub.sh", "w")
+        q.write("#PBS -m ae\n")
+        q.write("#PBS -q short\n")
+        q.write("#PBS -V\n")
+        q.write("#PBS -l walltime={1},nodes=1:ppn=2 -N {0}\n\n".format(self.simulation_name,
+                                                                       datetime.timedelta(
+                                                                           minutes=self.simulation_time)))
+        q.write("cd $PBS_O_WORKDIR\n")
+        q.write("echo $PBS_JOBID > job_id\n\n")
+        q.write("python ~/SSC_python_modules/step_sweep.py --model {0} --max_steps {1} --lf {2}\n".format(
+            model, self.steps, self.lf))
+        q.close()
+
+
 class LaunchStochastic(LaunchQsub):
 
-    def __init__(self, steps, lf=30, self_foreign=False):
+    def __init__(self, steps, lf=30, self_foreign=False, sampling='random'):
         LaunchQsub.__init__(self, steps, lf=lf, self_foreign=self_foreign)
 
         self.simulation_name = "SSA_steps_" + str(self.steps)
         self.simulation_time = 20
         self.num_samples = 1000
 
-        self.p_ligand = [int(i) for i in np.round(np.random.lognormal(6.0, 1.0, self.num_samples))]
+        self.p_ligand, self.weights = LigandSampler(6.0, 1.0, method=sampling).sample(self.num_samples)
 
     def make_qsub_script(self, ls, name):
         q = open("qsub.sh", "w")
@@ -121,6 +153,7 @@ class LaunchStochastic(LaunchQsub):
             os.chdir(home_directory)
 
         np.savetxt("Ligand_concentrations", sample, fmt='%f')
+        np.savetxt("ligand_weights", self.weights, fmt='%e')
 
 
 if __name__ == "__main__":
@@ -137,37 +170,54 @@ if __name__ == "__main__":
     parser.add_argument('--toy_model', dest='toy_model', action='store_true', default=False,
                         help="flag for running toy model calculations.")
 
-    args = parser.parse_args()
+    parser.add_argument('--paired', dest='paired', action='store_true', default=False,
+                        help="submit one job solving Ls and Ls_Lf from the same ligand samples.")
+    parser.add_argument('--all_steps', dest='all_steps', action='store_true', default=False,
+                        help="submit one job computing the capacity for 0 to --steps steps (step_sweep.py).")
 
-    make_and_cd("{0}_step".format(args.steps))
+    args = parser.parse_args()
 
-    sub_directories = ["Ls", "Ls_Lf_{0}".format(args.lf)]
-    home_directory = os.getcwd()
+    if args.all_steps:
+        make_and_cd("0_to_{0}_steps".format(args.steps))
+        qsub = LaunchStepSweep(args.steps, lf=args.lf, early_pos=args.early_pos, latpp_ext=args.latpp_ext)
+        qsub.generate_qsub()
+        qsub.launch()
+    elif args.paired:
+        make_and_cd("{0}_step".format(args.steps))
+        qsub = LaunchQsub(args.steps, lf=args.lf, self_foreign=True, early_pos=args.early_pos,
+                          latpp_ext=args.latpp_ext, paired=True)
+        qsub.generate_qsub()
+        qsub.launch()
+    else:
+        make_and_cd("{0}_step".format(args.steps))
 
-    for directory in sub_directories:
-        if directory in os.listdir("."):
-            continue
+        sub_directories = ["Ls", "Ls_Lf_{0}".format(args.lf)]
+        home_directory = os.getcwd()
 
-        make_and_cd(directory)
-        if directory == "Ls_Lf_{0}".format(args.lf):
-            if args.early_pos:
-                qsub = LaunchQsub(args.steps, lf=args.lf, self_foreign=True, early_pos=True)
-            elif args.latpp_ext:
-                qsub = LaunchQsub(args.steps, lf=args.lf, self_foreign=True, latpp_ext=True)
-            elif args.toy_model:
-                qsub = LaunchQsub(args.steps, lf=args.lf, toy_model=True, self_foreign=True)
-            else:
-                qsub = LaunchQsub(args.steps, lf=args.lf, self_foreign=True)
-        else:
-            if args.early_pos:
-                qsub = LaunchQsub(args.steps, early_pos=True)
-            elif args.latpp_ext:
-                qsub = LaunchQsub(args.steps, latpp_ext=True)
-            elif args.toy_model:
-                qsub = LaunchQsub(args.steps, toy_model=True)
+        for directory in sub_directories:
+            if directory in os.listdir("."):
+                continue
+
+            make_and_cd(directory)
+            if directory == "Ls_Lf_{0}".format(args.lf):
+                if args.early_pos:
+                    qsub = LaunchQsub(args.steps, lf=args.lf, self_foreign=True, early_pos=True)
+                elif args.latpp_ext:
+                    qsub = LaunchQsub(args.steps, lf=args.lf, self_foreign=True, latpp_ext=True)
+                elif args.toy_model:
+                    qsub = LaunchQsub(args.steps, lf=args.lf, toy_model=True, self_foreign=True)
+                else:
+                    qsub = LaunchQsub(args.steps, lf=args.lf, self_foreign=True)
             else:
-                qsub = LaunchQsub(args.steps)
-
-        qsub.generate_qsub()
-        qsub.launch()
-        os.chdir(home_directory)
+                if args.early_pos:
+                    qsub = LaunchQsub(args.steps, early_pos=True)
+                elif args.latpp_ext:
+                    qsub = LaunchQsub(args.steps, latpp_ext=True)
+                elif args.toy_model:
+                    qsub = LaunchQsub(args.steps, toy_model=True)
+                else:
+                    qsub = LaunchQsub(args.steps)
+
+            qsub.generate_qsub()
+            qsub.launch()
+            os.chdir(home_directory)
@@ -6,6 +6,7 @@ import time
 
 import numpy as np
 
+from ligand_sampler import LigandSampler, SAMPLING_METHODS
 from simulation_parameters import InitialConcentrations, DiffusionRates, BindingParameters
 from two_species import KPSingleSpecies
 
@@ -546,7 +547,8 @@ class KPRealistic(KPSingleSpecies):
         self.sigma = 1.0
         self.num_samples = self.set_num_samples()
 
-        self.p_ligand = [int(i) for i in np.round(np.random.lognormal(self.mu, self.sigma, self.num_samples))]
+        sampler = LigandSampler(self.mu, self.sigma, method=getattr(self.arguments, 'sampling', 'random'))
+        self.p_ligand, self.weights = sampler.sample(self.num_samples)
 
         self.file_list = []
 
@@ -642,6 +644,7 @@ class KPRealistic(KPSingleSpecies):
         print(str(self.ligand.record))
         np.savetxt("Ligand_concentrations", sample, fmt='%f')
         np.savetxt("Ligand_concentrations_sorted", np.sort(sample), fmt='%f')
+        np.savetxt("ligand_weights", self.weights, fmt='%e')
 
         # if run:
         #     self.wait_for_simulations()
@@ -670,6 +673,8 @@ if __name__ == "__main__":
                         help="flag for submitting Ls calculations.")
     parser.add_argument('--ls_lf', dest='ls_lf', action='store', type=int, default=30,
                         help="number of foreign ligands.")
+    parser.add_argument('--sampling', dest='sampling', action='store', default='random', choices=SAMPLING_METHODS,
+                        help='Design of the lognormal ligand samples; weights are written to ligand_weights.')
     args = parser.parse_args()
 
     directory_name = "{0}_step".format(args.steps)
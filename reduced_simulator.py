@@ -0,0 +1,115 @@
+'''Integration of mass-action networks with their conservation laws eliminated. Every conserved total (receptor,
+kinases, adaptors, ligands) fixes one species as the total minus the others, so only the independent species are
+integrated; the eliminated ones are reconstructed for the observables. The reduced Jacobian is non-singular and
+smaller than the full one.'''
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from ode_simulator import OdeSimulator
+from steady_state import conservation_laws
+
+
+def elimination_basis(stoichiometry, tolerance=1e-9):
+    '''Conservation laws in reduced row echelon form, with the index of the species each one eliminates. Pivots are
+    taken in species order, so free monomers, which come first and are abundant, are the ones eliminated.'''
+    basis = conservation_laws(stoichiometry)
+    dependent = []
+    row = 0
+    for j in range(basis.shape[1]):
+        if row == len(basis):
+            break
+        k = row + np.argmax(np.abs(basis[row:, j]))
+        if abs(basis[k, j]) < tolerance:
+            continue
+        basis[[row, k]] = basis[[k, row]]
+        basis[row] /= basis[row, j]
+        others = np.arange(len(basis)) != row
+        basis[others] -= np.outer(basis[others, j], basis[row])
+        dependent.append(j)
+        row += 1
+
+    basis[np.abs(basis) < tolerance] = 0.0
+    return basis, np.array(dependent, dtype=int)
+
+
+class ReducedOdeSimulator(OdeSimulator):
+    def __init__(self, model, **kwargs):
+        OdeSimulator.__init__(self, model, **kwargs)
+
+        full_size = self.num_species
+        self.basis, self.dependent = elimination_basis(self.stoichiometry)
+        self.independent = np.setdiff1d(np.arange(full_size), self.dependent)
+        # y[dependent] = totals - elimination . y[independent]
+        self.elimination = self.basis[:, self.independent]
+
+        self.full_stoichiometry = self.stoichiometry
+        self.stoichiometry = self.stoichiometry[self.independent]
+        self.num_species = len(self.independent)
+        self.reduce_jacobian()
+
+    def reduce_jacobian(self):
+        '''Structure of J_r = J[ind, ind] - J[ind, dep] . elimination, and the sparse linear map taking the values of
+        the full Jacobian's non-zeros to those of the reduced one.'''
+        position = np.full(len(self.network['species']), -1)
+        position[self.independent] = np.arange(len(self.independent))
+        law = np.full(len(self.network['species']), -1)
+        law[self.dependent] = np.arange(len(self.dependent))
+
+        entries = {}
+        for k, (i, j) in enumerate(zip(self.network['jacobian_rows'], self.network['jacobian_columns'])):
+            if position[i] < 0:
+                continue
+            if position[j] >= 0:
+                entries.setdefault((position[i], position[j]), []).append((k, 1.0))
+            else:
+                for c in np.flatnonzero(self.elimination[law[j]]):
+                    entries.setdefault((position[i], c), []).append((k, -self.elimination[law[j], c]))
+
+        structure = sorted(entries)
+        self.jacobian_rows = np.array([row for row, column in structure], dtype=int)
+        self.jacobian_columns = np.array([column for row, column in structure], dtype=int)
+        self.pattern = csr_matrix((np.ones(len(structure)), (self.jacobian_rows, self.jacobian_columns)),
+                                  shape=(self.num_species, self.num_species))
+
+        rows, columns, coefficients = [], [], []
+        for e, key in enumerate(structure):
+            for k, coefficient in entries[key]:
+                rows.append(e)
+                columns.append(k)
+                coefficients.append(coefficient)
+        self.jacobian_map = csr_matrix((coefficients, (rows, columns)),
+                                       shape=(len(structure), len(self.network['jacobian'])))
+        self.batch_pattern = {}
+
+    def totals(self, values):
+        return np.dot(self.basis, OdeSimulator.initial_state(self, values))
+
+    def full_species(self, y, values):
+        full = np.empty((len(self.network['species']), y.shape[1]))
+        full[self.independent] = y
+        full[self.dependent] = self.totals(values) - np.dot(self.elimination, y)
+        return full
+
+    def initial_state(self, values):
+        return OdeSimulator.initial_state(self, values)[self.independent]
+
+    def rhs(self, y, values):
+        return OdeSimulator.rhs(self, self.full_species(y, values), values)[self.independent]
+
+    def jacobian_data(self, y, values):
+        return self.jacobian_map.dot(OdeSimulator.jacobian_data(self, self.full_species(y, values), values))
+
+    def full_trajectories(self, species, values):
+        '''Reconstructs the eliminated species of integrated trajectories with shape (n_samples, n_times, n_states).'''
+        full = np.empty(species.shape[:2] + (len(self.network['species']),))
+        full[:, :, self.independent] = species
+        full[:, :, self.dependent] = self.totals(values).T[:, None, :] - np.dot(species, self.elimination.T)
+        return full
+
+    def integrate(self, tspan, values):
+        return self.full_trajectories(OdeSimulator.integrate(self, tspan, values), values)
+
+    def integrate_until_settled(self, tspan, values, tolerance, window):
+        species, settling_time = OdeSimulator.integrate_until_settled(self, tspan, values, tolerance, window)
+        return self.full_trajectories(species, values), settling_time
@@ -0,0 +1,122 @@
+'''Forward sensitivity analysis of mass-action networks. The sensitivities S_j = dy/d(log k_j) of every species to
+every rate constant are integrated together with the state,
+
+    dS_j/dt = J S_j + df/d(log k_j),    S_j(0) = dy(0)/d(log k_j),
+
+where df/d(log k_j) = N . (p_j * rates) follows from the parameter powers p_j in the mass-action index arrays. One
+augmented solve gives the derivative of every observable with respect to every rate, for all doses at once.'''
+
+import numpy as np
+from scipy.integrate import solve_ivp
+from scipy.sparse import csr_matrix, identity, kron
+
+
+def rate_parameters(simulator):
+    '''Names of the network's parameters that are not initial amounts, i.e. its rate constants.'''
+    return [name for name in simulator.parameter_names if name not in simulator.initial_species]
+
+
+class SensitivityResult(object):
+    def __init__(self, simulator, tspan, parameters, species, sensitivities):
+        '''species has shape (n_samples, n_times, n_species) and sensitivities (n_samples, n_times, n_species,
+        n_parameters).'''
+        self.simulator = simulator
+        self.tspan = tspan
+        self.parameters = parameters
+        self.species = species
+        self.sensitivities = sensitivities
+
+    def observable(self, name):
+        indices, coefficients = self.simulator.observables[name]
+        return np.dot(self.species[:, :, indices], coefficients)
+
+    def observable_sensitivity(self, name):
+        '''d(observable)/d(log k) with shape (n_samples, n_times, n_parameters).'''
+        indices, coefficients = self.simulator.observables[name]
+        return np.einsum('stip,i->stp', self.sensitivities[:, :, indices, :], np.asarray(coefficients, dtype=float))
+
+
+class ForwardSensitivity(object):
+    def __init__(self, simulator, parameters=None):
+        '''simulator is an OdeSimulator with mass-action kinetics; parameters are the names differentiated against
+        (default: every rate constant).'''
+        if simulator.mass_action is None:
+            raise ValueError("Forward sensitivities need a network with mass-action rates")
+
+        self.simulator = simulator
+        self.parameters = rate_parameters(simulator) if parameters is None else list(parameters)
+        self.indices = [simulator.parameter_names.index(name) for name in self.parameters]
+
+        # powers[r, j]: exponent of parameter j in the rate of reaction r
+        kinetics = simulator.mass_action
+        num_parameters = len(simulator.parameter_names)
+        powers = np.zeros((len(kinetics.coefficients), num_parameters + 1))
+        for f in range(kinetics.parameters.shape[0]):
+            np.add.at(powers, (np.arange(powers.shape[0]), kinetics.parameters[f]), kinetics.powers[f])
+        self.powers = powers[:, self.indices]
+
+    def parameter_derivative(self, y, values):
+        '''df/d(log k) with shape (n_species, n_parameters, n_samples).'''
+        rates = self.simulator.mass_action.rates(y, values)
+        scaled = self.powers[:, :, None] * rates[:, None, :]
+        return self.simulator.mass_action.stoichiometry.dot(scaled.reshape(len(rates), -1)).reshape(
+            y.shape[0], len(self.parameters), y.shape[1])
+
+    def initial_sensitivity(self, values):
+        '''dy(0)/d(log k): the parameter value for an initial amount, zero for a rate.'''
+        s0 = np.zeros((self.simulator.num_species, len(self.parameters), len(values[0])))
+        for j, name in enumerate(self.parameters):
+            if name in self.simulator.initial_species:
+                s0[self.simulator.initial_species[name], j] = values[self.indices[j]]
+        return s0
+
+    def integrate(self, tspan, values):
+        simulator = self.simulator
+        num_species, num_parameters, num_samples = simulator.num_species, len(self.parameters), len(values[0])
+        size = num_species * num_samples
+
+        def unpack(z):
+            # State blocks: y, then S_j for each parameter, each species-major like OdeSimulator's stacked state
+            blocks = z.reshape(num_parameters + 1, num_species, num_samples)
+            return blocks[0], blocks[1:]
+
+        def f(t, z):
+            y, s = unpack(z)
+            jacobian = simulator.jacobian(y, values)
+            js = jacobian.dot(s.reshape(num_parameters, size).T).T.reshape(num_parameters, num_species, num_samples)
+            ds = js + self.parameter_derivative(y, values).transpose(1, 0, 2)
+            return np.concatenate([simulator.rhs(y, values).ravel(), ds.ravel()])
+
+        def jac(t, z):
+            # The sensitivity equations share the state's Jacobian; their dependence on y through J is left out of
+            # the Newton matrix, which only slows the corrector down.
+            return csr_matrix(kron(identity(num_parameters + 1), simulator.jacobian(unpack(z)[0], values)))
+
+        z0 = np.concatenate([simulator.initial_state(values).ravel(),
+                             self.initial_sensitivity(values).transpose(1, 0, 2).ravel()])
+        solution = solve_ivp(f, (tspan[0], tspan[-1]), z0, method='BDF', t_eval=tspan, rtol=simulator.rtol,
+                             atol=simulator.atol, jac=jac)
+        if not solution.success:
+            raise RuntimeError("Sensitivity integration failed: {0}".format(solution.message))
+
+        z = solution.y.reshape(num_parameters + 1, num_species, num_samples, len(tspan))
+        return z[0].transpose(1, 2, 0), z[1:].transpose(2, 3, 1, 0)
+
+    def run(self, tspan, initials=None, param_values=None, num_samples=1):
+        overrides = dict(param_values or {})
+        overrides.update(initials or {})
+        for value in overrides.values():
+            if np.ndim(value) > 0:
+                num_samples = len(value)
+
+        values = self.simulator.parameter_values(num_samples, overrides)
+        tspan = np.asarray(tspan, dtype=float)
+        species, sensitivities = self.integrate(tspan, values)
+        return SensitivityResult(self.simulator, tspan, self.parameters, species, sensitivities)
+
+
+def ranked_sensitivities(parameters, values, sensitivity, output):
+    '''Rows of (parameter, value, d(output)/d(log k), d(log output)/d(log k)) sorted by decreasing magnitude.'''
+    normalised = sensitivity / output if output != 0 else np.full(len(parameters), np.nan)
+    order = np.argsort(-np.abs(sensitivity))
+    return [(parameters[j], values[j], sensitivity[j], normalised[j]) for j in order]
@@ -1,3 +1,16 @@
+# Names under which the rate constants are set from outside the networks (BindingParameters attributes and the
+# parameters.pickle names of the feedback variants), with every network parameter each one sets
+PARAMETER_ALIASES = {'k_foreign_off': ['k_Lf_off'], 'k_self_off': ['k_Ls_off'], 'k_lck_on_R_pmhc': ['k_lck_on_RL'],
+                     'k_lck_off_R_pmhc': ['k_lck_off_RL'], 'k_negative_loop': ['k_neg_fb'],
+                     'k_p_lat_1': ['kp_on_lat1'], 'k_p_lat_2': ['k_p_lat_on_species', 'kp_on_lat2'],
+                     'k_p_lat_off_species': ['kp_off_lat1', 'kp_off_lat2'], 'k_positive_loop': ['k_positive_fb'],
+                     'k_8_1': ['k_sos_on', 'k_grb_on'], 'k_8_2': ['k_grb_product'], 'k_9_1': ['k_latp_product'],
+                     'k_9_2': ['k_latp_product_grb'], 'k_9_3': ['k_positive_fb']}
+# Search ranges of rate constants whose network value gives none: the negative feedback is off (0) by default, so it
+# gets the range of the feedback parameter searches.
+DEFAULT_BOUNDS = {'k_neg_fb': (1e-4, 1e-1)}
+
+
 class DefineRegion(object):
     def __init__(self):
         self.x = self.y = 10.0
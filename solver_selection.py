@@ -0,0 +1,141 @@
+'''Per-variant choice of the stiff integrator. Every candidate method and tolerance is timed on a few probe inputs,
+its observables are compared with a tight-tolerance reference, and the fastest candidate within the required
+accuracy is stored next to the variant's cached network, where build_simulator picks it up for later sweeps. Samples
+solved one at a time and batched sweeps favour different integrators, so both are benchmarked and stored.'''
+
+import argparse
+import time
+
+import numpy as np
+
+from network_cache import store_solver_settings
+from ode_simulator import OdeSimulator
+from pysb_sos_fb import SoSFeedback
+from pysb_t_cell_network import PysbTcrSelfWithForeign, EarlyPositiveFeedback, LatPhosphorylationExtension, \
+    PysbTcrLckFeedbackLoop
+from toy_model import ToyModel
+
+CANDIDATE_METHODS = ('LSODA', 'BDF', 'Radau')
+CANDIDATE_TOLERANCES = (1e-4, 1e-6, 1e-8)
+
+
+def probe_error(reference, trial):
+    '''Largest difference over the probe runs and times, relative to each observable's largest value (at least one
+    molecule), maximised over observables.'''
+    scale = np.maximum(np.abs(reference).max(axis=(0, 2)), 1.0)
+    return np.max(np.abs(trial - reference).max(axis=(0, 2)) / scale)
+
+
+class SolverSelection(object):
+    def __init__(self, owner, input_name, probe_values, batch_values, accuracy=1e-4, reference_tolerance=1e-10):
+        '''owner is a model instance and input_name its input parameter (e.g. 'Ls_0'). probe_values are solved one at
+        a time, batch_values together as one batched sweep.'''
+        self.owner = owner
+        self.input_name = input_name
+        self.probe_values = probe_values
+        self.batch_values = batch_values
+        self.accuracy = accuracy
+        self.reference_tolerance = reference_tolerance
+        self.results = []
+
+    def run(self, batched, **settings):
+        '''Wall time and observables, with shape (n_samples, n_observables, n_times), of the probe runs.'''
+        simulator = OdeSimulator(self.owner.model, network=self.owner.network, **settings)
+        names = sorted(simulator.observables)
+
+        start = time.time()
+        if batched:
+            runs = [simulator.run(self.owner.tspan, initials={self.input_name: self.batch_values})]
+        else:
+            runs = [simulator.run(self.owner.tspan, initials={self.input_name: value}) for value in self.probe_values]
+        elapsed = time.time() - start
+
+        return elapsed, np.concatenate([np.stack([result.observable(name) for name in names], axis=1)
+                                        for result in runs])
+
+    def benchmark(self, batched, methods=CANDIDATE_METHODS, tolerances=CANDIDATE_TOLERANCES):
+        '''Rows of (mode, method, tolerance, wall time, error) for every candidate.'''
+        if self.owner.network is None:
+            self.owner.build_network()
+        mode = 'batch' if batched else 'single'
+
+        elapsed, reference = self.run(batched, method='Radau', rtol=self.reference_tolerance,
+                                      atol=self.reference_tolerance)
+        print("{0} reference: {1:.3f} s".format(mode, elapsed))
+
+        results = []
+        for method in methods:
+            for tolerance in tolerances:
+                try:
+                    elapsed, trial = self.run(batched, method=method, rtol=tolerance, atol=tolerance)
+                    error = probe_error(reference, trial)
+                except RuntimeError:
+                    elapsed, error = np.inf, np.inf
+                print("{0} {1} tol={2:g}: {3:.3f} s, error {4:.2e}".format(mode, method, tolerance, elapsed, error))
+                results.append((mode, method, tolerance, elapsed, error))
+
+        return results
+
+    def select(self, **kwargs):
+        '''Benchmarks the candidates in both modes and stores the fastest one within accuracy in each for the owner's
+        variant.'''
+        settings = {}
+        self.results = []
+        for batched in (False, True):
+            results = self.benchmark(batched, **kwargs)
+            self.results.extend(results)
+
+            adequate = [result for result in results if result[4] <= self.accuracy]
+            if not adequate:
+                raise RuntimeError("No candidate solver reached a relative accuracy of {0}".format(self.accuracy))
+            mode, method, tolerance, elapsed, error = min(adequate, key=lambda result: result[3])
+            settings[mode] = dict(method=method, rtol=tolerance, atol=tolerance)
+
+        store_solver_settings(self.owner, settings)
+        return settings
+
+    def write_results(self, file_name="solver_benchmark"):
+        with open(file_name, "w") as f:
+            f.write("mode method tolerance time error\n")
+            for mode, method, tolerance, elapsed, error in self.results:
+                f.write("{0} {1} {2:g} {3:f} {4:e}\n".format(mode, method, tolerance, elapsed, error))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Select the fastest adequate ODE solver for a model variant",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--model', dest='model', action='store', default='tcr',
+                        choices=['tcr', 'early_pos_fb', 'latpp_ext', 'lck_fb', 'toy', 'sos'],
+                        help='Model variant to benchmark.')
+    parser.add_argument('--steps', dest='steps', action='store', type=int, default=8,
+                        help='Number of steps in the TCR variants.')
+    parser.add_argument('--lf', dest='lf', action='store', type=int, default=0,
+                        help='Number of foreign ligands; 0 benchmarks the self-only variant.')
+    parser.add_argument('--accuracy', dest='accuracy', action='store', type=float, default=1e-4,
+                        help='Largest accepted error relative to each observable\'s range.')
+    parser.add_argument('--num_probes', dest='num_probes', action='store', type=int, default=3,
+                        help='Number of probe inputs solved one at a time, spread over the input quantiles.')
+    parser.add_argument('--num_batch', dest='num_batch', action='store', type=int, default=100,
+                        help='Number of inputs in the batched probe sweep.')
+    args = parser.parse_args()
+
+    self_foreign = args.lf > 0
+    lf = args.lf if self_foreign else 30
+    if args.model == 'sos':
+        model = SoSFeedback()
+        input_name, inputs = 'Sos_0', model.sos
+    elif args.model == 'toy':
+        model = ToyModel(self_foreign=self_foreign)
+        input_name, inputs = 'Ls_0', model.p_ligand
+    else:
+        model_class = {'tcr': PysbTcrSelfWithForeign, 'early_pos_fb': EarlyPositiveFeedback,
+                       'latpp_ext': LatPhosphorylationExtension, 'lck_fb': PysbTcrLckFeedbackLoop}[args.model]
+        model = model_class(steps=args.steps, self_foreign=self_foreign, lf=lf)
+        input_name, inputs = 'Ls_0', model.p_ligand
+
+    inputs = np.array(inputs, dtype=float)
+    probes = np.quantile(inputs, np.linspace(0.1, 0.9, args.num_probes))
+    batch = np.quantile(inputs, np.linspace(0.0, 1.0, args.num_batch))
+    selection = SolverSelection(model, input_name, probes, batch, accuracy=args.accuracy)
+    print("Selected {0}".format(selection.select()))
+    selection.write_results()
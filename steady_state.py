@@ -0,0 +1,204 @@
+'''Direct steady-state solution of mass-action networks: damped Newton on the RHS with the conservation laws replacing
+the redundant rows, falling back to pseudo-transient continuation when Newton does not converge.'''
+
+import numpy as np
+from scipy.linalg import null_space, qr
+
+from ode_simulator import BatchResult
+
+
+def conservation_laws(stoichiometry):
+    return null_space(stoichiometry.T).T
+
+
+def independent_rows(stoichiometry, rank):
+    q, r, pivots = qr(stoichiometry.T, pivoting=True)
+    return np.sort(pivots[:rank])
+
+
+class SteadyStateSolver(object):
+    def __init__(self, simulator, rtol=1e-8, atol=1e-8, max_iterations=50, max_ptc_iterations=500):
+        self.simulator = simulator
+        self.rtol = rtol
+        self.atol = atol
+        self.max_iterations = max_iterations
+        self.max_ptc_iterations = max_ptc_iterations
+
+        self.conservation = conservation_laws(simulator.stoichiometry)
+        self.rows = independent_rows(simulator.stoichiometry, simulator.num_species - len(self.conservation))
+
+    def jacobian(self, y, values):
+        '''Dense per-sample Jacobians with shape (n_samples, n_species, n_species), scattered from the analytic CSR
+        non-zeros; the blocks are small enough that batched dense solves beat sparse factorisation.'''
+        simulator = self.simulator
+        jac = np.zeros((y.shape[1], y.shape[0], y.shape[0]))
+        jac[:, simulator.jacobian_rows, simulator.jacobian_columns] = simulator.jacobian_data(y, values).T
+        return jac
+
+    def residual(self, y, values, totals):
+        return np.vstack([self.simulator.rhs(y, values)[self.rows], np.dot(self.conservation, y) - totals])
+
+    def newton_matrix(self, y, values):
+        jac = self.jacobian(y, values)[:, self.rows, :]
+        conservation = np.broadcast_to(self.conservation, (y.shape[1],) + self.conservation.shape)
+        return np.concatenate([jac, conservation], axis=1)
+
+    def converged(self, y, dy):
+        return np.all(np.abs(dy) <= self.atol + self.rtol * np.abs(y), axis=0)
+
+    def newton(self, y, values, totals):
+        done = np.zeros(y.shape[1], dtype=bool)
+        failed = np.zeros(y.shape[1], dtype=bool)
+
+        for iteration in range(self.max_iterations):
+            active = ~(done | failed)
+            if not np.any(active):
+                break
+
+            values_active = [v[active] for v in values]
+            y_active = y[:, active]
+            g = self.residual(y_active, values_active, totals[:, active])
+            dy = -np.linalg.solve(self.newton_matrix(y_active, values_active), g.T[:, :, None])[:, :, 0].T
+
+            converged = self.converged(y_active, dy)
+            norm = np.linalg.norm(g, axis=0)
+            alpha = np.ones(y_active.shape[1])
+            for k in range(10):
+                trial = np.maximum(y_active + alpha * dy, 0.0)
+                decreased = np.linalg.norm(self.residual(trial, values_active, totals[:, active]), axis=0) < \
+                    (1 - 1e-4 * alpha) * norm
+                if np.all(decreased | converged):
+                    break
+                alpha = np.where(decreased | converged, alpha, alpha / 2.0)
+
+            y[:, active] = np.maximum(y_active + alpha * dy, 0.0)
+            done[active] = converged
+            failed[active] = ~converged & ~decreased
+
+        return y, done
+
+    def pseudo_transient(self, y, values, dt=1e-2):
+        identity = np.eye(y.shape[0])
+        dt = np.full(y.shape[1], dt)
+        norm = np.linalg.norm(self.simulator.rhs(y, values), axis=0)
+        active = np.ones(y.shape[1], dtype=bool)
+
+        for iteration in range(self.max_ptc_iterations):
+            values_active = [v[active] for v in values]
+            y_active = y[:, active]
+            f = self.simulator.rhs(y_active, values_active)
+            matrix = identity / dt[active, None, None] - self.jacobian(y_active, values_active)
+            dy = np.linalg.solve(matrix, f.T[:, :, None])[:, :, 0].T
+
+            # Implicit Euler steps conserve the totals, so a step that overshoots below zero is rejected and
+            # retried with a smaller pseudo time step rather than clipped.
+            trial = y_active + dy
+            accepted = np.all(trial >= -(self.atol + self.rtol * np.abs(y_active)), axis=0)
+            y_active = np.where(accepted, np.maximum(trial, 0.0), y_active)
+            y[:, active] = y_active
+
+            new_norm = np.linalg.norm(self.simulator.rhs(y_active, values_active), axis=0)
+            growth = np.clip(norm[active] / np.maximum(new_norm, 1e-300), 0.5, 10.0)
+            dt[active] = np.where(accepted, np.minimum(dt[active] * growth, 1e12), dt[active] / 4.0)
+            norm[active] = np.where(accepted, new_norm, norm[active])
+
+            active[active] = ~(accepted & (self.converged(y_active, dy) | (dt[active] >= 1e12)))
+            if not np.any(active):
+                break
+
+        return y
+
+    def steady_states(self, initials=None, param_values=None, num_samples=1, y_guess=None):
+        '''Steady states in the coordinates the simulator integrates in, with shape (n_states, n_samples), and the
+        parameter values they were solved for.'''
+        simulator = self.simulator
+        overrides = dict(param_values or {})
+        overrides.update(initials or {})
+        for value in overrides.values():
+            if np.ndim(value) > 0:
+                num_samples = len(value)
+
+        values = simulator.parameter_values(num_samples, overrides)
+        y0 = simulator.initial_state(values)
+        totals = np.dot(self.conservation, y0)
+
+        y = y0 if y_guess is None else y_guess.copy()
+        y, done = self.newton(y, values, totals)
+
+        if not np.all(done):
+            retry = ~done
+            values_retry = [v[retry] for v in values]
+            y_ptc = self.pseudo_transient(y0[:, retry], values_retry)
+            y_ptc, done_retry = self.newton(y_ptc, values_retry, totals[:, retry])
+            if not np.all(done_retry):
+                raise RuntimeError("Steady state not found for {0} samples".format(np.sum(~done_retry)))
+            y[:, retry] = y_ptc
+
+        return y, values
+
+    def solve(self, initials=None, param_values=None, num_samples=1, y_guess=None):
+        y, values = self.steady_states(initials, param_values, num_samples, y_guess)
+        return BatchResult(self.simulator, np.array([np.inf]), self.simulator.full_species(y, values).T[:, None, :])
+
+    def tangent(self, y, values, name):
+        '''Derivative of the steady state with respect to log(parameter), from the implicit function theorem.'''
+        simulator = self.simulator
+        parameter = values[simulator.parameter_names.index(name)]
+        h = np.sqrt(np.finfo(float).eps) * np.maximum(np.abs(parameter), 1.0)
+        values_h = list(values)
+        values_h[simulator.parameter_names.index(name)] = parameter + h
+
+        dg = (self.residual(y, values_h, np.dot(self.conservation, simulator.initial_state(values_h))) -
+              self.residual(y, values, np.dot(self.conservation, simulator.initial_state(values)))) / h
+        dy = -np.linalg.solve(self.newton_matrix(y, values), dg.T[:, :, None])[:, :, 0].T
+
+        return parameter * dy
+
+    def continuation(self, name, parameter_values, initials=None, param_values=None, max_log_step=0.25):
+        '''Steady states along the sorted values of one parameter. Anchor samples no more than max_log_step apart
+        in log(parameter) are continued one after another with a tangent predictor and Newton corrector; every
+        other sample is then predicted from the anchor below it and corrected in one batched Newton solve.
+        Results are returned in the original sample order.'''
+        simulator = self.simulator
+        overrides = dict(param_values or {})
+        overrides.update(initials or {})
+        parameter_values = np.asarray(parameter_values, dtype=float)
+        log_p = np.log(np.maximum(parameter_values, 1e-300))
+        order = np.argsort(parameter_values)
+
+        anchors = [order[0]]
+        for k in order[1:]:
+            if log_p[k] - log_p[anchors[-1]] > max_log_step:
+                anchors.append(k)
+
+        y_anchors = np.empty((simulator.num_species, len(anchors)))
+        tangents = np.empty((simulator.num_species, len(anchors)))
+        for a, k in enumerate(anchors):
+            overrides[name] = parameter_values[k]
+            values = simulator.parameter_values(1, overrides)
+            totals = np.dot(self.conservation, simulator.initial_state(values))
+
+            done = [False]
+            if a > 0:
+                y_guess = y_anchors[:, a - 1:a] + tangents[:, a - 1:a] * (log_p[k] - log_p[anchors[a - 1]])
+                y, done = self.newton(np.maximum(y_guess, 0.0), values, totals)
+            if not done[0]:
+                y, values = self.steady_states(initials=overrides)
+
+            y_anchors[:, a] = y[:, 0]
+            tangents[:, a] = self.tangent(y, values, name)[:, 0]
+
+        anchor_log_p = log_p[anchors]
+        nearest = np.maximum(np.searchsorted(anchor_log_p, log_p, side='right') - 1, 0)
+        y_guess = np.maximum(y_anchors[:, nearest] + tangents[:, nearest] * (log_p - anchor_log_p[nearest]), 0.0)
+
+        overrides[name] = parameter_values
+        values = simulator.parameter_values(len(parameter_values), overrides)
+        totals = np.dot(self.conservation, simulator.initial_state(values))
+        y, done = self.newton(y_guess, values, totals)
+
+        if not np.all(done):
+            overrides[name] = parameter_values[~done]
+            y[:, ~done] = self.steady_states(initials=overrides)[0]
+
+        return BatchResult(simulator, np.array([np.inf]), simulator.full_species(y, values).T[:, None, :])
@@ -0,0 +1,148 @@
+'''Capacity as a function of the number of KP steps, computed in one process. Every step count of a variant is built
+and solved for the self (Ls) and self-with-foreign (Ls_Lf) inputs from one shared set of ligand samples, and the
+capacities are written to one table instead of one job and directory per step and input. With paired, both inputs
+are solved in one batched pass of the self-with-foreign model and the capacity comes with a paired bootstrap
+error.'''
+
+import argparse
+
+import numpy as np
+
+from channel_capacity import exact_capacity, histogram_capacity, paired_bootstrap_capacity
+from ligand_sampler import LigandSampler, SAMPLING_METHODS
+from pysb_t_cell_network import PysbTcrSelfWithForeign, EarlyPositiveFeedback, LatPhosphorylationExtension, \
+    PysbTcrLckFeedbackLoop
+
+VARIANTS = {'tcr': PysbTcrSelfWithForeign, 'early_pos_fb': EarlyPositiveFeedback,
+            'latpp_ext': LatPhosphorylationExtension, 'lck_fb': PysbTcrLckFeedbackLoop}
+
+
+class StepSweep(object):
+    def __init__(self, model_class=PysbTcrSelfWithForeign, steps=range(9), lf=30, num_samples=1000,
+                 sampling='random', seed=None, mu=6, sigma=1.0):
+        self.model_class = model_class
+        self.steps = list(steps)
+        self.lf = lf
+
+        self.mu = mu
+        self.sigma = sigma
+        self.sampling = sampling
+        self.seed = np.random.randint(2 ** 31 - 1) if seed is None else seed
+        self.p_ligand, self.weights = LigandSampler(mu, sigma, method=sampling, seed=self.seed).sample(num_samples)
+
+        self.outputs = {}
+        self.densities = {}
+        self.capacity = {}
+        self.error = {}
+
+    def build(self, steps, self_foreign):
+        '''A fresh model instance for one step count, carrying the shared ligand samples.'''
+        tcr = self.model_class(steps=steps, self_foreign=self_foreign, lf=self.lf, seed=self.seed,
+                               num_samples=len(self.p_ligand), sampling=self.sampling)
+        tcr.mu, tcr.sigma = self.mu, self.sigma
+        tcr.p_ligand, tcr.weights = self.p_ligand, self.weights
+        return tcr
+
+    def solve(self, steps, self_foreign, exact_density=False, **options):
+        '''Final outputs of every sample, and with exact_density the output density from the dose-response curve.
+        options are passed to main_batch.'''
+        tcr = self.build(steps, self_foreign)
+        observables = tcr.build_network()
+        output_array, ligand_array, settling_time = tcr.main_batch(
+            observables, dose_response=exact_density, exact_density=exact_density, **options)
+
+        density = tcr.dose_response.output_density(self.mu, self.sigma) if exact_density else None
+        return output_array[:, -1], density
+
+    def solve_paired(self, steps, **options):
+        '''Final outputs of every sample without and with the foreign ligands, from one batched pass. options are
+        passed to solve_samples.'''
+        tcr = self.build(steps, True)
+        observables = tcr.build_network()
+        self_output, foreign_output, settling_time = tcr.solve_paired(tcr.p_ligand, observables, **options)
+        return self_output[:, -1], foreign_output[:, -1]
+
+    def run(self, exact_density=False, paired=False, num_bootstrap=200, **options):
+        if paired and exact_density:
+            raise ValueError("The exact densities come from dose-response curves, which are not paired samples")
+
+        for steps in self.steps:
+            if paired:
+                print("Solving {0} steps, Ls and Ls_Lf paired".format(steps))
+                self_output, foreign_output = self.solve_paired(steps, **options)
+                self.outputs[(steps, False)], self.outputs[(steps, True)] = self_output, foreign_output
+                self.capacity[steps], self.error[steps], interval = paired_bootstrap_capacity(
+                    foreign_output, self_output, weights=self.weights, num_bootstrap=num_bootstrap, seed=self.seed)
+                continue
+
+            for self_foreign in (False, True):
+                print("Solving {0} steps, {1}".format(steps, "Ls_Lf" if self_foreign else "Ls"))
+                output, density = self.solve(steps, self_foreign, exact_density=exact_density, **options)
+                self.outputs[(steps, self_foreign)] = output
+                self.densities[(steps, self_foreign)] = density
+
+            if exact_density:
+                foreign_grid, foreign_density = self.densities[(steps, True)]
+                self_grid, self_density = self.densities[(steps, False)]
+                self.capacity[steps] = exact_capacity(foreign_grid, foreign_density, self_grid, self_density)
+            else:
+                self.capacity[steps] = histogram_capacity(self.outputs[(steps, True)], self.outputs[(steps, False)],
+                                                          foreign_weights=self.weights, self_weights=self.weights)
+
+        return self.capacity
+
+    def write_results(self, file_name="capacity_vs_steps"):
+        '''The capacity table, and every step's outputs with the shared samples in <file_name>.npz.'''
+        with open(file_name, "w") as f:
+            f.write("steps capacity standard_error mean_self_output mean_foreign_output\n")
+            for steps in self.steps:
+                f.write("{0} {1:f} {2:f} {3:f} {4:f}\n".format(
+                    steps, self.capacity[steps], self.error.get(steps, np.nan),
+                    np.average(self.outputs[(steps, False)], weights=self.weights),
+                    np.average(self.outputs[(steps, True)], weights=self.weights)))
+
+        arrays = dict(steps=self.steps, capacity=[self.capacity[steps] for steps in self.steps], seed=self.seed,
+                      ligands=self.p_ligand, ligand_weights=self.weights)
+        for steps in self.steps:
+            arrays["self_output_{0}".format(steps)] = self.outputs[(steps, False)]
+            arrays["foreign_output_{0}".format(steps)] = self.outputs[(steps, True)]
+        np.savez(file_name + ".npz", **arrays)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Capacity against the number of KP steps in one process",
+                                     formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--model', dest='model', action='store', default='tcr', choices=sorted(VARIANTS),
+                        help='Model variant to sweep.')
+    parser.add_argument('--min_steps', dest='min_steps', action='store', type=int, default=0,
+                        help='Smallest number of KP steps.')
+    parser.add_argument('--max_steps', dest='max_steps', action='store', type=int, default=8,
+                        help='Largest number of KP steps.')
+    parser.add_argument('--lf', dest='lf', action='store', type=int, default=30, help='Number of foreign ligands.')
+    parser.add_argument('--seed', dest='seed', action='store', type=int, help='Seed for the ligand samples.')
+    parser.add_argument('--num_samples', dest='num_samples', action='store', type=int, default=1000,
+                        help='Number of ligand samples.')
+    parser.add_argument('--sampling', dest='sampling', action='store', default='random', choices=SAMPLING_METHODS,
+                        help='Design of the lognormal ligand samples.')
+    parser.add_argument('--workers', dest='workers', action='store', type=int, default=1,
+                        help='Number of processes the ligand samples are split across.')
+    parser.add_argument('--steady_state', dest='steady_state', action='store_true', default=False,
+                        help='Solve for the steady state directly instead of integrating to run_time.')
+    parser.add_argument('--exact_density', dest='exact_density', action='store_true', default=False,
+                        help='Compute the capacity from exact output densities instead of histograms.')
+    parser.add_argument('--paired', dest='paired', action='store_true', default=False,
+                        help='Solve Ls and Ls_Lf in one pass and bootstrap the capacity over the shared samples.')
+    parser.add_argument('--reduced', dest='reduced', action='store_true', default=False,
+                        help='Integrate with the conservation laws eliminated.')
+
+    args = parser.parse_args()
+    if args.paired and args.workers > 1:
+        parser.error("--paired solves both inputs in one batched pass; --workers only applies without it")
+
+    sweep = StepSweep(VARIANTS[args.model], steps=range(args.min_steps, args.max_steps + 1), lf=args.lf,
+                      num_samples=args.num_samples, sampling=args.sampling, seed=args.seed)
+    options = dict(steady_state=args.steady_state, reduced=args.reduced)
+    if not args.paired:
+        options['workers'] = args.workers
+    sweep.run(exact_density=args.exact_density, paired=args.paired, **options)
+    sweep.write_results()
@@ -0,0 +1,27 @@
+'''The built-in grids of ode_parameter_tests solved in-process for networks that lack some of their parameters.'''
+
+import numpy as np
+import pytest
+
+from grid_executor import GridExecutor
+from ode_parameter_tests import ParameterTesting
+
+
+def test_neg_fb_grid_in_process_below_eight_steps(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    p_test = ParameterTesting(steps=3, lf=30)
+    grid = p_test.neg_fb_grid()
+
+    with pytest.warns(UserWarning, match="k_lat_on_species"):
+        executor = p_test.execute(grid, num_samples=20, seed=1)
+
+    assert executor.capacity.shape == (len(grid),)
+    assert np.all(np.isfinite(executor.capacity))
+    assert 'k_lat_on_species' not in executor.names
+    assert (tmp_path / "parameter_grid.npz").exists()
+
+
+def test_explicit_grid_keeps_strict_check():
+    executor = GridExecutor(steps=3, num_samples=5, seed=1)
+    with pytest.raises(ValueError, match="k_lat_on_species"):
+        executor.run([{'k_lat_on_species': 1e-5}])
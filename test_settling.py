@@ -0,0 +1,37 @@
+'''Integration stopped at settling against the full integration to run_time.'''
+
+import numpy as np
+import pytest
+
+from pysb_t_cell_network import PysbTcrSelfWithForeign
+from toy_model import ToyModel
+
+
+def settled_and_full(model, tolerance, run_time=None, num_samples=4):
+    observables = model.build_network()
+    if run_time is not None:
+        model.tspan = np.linspace(0, run_time, 51)
+    ligands = np.array(model.p_ligand[:num_samples], dtype=float)
+    full, settling_time = model.solve_samples(ligands, observables)
+    settled, settling_time = model.solve_samples(ligands, observables, settling_tolerance=tolerance)
+    return settled, full, settling_time
+
+
+@pytest.mark.parametrize('tolerance', [1e-4, 1e-5, 1e-6])
+def test_toy_model_outputs_match_full_integration(tolerance):
+    settled, full, settling_time = settled_and_full(ToyModel(seed=1), tolerance)
+    np.testing.assert_allclose(settled, full, rtol=tolerance)
+
+
+@pytest.mark.parametrize('steps, run_time', [(3, None), (8, 1e5)])
+@pytest.mark.parametrize('tolerance', [1e-3, 1e-4, 1e-5])
+def test_tcr_outputs_match_full_integration(steps, run_time, tolerance):
+    settled, full, settling_time = settled_and_full(PysbTcrSelfWithForeign(steps=steps, seed=1), tolerance,
+                                                    run_time=run_time)
+    np.testing.assert_allclose(settled[:, -1], full[:, -1], rtol=tolerance)
+
+
+def test_tcr_settles_before_run_time():
+    settled, full, settling_time = settled_and_full(PysbTcrSelfWithForeign(steps=3, seed=1), 1e-4)
+    assert np.all(np.isfinite(settling_time))
+    assert np.all(settling_time < 100)
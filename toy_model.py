@@ -1,10 +1,14 @@
 import argparse
 
 import numpy as np
-from pysb import *
-from pysb.integrate import odesolve
 
+from ligand_sampler import LigandSampler, SAMPLING_METHODS
+from model_builder import ModelBuilder
+from network_cache import cached_network, solver_settings
+from ode_simulator import OdeSimulator, parallel_sweep
 from pysb_t_cell_network import write_model_attributes
+from reduced_simulator import ReducedOdeSimulator
+from steady_state import SteadyStateSolver
 
 parameters = {'kp': 0.1, 'koff': 0.05, 'koffs': 0.05, 'kon': 0.0022, 'kons': 0.1, 'kf': 0.2,
               'R': 30000.0, 'lfT': 10.0, 'M': 15, 'St': 10000.0}
@@ -20,11 +24,12 @@ class NewBindingParameters(object):
         self.k_off = 0.5
 
 
-class ToyModel(object):
-    def __init__(self, ks_multiplier=5.0, self_foreign=False):
+class ToyModel(ModelBuilder):
+    def __init__(self, ks_multiplier=5.0, self_foreign=False, seed=None, sampling='random'):
+        self.init_kwargs = dict(ks_multiplier=ks_multiplier, self_foreign=self_foreign)
 
         self.steps = 4
-        self.model = Model()
+        self.model = self.new_model()
         self.self_foreign = self_foreign
         self.ks_multiplier = ks_multiplier
 
@@ -40,51 +45,47 @@ class ToyModel(object):
         self.run_time = 10000
         self.tspan = np.linspace(0, self.run_time)
 
-        self.p_ligand = [int(i) for i in np.round(np.random.lognormal(self.mu, self.sigma, self.num_samples))]
+        self.seed = np.random.randint(2 ** 31 - 1) if seed is None else seed
+        sampler = LigandSampler(self.mu, self.sigma, method=sampling, seed=self.seed)
+        self.p_ligand, self.weights = sampler.sample(self.num_samples)
+
+        self.network = None
+        self.simulator = None
+        self.simulator_settings = None
 
     def define_monomers(self):
-        Monomer('R')
-        Monomer('Ls')
-        Monomer('Lf')
-        Monomer('S')
+        self.add_monomer('R')
+        self.add_monomer('Ls')
+        self.add_monomer('Lf')
+        self.add_monomer('S')
 
-        Parameter('R_0', parameters['R'])
+        self.add_parameter('R_0', parameters['R'])
         self.add_observable('R')
 
-        Parameter('Ls_0', 30)
-        Parameter('Lf_0', parameters['lfT'])
-        Parameter('S_0', parameters['St'])
-
-        Initial(R(), R_0)
-        Initial(Ls(), Ls_0)
-        Initial(Lf(), Lf_0)
-        Initial(S(), S_0)
+        self.add_parameter('Ls_0', 30)
+        self.add_parameter('Lf_0', parameters['lfT'])
+        self.add_parameter('S_0', parameters['St'])
 
-    def add_new_monomer(self, product):
-        try:
-            self.model.monomers[product]
-        except:
-            Monomer(product)
-            Initial(eval(product + "()"), Parameter(product + "_0", 0))
-
-    def add_observable(self, species):
-        Observable("O_{0}".format(species), eval('{0}()'.format(species)))
+        self.add_initial('R', 'R_0')
+        self.add_initial('Ls', 'Ls_0')
+        self.add_initial('Lf', 'Lf_0')
+        self.add_initial('S', 'S_0')
 
     def define_rates(self):
-        Parameter('k_L_on', parameters['kon'])
-        Parameter('k_Lf_off', parameters['kf'])
-        Parameter('k_Ls_off', self.ks_multiplier * parameters['kf'])
-        Parameter('kp', parameters['kp'])
-        Parameter('koff', parameters['koff'])
-        Parameter('kons', parameters['kons'])
-        Parameter('koffs', parameters['koffs'])
+        self.add_parameter('k_L_on', parameters['kon'])
+        self.add_parameter('k_Lf_off', parameters['kf'])
+        self.add_parameter('k_Ls_off', self.ks_multiplier * parameters['kf'])
+        self.add_parameter('kp', parameters['kp'])
+        self.add_parameter('koff', parameters['koff'])
+        self.add_parameter('kons', parameters['kons'])
+        self.add_parameter('koffs', parameters['koffs'])
 
     def add_step_0(self, i):
         product = "R{0}".format(i)
         self.add_new_monomer(product)
 
-        Rule('{0}_bind'.format(product), R() + eval('{0}()'.format(i)) | eval('{0}()'.format(product)),
-             k_L_on, eval('k_{0}_off'.format(i)))
+        self.add_rule('{0}_bind'.format(product), self.pattern('R') + self.pattern(i) | self.pattern(product),
+                      'k_L_on', 'k_{0}_off'.format(i))
 
         self.add_observable(i)
         self.add_observable(product)
@@ -102,37 +103,38 @@ class ToyModel(object):
     def add_cycle(self, i, previous_product, product):
         self.add_new_monomer(product)
 
-        Rule('{0}_bind'.format(product), eval('{0}()'.format(previous_product)) >> eval('{0}()'.format(product)),
-             kp)
+        self.add_rule('{0}_bind'.format(product), self.pattern(previous_product) >> self.pattern(product),
+                      'kp')
         self.add_observable(product)
 
-        Rule('{0}_return'.format(product), eval('{0}()'.format(product)) >> R() + eval('{0}()'.format(i)),
-             eval('k_{0}_off'.format(i)))
+        self.add_rule('{0}_return'.format(product), self.pattern(product) >> self.pattern('R') + self.pattern(i),
+                      'k_{0}_off'.format(i))
 
     def add_ligand_dissociation_step(self, i):
         previous_product = self.add_phosphorylation_steps(i)
         product = "RP{0}".format(self.steps + 1)
         self.add_new_monomer(product)
 
-        Rule('{0}_unbind'.format(previous_product),
-             eval('{0}()'.format(previous_product)) >> eval('{0}()'.format(product)) + eval('{0}()'.format(i)), kp)
+        self.add_rule('{0}_unbind'.format(previous_product),
+                      self.pattern(previous_product) >> self.pattern(product) + self.pattern(i), 'kp')
         return product
 
     def add_catalysis_step(self, product):
         self.add_new_monomer('{0}S'.format(product))
 
-        Rule('{0}_bind'.format(product), eval('{0}()'.format(product)) + eval('S()') | eval('{0}S()'.format(product)),
-             kons, koffs)
+        self.add_rule('{0}_bind'.format(product),
+                      self.pattern(product) + self.pattern('S') | self.pattern('{0}S'.format(product)),
+                      'kons', 'koffs')
 
         self.add_new_monomer('SP')
-        Rule('{0}_catalysis'.format(product),
-             eval('{0}S()'.format(product)) >> eval('{0}()'.format(product)) + eval('SP()'), kp)
+        self.add_rule('{0}_catalysis'.format(product),
+                      self.pattern('{0}S'.format(product)) >> self.pattern(product) + self.pattern('SP'), 'kp')
 
         self.add_observable('SP')
 
-        Rule('{0}_dissociate'.format('SP'), eval('SP()') >> eval('S()'), koff)
+        self.add_rule('{0}_dissociate'.format('SP'), self.pattern('SP') >> self.pattern('S'), 'koff')
 
-        Rule('{0}_dissociate'.format(product), eval('{0}()'.format(product)) >> eval('R()'), koff)
+        self.add_rule('{0}_dissociate'.format(product), self.pattern(product) >> self.pattern('R'), 'koff')
 
     # def cycle_1(self, i):
     #     previous_product = self.add_step_0(i)
@@ -154,13 +156,13 @@ class ToyModel(object):
     #
     #     self.add_new_monomer(product)
     #
-    #     Rule('{0}_{1}_bind'.format(product, i),
-    #          eval('{0}()'.format(previous_product)) >> eval('{0}()'.format(product)) + eval('{0}()'.format(i)), kp)
+    #     self.add_rule('{0}_{1}_bind'.format(product, i),
+    #                   self.pattern(previous_product) >> self.pattern(product) + self.pattern(i), 'kp')
     #
     #     if i == "Ls":
     #         self.add_observable(product)
-    #         Rule('{0}_return'.format(product), eval('{0}()'.format(product)) >> R(),
-    #              eval('k_off'))
+    #         self.add_rule('{0}_return'.format(product), self.pattern(product) >> self.pattern('R'),
+    #                       'k_off')
     #
     #     return product
 
@@ -186,26 +188,88 @@ class ToyModel(object):
         # if "O_{0}".format(product) not in observables:
         #     observables.append("O_{0}".format(product))
 
-    def main(self):
+    def build_network(self):
+        self.network = cached_network(self)
+        return self.network['outputs']
+
+    def build_simulator(self, reduced=False, batched=False):
+        '''reduced integrates with the conservation laws eliminated (ReducedOdeSimulator); the solver settings stored by
+        solver_selection.py for batched or one-at-a-time runs are applied.'''
+        simulator_class = ReducedOdeSimulator if reduced else OdeSimulator
+        settings = solver_settings(self, batched)
+        if type(self.simulator) is not simulator_class or self.simulator.model is not self.model or \
+                self.simulator_settings != settings:
+            self.simulator = simulator_class(self.model, network=self.network, **settings)
+            self.simulator_settings = settings
+        return self.simulator
+
+    def solve_samples(self, ligands, observables=None, steady_state=False, settling_tolerance=None,
+                      settling_window=None, reduced=False):
+        simulator = self.build_simulator(reduced, batched=True)
+
+        if steady_state:
+            y = SteadyStateSolver(simulator).solve(initials={'Ls_0': ligands})
+        else:
+            y = simulator.run(self.tspan, initials={'Ls_0': ligands}, settling_tolerance=settling_tolerance,
+                              settling_window=settling_window)
+
+        columns = ['O_SP', 'O_Ls', 'O_R']
+        if self.self_foreign:
+            columns.append('O_Lf')
+
+        return np.column_stack([y.observable(name)[:, -1] for name in columns]), y.settling_time
+
+    def main_batch(self, steady_state=False, workers=1, settling_tolerance=None, settling_window=None,
+                   reduced=False):
+        ligand_array = np.array(self.p_ligand, dtype=float)
+        options = dict(steady_state=steady_state, settling_tolerance=settling_tolerance,
+                       settling_window=settling_window, reduced=reduced)
+
+        if workers > 1:
+            y, settling_time = parallel_sweep(self, ligand_array, workers, **options)
+        else:
+            y, settling_time = self.solve_samples(ligand_array, **options)
+
+        np.savetxt("Ligand_concentrations", ligand_array, fmt='%f')
+        np.savetxt("output", y[:, 0], fmt='%f')
+        np.savetxt("ls_ss", y[:, 1], fmt='%f')
+        np.savetxt("lf_ss", y[:, 3] if self.self_foreign else [], fmt='%f')
+        np.savetxt("r_ss", y[:, 2], fmt='%f')
+        if settling_tolerance is not None:
+            np.savetxt("settling_time", settling_time, fmt='%f')
+
+    def main(self, steady_state=False, workers=1, settling_tolerance=None, settling_window=None, reduced=False):
         output_array = []
         ligand_array = []
         ls_ss_array = []
         r_ss_array = []
         lf_ss_array = []
+        settling_time = []
 
-        self.make_model()
+        self.build_network()
 
-        write_model_attributes(self.model.rules, "rules")
-        write_model_attributes(self.model.parameters, "parameters")
-        write_model_attributes(self.model.observables, "observables")
+        write_model_attributes(self.network['rules'], "rules")
+        write_model_attributes(self.network['model_parameters'], "parameters")
+        write_model_attributes(self.network['model_observables'], "observables")
 
         np.savetxt("time", self.tspan, fmt='%f')
+        np.savetxt("seed", [self.seed], fmt='%d')
+        np.savetxt("ligand_weights", self.weights, fmt='%e')
+
+        if steady_state or workers > 1:
+            self.main_batch(steady_state=steady_state, workers=workers, settling_tolerance=settling_tolerance,
+                            settling_window=settling_window, reduced=reduced)
+            return
+
+        simulator = self.build_simulator(reduced)
 
         for ligand in self.p_ligand:
-            self.model.parameters['Ls_0'].value = ligand
             ligand_array.append(ligand)
 
-            y = odesolve(self.model, self.tspan, compiler="python")
+            result = simulator.run(self.tspan, initials={'Ls_0': ligand}, settling_tolerance=settling_tolerance,
+                                   settling_window=settling_window)
+            y = result.sample(0)
+            settling_time.append(result.settling_time[0])
 
             output = y['O_SP']
             ls_ss = y['O_Ls']
@@ -224,6 +288,8 @@ class ToyModel(object):
         np.savetxt("ls_ss", ls_ss_array, fmt='%f')
         np.savetxt("lf_ss", lf_ss_array, fmt='%f')
         np.savetxt("r_ss", r_ss_array, fmt='%f')
+        if settling_tolerance is not None:
+            np.savetxt("settling_time", settling_time, fmt='%f')
 
 
 if __name__ == "__main__":
@@ -232,12 +298,27 @@ if __name__ == "__main__":
                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument('--lf', dest='lf', action='store_true', default=False,
                         help="Flag to submit self w/ foreign sims.")
+    parser.add_argument('--steady_state', '--steady-state', dest='steady_state', action='store_true', default=False,
+                        help='Solve for the steady state directly instead of integrating to run_time.')
+    parser.add_argument('--workers', dest='workers', action='store', type=int, default=1,
+                        help='Number of processes the ligand samples are split across.')
+    parser.add_argument('--seed', dest='seed', action='store', type=int, help='Seed for the ligand samples.')
+    parser.add_argument('--sampling', dest='sampling', action='store', default='random', choices=SAMPLING_METHODS,
+                        help='Design of the lognormal ligand samples; weights are written to ligand_weights.')
+    parser.add_argument('--reduced', dest='reduced', action='store_true', default=False,
+                        help='Integrate with the conservation laws eliminated.')
+    parser.add_argument('--settling_tolerance', dest='settling_tolerance', action='store', type=float,
+                        help='Stop integrating once max_i |dy_i/dt| / |y_i| times the time left to run_time stays '
+                             'below this for --settling_window.')
+    parser.add_argument('--settling_window', dest='settling_window', action='store', type=float,
+                        help='Time the settling test must hold (default: five output intervals).')
     args = parser.parse_args()
 
     if args.lf:
-        tcr = ToyModel(self_foreign=True)
+        tcr = ToyModel(self_foreign=True, seed=args.seed, sampling=args.sampling)
 
     else:
-        tcr = ToyModel()
+        tcr = ToyModel(seed=args.seed, sampling=args.sampling)
 
-    tcr.main()
+    tcr.main(steady_state=args.steady_state, workers=args.workers, settling_tolerance=args.settling_tolerance,
+             settling_window=args.settling_window, reduced=args.reduced)
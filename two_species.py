@@ -6,6 +6,7 @@ import subprocess
 
 import numpy as np
 
+from ligand_sampler import LigandSampler, SAMPLING_METHODS
 from simulation_parameters import DefineRegion
 
 
@@ -125,7 +126,8 @@ class SelfWithForeign(object):
 
         self.mu = 6
         self.sigma = 1.0
-        self.p_ligand = [int(i) for i in np.round(np.random.lognormal(self.mu, self.sigma, self.num_samples))]
+        sampler = LigandSampler(self.mu, self.sigma, method=getattr(self.arguments, 'sampling', 'random'))
+        self.p_ligand, self.weights = sampler.sample(self.num_samples)
 
         self.output = ["C", "D"]
 
@@ -225,6 +227,7 @@ class ForeignLigand(object):
         self.sigma = 0.5
 
         self.p_ligand = [int(i) for i in np.round(np.random.normal(self.mu, self.sigma, self.num_samples))]
+        self.weights = np.full(self.num_samples, 1.0 / self.num_samples)
 
     def change_ligand_concentration(self, concentration):
         self.n_initial["Lf"] = concentration
@@ -258,7 +261,8 @@ class SelfLigand(object):
         self.mu = 6
         self.sigma = 1.0
 
-        self.p_ligand = [int(i) for i in np.round(np.random.lognormal(self.mu, self.sigma, self.num_samples))]
+        sampler = LigandSampler(self.mu, self.sigma, method=getattr(self.arguments, 'sampling', 'random'))
+        self.p_ligand, self.weights = sampler.sample(self.num_samples)
 
     def change_ligand_concentration(self, concentration):
         self.n_initial["Ls"] = concentration
@@ -461,6 +465,7 @@ class KPSingleSpecies(object):
 
         np.savetxt("Ligand_concentrations", sample, fmt='%f')
         np.savetxt("Ligand_concentrations_sorted", np.sort(sample), fmt='%f')
+        np.savetxt("ligand_weights", self.ligand.weights, fmt='%e')
 
 
 if __name__ == "__main__":
@@ -472,6 +477,8 @@ if __name__ == "__main__":
                         help="flag for testing.")
     parser.add_argument('--ss', action='store_true', default=False,
                         help="flag for checking if sims approach steady-state.")
+    parser.add_argument('--sampling', dest='sampling', action='store', default='random', choices=SAMPLING_METHODS,
+                        help='Design of the lognormal ligand samples; weights are written to ligand_weights.')
     args = parser.parse_args()
 
     two_species = TwoSpecies()